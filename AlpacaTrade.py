@@ -1,20 +1,63 @@
+import asyncio
+import concurrent.futures
 import datetime
+import threading
+from time import monotonic, time as now
 
-import alpaca_trade_api as tradeapi
+from BarCache import PAGE_SIZE, BarCache
+from Metrics import METRICS
+from PortfolioBook import PortfolioBook
 
-from local_settings import url, public_key, secret_key
+# Static vars
+BAR_CACHE = BarCache()
+ORDER_RATE = 3  # Most orders submitted a second (Alpaca allows 200 requests a minute)
+ORDER_CONCURRENCY = 16  # Orders checked and submitted at once by submit_orders
 
 
 class AlpacaTrade:
+    # One long lived client is shared by every call so its HTTP session keeps its
+    # connections alive, and account snapshots are reused for ACCOUNT_TTL seconds.
+    # Orders are checked against the local book instead of the account.
+    ACCOUNT_TTL = 5
+    api = None
+    account = None
+    account_time = 0
+    book = PortfolioBook()
+    lock = threading.Lock()
+
     @staticmethod
+    def __client__():
+        """
+        Purpose: Returns the shared REST client, creating it on first use
+        """
+        with AlpacaTrade.lock:
+            if AlpacaTrade.api is None:
+                # Only a live client needs the broker SDK and credentials, so
+                # anything that sets api itself (like a Replay) runs without them
+                import alpaca_trade_api as tradeapi
+                from local_settings import url, public_key, secret_key
+
+                # Every endpoint's latency is timed while metrics are enabled
+                client = tradeapi.REST(public_key, secret_key, url)
+                AlpacaTrade.api = METRICS.instrument(client, "alpaca")
+            return AlpacaTrade.api
+
+    @staticmethod
+    @METRICS.timed("AlpacaTrade.authenticate")
     def __authenticate__():
         try:
-            api = tradeapi.REST(public_key, secret_key, url)
+            api = AlpacaTrade.__client__()
             if not api:
                 print("Request could not be completed: authentication invalid")
                 raise Exception
 
-            account = api.get_account()
+            with AlpacaTrade.lock:
+                age = monotonic() - AlpacaTrade.account_time
+                if AlpacaTrade.account is None or age >= AlpacaTrade.ACCOUNT_TTL:
+                    AlpacaTrade.account = api.get_account()
+                    AlpacaTrade.account_time = monotonic()
+                account = AlpacaTrade.account
+
             if not account:
                 print("Request could not be completed: error retrieving account")
                 raise Exception
@@ -24,73 +67,78 @@ class AlpacaTrade:
 
             return api, account
         except:
+            AlpacaTrade.invalidate_account()
             print("Authentication Failed")
             raise Exception
 
     @staticmethod
-    def __check_buy__(api, account, symbol, shares, price):
+    def invalidate_account():
+        """
+        Purpose: Forces the next call to fetch a fresh account snapshot (used after
+            orders are submitted since they change equity and buying power)
+        """
+        AlpacaTrade.account = None
+
+    @staticmethod
+    def __book__(api):
+        """
+        Purpose: Returns the local book, reconciling it with the broker first if it
+            has not been loaded or is older than its reconcile interval
+        """
+        return AlpacaTrade.book.ensure(api)
+
+    @staticmethod
+    def reconcile():
+        """
+        Purpose: Reloads the local book from the broker now
+        """
+        AlpacaTrade.book.reconcile(AlpacaTrade.__client__())
+
+    @staticmethod
+    def __check_buy__(book, symbol, shares, price):
         """
         Purpose: Checks whether there are sufficient funds to buy at input price
+            and holds them for the order
+        Returns: The book's hold id or None if the check failed
         """
-        if account.trading_blocked:
+        if book.trading_blocked:
             print("Account is currently restricted from trading")
-            return False
-        if account.equity < shares * price:
+            return None
+        hold = book.hold(symbol, shares, price, buy=True)
+        if hold is None:
             print(
                 f"Insufficient funds for transaction.",
-                f"Your accout currently has ${account.equity} vs ${shares * price}",
+                f"Your accout currently has ${book.available_cash()} vs ${shares * price}",
             )
-            return False
-
-        return True
+        return hold
 
     @staticmethod
-    def __check_sell__(api, account, symbol, shares, price):
+    def __check_sell__(book, symbol, shares):
         """
-        Purpose: Checks whether there are sufficient shares to sell
+        Purpose: Checks whether there are sufficient shares to sell and holds them
+            for the order
+        Returns: The book's hold id or None if the check failed
         """
-        if account.trading_blocked:
+        if book.trading_blocked:
             print("Account is currently restricted from trading")
-            return False
-        if api.get_position(symbol):
+            return None
+        hold = book.hold(symbol, shares, None, buy=False)
+        if hold is None:
             print(
                 f"Insufficient shares to complete transaction.",
-                f"({api.get_position(symbol)} vs {shares}",
+                f"({book.available_shares(symbol)} vs {shares})",
             )
-            return False
-
-        return True
+        return hold
 
     @staticmethod
-    def market_order(symbol, shares, buy=True):
-        api, account = AlpacaTrade.__authenticate__()
-        if (
-            buy and not AlpacaTrade.__check_buy__(api, account, symbol, shares, price)
-        ) or (
-            not buy
-            and not AlpacaTrade.__check_sell__(api, account, symbol, shares, price)
-        ):
-            print(
-                f"The {'buy' if buy else 'sell'} limit could not be set for {shares} shares of {symbol} at {price} per share"
-            )
-            return False
-
-        else:
-            api.submit_order(
-                symbol=symbol,
-                qty=shares,
-                side="buy" if buy else "sell",
-                type="limit",
-                time_in_force=time,
-                limit_price=price,
-            )
-            return True
-        # Check if the market is open
-
-        # Check we have enough money to buy
-        # Buy stock
-        # Get confirmation we bought
-        pass
+    def market_order(symbol, shares, buy=True, time="day"):
+        """
+        Purpose: Checks and submits a market order
+        Returns: Whether the order was submitted
+        """
+        api = AlpacaTrade.__client__()
+        order = {"symbol": symbol, "shares": shares, "buy": buy, "time": time}
+        return AlpacaTrade.__place_order__(api, order) is not None
 
     @staticmethod
     def sell(symbol, shares):
@@ -104,28 +152,199 @@ class AlpacaTrade:
 
     @staticmethod
     def trade_limit(symbol, shares, price, buy=True, time="day"):
-        api, account = AlpacaTrade.__authenticate__()
-        if (
-            buy and not AlpacaTrade.__check_buy__(api, account, symbol, shares, price)
-        ) or (
-            not buy
-            and not AlpacaTrade.__check_sell__(api, account, symbol, shares, price)
-        ):
-            print(
-                f"The {'buy' if buy else 'sell'} limit could not be set for {shares} shares of {symbol} at {price} per share"
-            )
-            return False
+        api = AlpacaTrade.__client__()
+        order = {
+            "symbol": symbol,
+            "shares": shares,
+            "price": price,
+            "buy": buy,
+            "time": time,
+        }
+        return AlpacaTrade.__place_order__(api, order) is not None
 
-        else:
-            api.submit_order(
-                symbol=symbol,
-                qty=shares,
-                side="buy" if buy else "sell",
-                type="limit",
-                time_in_force=time,
-                limit_price=price,
-            )
-            return True
+    @staticmethod
+    def __describe_order__(order):
+        """
+        Purpose: Describes an order for the messages printed when it fails
+        """
+        side = "buy" if order.get("buy", True) else "sell"
+        if order.get("price") is None:
+            return f"The {side} order could not be placed for {order['shares']} shares of {order['symbol']}"
+        return f"The {side} limit could not be set for {order['shares']} shares of {order['symbol']} at {order['price']} per share"
+
+    @staticmethod
+    def __order_args__(order):
+        """
+        Purpose: Turns an order dictionary into the arguments of api.submit_order
+        """
+        args = {
+            "symbol": order["symbol"],
+            "qty": order["shares"],
+            "side": "buy" if order.get("buy", True) else "sell",
+            "type": "market" if order.get("price") is None else "limit",
+            "time_in_force": order.get("time", "day"),
+        }
+        if order.get("price") is not None:
+            args["limit_price"] = order["price"]
+        return args
+
+    @staticmethod
+    def __needs_quote__(order):
+        """
+        Purpose: Whether an order's check has to look up a price (market buys)
+        """
+        return order.get("buy", True) and order.get("price") is None
+
+    @staticmethod
+    def __check_order__(book, order):
+        """
+        Purpose: Runs the pre-trade check for one order against the local book.
+            Market buys are checked at the latest minute close since they have no
+            price of their own.
+        Returns: The book's hold id or None if the check failed
+        """
+        symbol, shares = order["symbol"], order["shares"]
+        if not order.get("buy", True):
+            return AlpacaTrade.__check_sell__(book, symbol, shares)
+
+        price = order.get("price")
+        if price is None:
+            price = AlpacaTrade.get_historical_data(
+                symbol, limit=1, time_between="minute", to_return={"c"}
+            )[-1]
+        return AlpacaTrade.__check_buy__(book, symbol, shares, price)
+
+    @staticmethod
+    def __submit__(api, book, hold, order):
+        """
+        Purpose: Submits a checked order and records it in the book, giving its
+            hold back if the broker refused it
+        """
+        try:
+            response = api.submit_order(**AlpacaTrade.__order_args__(order))
+        except BaseException:
+            book.release(hold)
+            raise
+        book.submitted(hold, response)
+        AlpacaTrade.invalidate_account()
+        return response
+
+    @staticmethod
+    def __place_order__(api, order):
+        """
+        Purpose: Checks and submits one order
+        Returns: What api.submit_order returned or None if the check failed
+        """
+        book = AlpacaTrade.__book__(api)
+        hold = AlpacaTrade.__check_order__(book, order)
+        if hold is None:
+            print(AlpacaTrade.__describe_order__(order))
+            return None
+        return AlpacaTrade.__submit__(api, book, hold, order)
+
+    @staticmethod
+    async def submit_orders(orders, rate=ORDER_RATE, concurrency=ORDER_CONCURRENCY):
+        """
+        Purpose: Checks and submits a batch of orders concurrently. The checks
+            and round trips of up to `concurrency` orders overlap while the
+            submissions themselves are spaced out to at most `rate` a second.
+        Inputs:
+            - orders*: a list of order dictionaries with
+                symbol* - the stock ticker symbol
+                shares* - how many shares to trade
+                buy - True to buy and False to sell (default True)
+                price - the limit price, left out or None for a market order
+                time - the time in force (default "day")
+            - rate: The most orders submitted per second (default ORDER_RATE)
+            - concurrency: How many orders are checked or submitted at once
+                (default ORDER_CONCURRENCY)
+        Returns: An async generator of confirmation dictionaries, yielded as each
+            order finishes rather than in the order given
+            order - the order dictionary
+            submitted - whether the order was sent to the broker
+            response - what api.submit_order returned (None if not submitted)
+            error - why the order was not submitted (None if it was)
+        """
+        loop = asyncio.get_running_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+        semaphore = asyncio.Semaphore(concurrency)
+        next_slot = loop.time()
+
+        async def throttle():
+            # Hands out submission times 1 / rate seconds apart
+            nonlocal next_slot
+            now = loop.time()
+            slot = max(now, next_slot)
+            next_slot = slot + 1 / rate
+            await asyncio.sleep(slot - now)
+
+        async def place(order, api, book):
+            confirmation = {
+                "order": order,
+                "submitted": False,
+                "response": None,
+                "error": None,
+            }
+            async with semaphore:
+                hold = None
+                # Once __submit__ is running it owns the hold, since its thread
+                # carries on (and may place the order) even if this is cancelled
+                dispatched = False
+                try:
+                    # Only market buys leave memory, to look up a price
+                    if AlpacaTrade.__needs_quote__(order):
+                        hold = await loop.run_in_executor(
+                            executor, AlpacaTrade.__check_order__, book, order
+                        )
+                    else:
+                        hold = AlpacaTrade.__check_order__(book, order)
+                    if hold is None:
+                        confirmation["error"] = AlpacaTrade.__describe_order__(order)
+                        return confirmation
+
+                    await throttle()
+                    dispatched = True
+                    confirmation["response"] = await loop.run_in_executor(
+                        executor, AlpacaTrade.__submit__, api, book, hold, order
+                    )
+                    confirmation["submitted"] = True
+                except Exception as error:
+                    confirmation["error"] = repr(error)
+                finally:
+                    # Failed or cancelled before it reached the broker
+                    if hold is not None and not dispatched:
+                        book.release(hold)
+            return confirmation
+
+        try:
+            api = AlpacaTrade.__client__()
+            book = await loop.run_in_executor(executor, AlpacaTrade.__book__, api)
+            tasks = [asyncio.ensure_future(place(o, api, book)) for o in orders]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    yield await task
+            finally:
+                for task in tasks:
+                    task.cancel()
+        finally:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def submit_batch(orders, rate=ORDER_RATE, concurrency=ORDER_CONCURRENCY):
+        """
+        Purpose: Runs submit_orders to the end from code that is not async
+        Returns: A list of the confirmations in the order they arrived
+        """
+
+        async def collect():
+            return [
+                confirmation
+                async for confirmation in AlpacaTrade.submit_orders(
+                    orders, rate, concurrency
+                )
+            ]
+
+        return asyncio.run(collect())
 
     @staticmethod
     def get_account():
@@ -140,7 +359,12 @@ class AlpacaTrade:
 
     @staticmethod
     def get_historical_data(
-        symbol, limit=100, time_between="day", to_return={"c", "h", "l", "o" "t", "v"}
+        symbol,
+        limit=100,
+        time_between="day",
+        to_return={"c", "h", "l", "o", "t", "v"},
+        use_cache=True,
+        as_series=False,
     ):
         """
         Purpose: Gets the historical data for an input stock symbol
@@ -156,33 +380,120 @@ class AlpacaTrade:
                 o - open
                 t - Date
                 v - ?
+            - use_cache: Whether to go through the local bar cache (default True).
+                Cached bars are served without a network call and otherwise only
+                the bars newer than the cache are fetched.
+            - as_series: Return every column as a BarSeries instead of building a
+                list from to_return (default False)
         Returns: The price categories specified in the "to_return" variable over the
             specified range
         """
-        assert type(symbol) == str
+        _, prices = next(
+            AlpacaTrade.get_historical_data_many(
+                [symbol], limit, time_between, to_return, use_cache, as_series
+            )
+        )
+        return prices
+
+    @staticmethod
+    def get_historical_data_many(
+        symbols,
+        limit=100,
+        time_between="day",
+        to_return={"c", "h", "l", "o", "t", "v"},
+        use_cache=True,
+        as_series=False,
+    ):
+        """
+        Purpose: Gets the historical data for many stock symbols at once. Symbols
+            are requested MAX_SYMBOLS at a time so a whole universe only takes a
+            few requests.
+        Inputs:
+            - symbols*: a list of stock ticker symbols to obtain the data for
+            - the rest are the same as get_historical_data
+        Returns: A generator of (symbol, prices) pairs, streamed as each batch
+            arrives, where prices is what get_historical_data returns for the
+            symbol. Pass it to dict() to collect every symbol.
+        """
         assert type(limit) == int
         assert type(time_between) == str
         assert type(to_return) == set
 
-        api, account = AlpacaTrade.__authenticate__()
-        if not api or not account:
-            return None
-
-        prices = api.get_barset(symbol, time_between, limit=limit)[symbol]._raw
+        missing = []
+        hits = 0
+        for symbol in symbols:
+            assert type(symbol) == str
+            bars = BAR_CACHE.fresh(symbol, time_between, limit) if use_cache else None
+            if bars is None:
+                missing.append(symbol)
+            else:
+                hits += 1
+                yield symbol, AlpacaTrade.__format_bars__(bars, to_return, as_series)
 
-        for price in prices:
-            price["t"] = datetime.datetime.fromtimestamp(price["t"])
+        METRICS.count("AlpacaTrade.cache_hits", hits)
+        METRICS.count("AlpacaTrade.cache_misses", len(missing))
+        if not missing:
+            return
 
-        if len(to_return) == 1:
-            to_return = to_return.pop()
-            prices = [price[to_return] for price in prices]
+        api, _ = AlpacaTrade.__authenticate__()
+        if use_cache:
+            fetched = BAR_CACHE.refresh_many(api, missing, time_between, limit)
         else:
-            to_remove = {"c", "h", "l", "o", "t", "v"}
-            for item in to_return:
-                to_remove.remove(item)
+            fetched = BarCache.fetch(api, missing, time_between, limit)
+        for symbol, bars in fetched:
+            yield symbol, AlpacaTrade.__format_bars__(bars, to_return, as_series)
 
-            for price in prices:
-                for item in to_remove:
-                    price.remove(item)
+    @staticmethod
+    def stream_historical_data(
+        symbol, start, end=None, time_between="minute", page_size=PAGE_SIZE
+    ):
+        """
+        Purpose: Streams every bar of a stock symbol between two times, page by
+            page, for spans far longer than one request can return
+        Inputs:
+            - symbol*: the stock ticker symbol to obtain the data for
+            - start*: the datetime or epoch seconds to get bars after
+            - end: the datetime or epoch seconds to get bars up to (default now)
+            - time_between: The time frame of each datapoint (default "minute")
+            - page_size: The most bars requested at once (default PAGE_SIZE)
+        Returns: A generator of BarSeries blocks in time order. Only one block is
+            held at a time, so they can be fed straight to a BarStore or a
+            strategy engine without the whole span ever being in memory.
+        """
+        for _, bars in AlpacaTrade.stream_historical_data_many(
+            [symbol], start, end, time_between, page_size
+        ):
+            yield bars
 
-        return prices
+    @staticmethod
+    def stream_historical_data_many(
+        symbols, start, end=None, time_between="minute", page_size=PAGE_SIZE
+    ):
+        """
+        Purpose: Same as stream_historical_data for many symbols, MAX_SYMBOLS of
+            them per request
+        Returns: A generator of (symbol, BarSeries) blocks, in time order for each
+            symbol
+        """
+        assert type(time_between) == str
+        start, end = (
+            int(t.timestamp()) if isinstance(t, datetime.datetime) else int(t)
+            for t in (start, now() if end is None else end)
+        )
+
+        api, _ = AlpacaTrade.__authenticate__()
+        yield from BarCache.fetch_range(
+            api, list(symbols), time_between, start, end, page_size
+        )
+
+    @staticmethod
+    def __format_bars__(bars, to_return, as_series=False):
+        """
+        Purpose: Turns a BarSeries into what get_historical_data returns
+        """
+        if as_series:
+            return bars
+        if len(to_return) == 1:
+            column = next(iter(to_return))
+            return bars.datetimes if column == "t" else bars[column].tolist()
+        return bars.to_dicts(to_return)
@@ -0,0 +1,264 @@
+import datetime
+import os
+import pathlib
+import threading
+import time
+
+import numpy as np
+
+from BarSeries import COLUMNS, BarSeries
+
+MAX_SYMBOLS = 200  # Most symbols a single get_barset request accepts
+PAGE_SIZE = 1000  # Most bars per symbol a single get_barset request returns
+# How long fetched bars stay current before asking the API for newer ones
+BAR_SECONDS = {
+    "minute": 60,
+    "1Min": 60,
+    "5Min": 5 * 60,
+    "15Min": 15 * 60,
+    "day": 24 * 60 * 60,
+    "1D": 24 * 60 * 60,
+}
+
+
+class BarCache:
+    """
+    Purpose: Keeps historical bars on disk, one columnar .npz file per symbol and
+        time frame, so repeat requests skip the network and later requests only
+        fetch the bars from the last cached one on (which may have still been
+        forming when it was cached)
+    """
+
+    def __init__(self, directory="cache", max_bytes=256 * 1024 * 1024):
+        """
+        Inputs:
+            - directory: Where the cache files are kept
+            - max_bytes: The most disk space the cache may use before the least
+                recently used files are evicted
+        """
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        # The size of every file, found by the first save and then kept up to date
+        # so saves only scan the directory when the cache is over max_bytes
+        self.total_bytes = None
+        # Orders are checked from several threads at once, and they all share one
+        # temporary file name and size count
+        self.lock = threading.Lock()
+
+    def path(self, symbol, time_between):
+        return self.directory / f"{symbol}_{time_between}.npz"
+
+    def load(self, symbol, time_between):
+        """
+        Purpose: Reads the cached bars for a symbol
+        Returns: The BarSeries and the epoch time it was fetched at, or
+            (None, None) if nothing is cached
+        """
+        path = self.path(symbol, time_between)
+        try:
+            with np.load(path) as stored:
+                bars = BarSeries(*(stored[column] for column in COLUMNS))
+                fetched = float(stored["fetched"])
+            # Mark the file as recently used for eviction
+            os.utime(path)
+        except (FileNotFoundError, KeyError, ValueError):
+            return None, None
+        return bars, fetched
+
+    def save(self, symbol, time_between, bars):
+        """
+        Purpose: Writes the bars for a symbol and then evicts old files if the cache
+            has grown past max_bytes
+        """
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, size, _ in self.__files__())
+            path = self.path(symbol, time_between)
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+
+            temp_path = path.with_suffix(f".{os.getpid()}.tmp.npz")
+            np.savez(temp_path, fetched=time.time(), **bars.columns())
+            self.total_bytes += temp_path.stat().st_size - replaced
+            os.replace(temp_path, path)
+            if self.total_bytes > self.max_bytes:
+                self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """
+        Purpose: Removes the least recently used files until the cache fits in
+            max_bytes
+        Inputs:
+            - keep: A file that should never be removed (the one just written)
+        """
+        files = self.__files__()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+    def __files__(self):
+        """
+        Purpose: Lists the (modified time, size, path) of every cache file
+        """
+        files = []
+        for path in self.directory.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def fresh(self, symbol, time_between, limit):
+        """
+        Purpose: Serves a request from the cache without any network call
+        Returns: The last `limit` cached bars if there are enough of them, the last
+            one had closed when it was fetched and no newer bar can have closed
+            since, otherwise None
+        """
+        bars, fetched = self.load(symbol, time_between)
+        if bars is None or len(bars) < limit or len(bars) == 0:
+            return None
+        # A bar stamped t covers [t, t + step)
+        step = BAR_SECONDS.get(time_between, 60)
+        last = int(bars.t[-1])
+        if fetched < last + step or time.time() >= last + 2 * step:
+            return None
+        return bars[-limit:]
+
+    def refresh(self, api, symbol, time_between, limit):
+        """
+        Purpose: Brings the cache for a symbol up to date and returns its bars.
+            Only the bars from the last cached timestamp on are fetched unless the
+            cache holds fewer than `limit` bars.
+        Inputs:
+            - api: A tradeapi.REST client (or anything with the same get_barset)
+            - symbol: the stock ticker symbol to obtain the data for
+            - time_between: The time frame of each datapoint
+            - limit: The amount of bars to return
+        Returns: A BarSeries of the last `limit` bars
+        """
+        _, bars = next(self.refresh_many(api, [symbol], time_between, limit))
+        return bars
+
+    def refresh_many(self, api, symbols, time_between, limit):
+        """
+        Purpose: Same as refresh for many symbols, fetched MAX_SYMBOLS at a time.
+            Symbols that need a full history and symbols that only need their newest
+            bars are requested in separate batches.
+        Returns: A generator of (symbol, bars) pairs in the order they were fetched
+        """
+        cached = {symbol: self.load(symbol, time_between)[0] for symbol in symbols}
+        full = [s for s in symbols if cached[s] is None or len(cached[s]) < limit]
+        newest = [s for s in symbols if s not in full]
+
+        for group, incremental in ((full, False), (newest, True)):
+            for start in range(0, len(group), MAX_SYMBOLS):
+                batch = group[start : start + MAX_SYMBOLS]
+                after = None
+                if incremental:
+                    # One request covers every symbol from the oldest last bar on.
+                    # after is exclusive, so the last bar itself is fetched again
+                    # in case it was still forming when it was cached.
+                    last = min(int(cached[symbol].t[-1]) for symbol in batch)
+                    after = BarCache.__isoformat__(last - 1)
+
+                for symbol, new_bars in BarCache.fetch(
+                    api, batch, time_between, limit, after
+                ):
+                    bars = BarCache.merge(cached[symbol], new_bars, limit)
+                    self.save(symbol, time_between, bars)
+                    yield symbol, bars[-limit:]
+
+    @staticmethod
+    def fetch(api, symbols, time_between, limit, after=None):
+        """
+        Purpose: Requests bars for a list of symbols with as few get_barset calls as
+            possible (MAX_SYMBOLS symbols per call)
+        Returns: A generator of (symbol, bars) pairs
+        """
+        for start in range(0, len(symbols), MAX_SYMBOLS):
+            batch = list(symbols[start : start + MAX_SYMBOLS])
+            if after is None:
+                barset = api.get_barset(batch, time_between, limit=limit)
+            else:
+                barset = api.get_barset(batch, time_between, limit=limit, after=after)
+            for symbol in batch:
+                yield symbol, BarSeries.from_raw(barset[symbol]._raw)
+
+    @staticmethod
+    def fetch_range(api, symbols, time_between, start, end, page_size=PAGE_SIZE):
+        """
+        Purpose: Pages through every bar between two times, holding no more than
+            one page per symbol in memory however long the span is. Each request
+            covers a window short enough that it can not hold more than page_size
+            bars, so no page is ever cut off by the limit.
+        Inputs:
+            - api: A tradeapi.REST client (or anything with the same get_barset)
+            - symbols: The stock ticker symbols, fetched MAX_SYMBOLS at a time
+            - time_between: The time frame of each datapoint
+            - start, end: The epoch seconds to get bars after and up to
+            - page_size: The most bars per symbol in a request, at least 2 since
+                every window asks for one bar past its end
+        Returns: A generator of (symbol, bars) blocks in time order for each batch
+            of symbols, skipping windows without bars
+        """
+        assert page_size > 1
+        step = BAR_SECONDS.get(time_between, 60)
+        span = (page_size - 1) * step
+        for first in range(0, len(symbols), MAX_SYMBOLS):
+            batch = list(symbols[first : first + MAX_SYMBOLS])
+            cursor = start
+            while cursor < end:
+                until = min(cursor + span, end)
+                # Ask for one bar more so the edge is covered whether or not the
+                # API counts `until` as part of the window
+                barset = api.get_barset(
+                    batch,
+                    time_between,
+                    limit=page_size,
+                    after=BarCache.__isoformat__(cursor),
+                    until=BarCache.__isoformat__(until + step),
+                )
+                for symbol in batch:
+                    bars = BarSeries.from_raw(barset[symbol]._raw)
+                    bars = bars[(bars.t > cursor) & (bars.t <= until)]
+                    if len(bars):
+                        yield symbol, bars
+                cursor = until
+
+    @staticmethod
+    def __isoformat__(t):
+        return datetime.datetime.fromtimestamp(t, datetime.timezone.utc).isoformat()
+
+    @staticmethod
+    def merge(bars, new_bars, limit):
+        """
+        Purpose: Adds newly fetched bars to cached ones. The fetched bars cover
+            everything from their first timestamp on, so they replace the cached
+            bars from there, including any bar that was cached while forming.
+        Inputs:
+            - bars: The cached bars (or None)
+            - new_bars: The bars that were just fetched
+            - limit: The amount of bars that was requested. A full page may have
+                skipped bars so it replaces the cache instead of extending it.
+        """
+        if bars is None or len(new_bars) >= limit:
+            return new_bars
+        if len(new_bars) == 0:
+            return bars
+
+        older = bars.t < new_bars.t[0]
+        return BarSeries.concatenate((bars[older], new_bars))
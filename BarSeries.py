@@ -0,0 +1,104 @@
+import datetime
+
+import numpy as np
+
+COLUMNS = ("t", "o", "h", "l", "c", "v")
+
+
+class BarSeries:
+    """
+    Purpose: Holds the bars of one symbol as contiguous typed columns, int64 epoch
+        seconds in t and float64 o, h, l, c and v, instead of a dictionary per bar.
+        Columns and slices are returned without copying and datetimes are only
+        built when they are asked for.
+    """
+
+    def __init__(self, t=(), o=(), h=(), l=(), c=(), v=()):
+        self.t = np.ascontiguousarray(t, dtype=np.int64)
+        self.o = np.ascontiguousarray(o, dtype=np.float64)
+        self.h = np.ascontiguousarray(h, dtype=np.float64)
+        self.l = np.ascontiguousarray(l, dtype=np.float64)
+        self.c = np.ascontiguousarray(c, dtype=np.float64)
+        self.v = np.ascontiguousarray(v, dtype=np.float64)
+        assert all(len(getattr(self, column)) == len(self.t) for column in COLUMNS)
+        self._datetimes = None
+
+    @staticmethod
+    def from_raw(raw_bars):
+        """
+        Purpose: Converts the raw bar dictionaries of a barset into a BarSeries
+        """
+        count = len(raw_bars)
+        return BarSeries(
+            *(
+                np.fromiter(
+                    (bar[column] for bar in raw_bars),
+                    np.int64 if column == "t" else np.float64,
+                    count,
+                )
+                for column in COLUMNS
+            )
+        )
+
+    @staticmethod
+    def concatenate(series):
+        """
+        Purpose: Joins a list of BarSeries end to end
+        """
+        return BarSeries(
+            *(np.concatenate([s[column] for s in series]) for column in COLUMNS)
+        )
+
+    def __len__(self):
+        return len(self.t)
+
+    def __getitem__(self, key):
+        """
+        Purpose: series["c"] returns a column, anything else (a slice, mask or index
+            array) selects bars and returns a new BarSeries. Slices are views.
+        """
+        if isinstance(key, str):
+            if key not in COLUMNS:
+                raise KeyError(key)
+            return getattr(self, key)
+        return BarSeries(*(getattr(self, column)[key] for column in COLUMNS))
+
+    def __repr__(self):
+        return f"BarSeries({len(self)} bars)"
+
+    def columns(self):
+        """
+        Purpose: Returns the columns as a dictionary of arrays (no copies)
+        """
+        return {column: getattr(self, column) for column in COLUMNS}
+
+    @property
+    def datetimes(self):
+        """
+        Purpose: The bar times as datetime.datetime objects, built on first use
+        """
+        if self._datetimes is None:
+            self._datetimes = [
+                datetime.datetime.fromtimestamp(t) for t in self.t.tolist()
+            ]
+        return self._datetimes
+
+    def to_numpy(self, columns=("o", "h", "l", "c", "v")):
+        """
+        Purpose: Returns the price columns as one float64 array of shape
+            (bars, columns), or the column itself when only one is asked for
+        """
+        if isinstance(columns, str):
+            return self[columns]
+        return np.column_stack([self[column] for column in columns])
+
+    def to_dicts(self, to_return=COLUMNS):
+        """
+        Purpose: Returns a dictionary per bar with the columns in to_return, with t
+            as a datetime, the way get_historical_data used to build them
+        """
+        columns = {
+            column: self.datetimes if column == "t" else self[column].tolist()
+            for column in to_return
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
@@ -0,0 +1,115 @@
+import pathlib
+
+import numpy as np
+
+from BarSeries import COLUMNS, BarSeries
+
+# The little endian type every column is stored as
+COLUMN_TYPES = {
+    column: np.dtype("<i8" if column == "t" else "<f8") for column in COLUMNS
+}
+
+
+class BarStore:
+    """
+    Purpose: Keeps bars as a partitioned columnar dataset on disk,
+        {directory}/{symbol}/{time_between}/{column}.bin, where each file is the
+        raw little endian values of one column. New bars are appended to the end
+        of the files and reads memory-map them straight into a BarSeries, so
+        nothing is parsed or copied until the values are used.
+    """
+
+    def __init__(self, directory="data"):
+        """
+        Inputs:
+            - directory: Where the dataset is kept
+        """
+        self.directory = pathlib.Path(directory)
+
+    def path(self, symbol, time_between, column):
+        return self.directory / symbol / time_between / f"{column}.bin"
+
+    def symbols(self, time_between="day"):
+        """
+        Purpose: Lists the symbols with bars stored for a time frame
+        """
+        return sorted(
+            path.parent.parent.name
+            for path in self.directory.glob(f"*/{time_between}/t.bin")
+        )
+
+    def length(self, symbol, time_between="day"):
+        """
+        Purpose: The number of complete bars stored for a symbol. An append that
+            was cut short leaves some columns longer, so the shortest one counts.
+        """
+        lengths = []
+        for column in COLUMNS:
+            try:
+                size = self.path(symbol, time_between, column).stat().st_size
+            except FileNotFoundError:
+                return 0
+            lengths.append(size // COLUMN_TYPES[column].itemsize)
+        return min(lengths)
+
+    def read(self, symbol, time_between="day", start=None, end=None):
+        """
+        Purpose: Memory-maps the bars of a symbol without reading them
+        Inputs:
+            - symbol: the stock ticker symbol
+            - time_between: The time frame of the bars (default "day")
+            - start, end: Only return bars with start <= t < end (epoch seconds)
+        Returns: A read only BarSeries whose columns are views of the files, empty
+            if nothing is stored
+        """
+        count = self.length(symbol, time_between)
+        if count == 0:
+            return BarSeries()
+
+        bars = BarSeries(
+            *(
+                np.memmap(
+                    self.path(symbol, time_between, column),
+                    dtype=COLUMN_TYPES[column],
+                    mode="r",
+                    shape=(count,),
+                )
+                for column in COLUMNS
+            )
+        )
+        if start is None and end is None:
+            return bars
+        first = 0 if start is None else np.searchsorted(bars.t, start, "left")
+        last = count if end is None else np.searchsorted(bars.t, end, "left")
+        return bars[first:last]
+
+    def append(self, symbol, time_between, bars):
+        """
+        Purpose: Writes bars to the end of a symbol's files. Stored bars from the
+            first new bar's time on are replaced, so a bar that was stored while it
+            was still forming is overwritten by the final one.
+        Inputs:
+            - symbol: the stock ticker symbol
+            - time_between: The time frame of the bars
+            - bars: A BarSeries in time order
+        Returns: The number of bars written
+        """
+        if len(bars) == 0:
+            return 0
+        count = self.length(symbol, time_between)
+        if count:
+            stored = self.read(symbol, time_between).t
+            count = int(np.searchsorted(stored, bars.t[0], "left"))
+            # Let go of the memory map before its files are cut
+            del stored
+
+        folder = self.directory / symbol / time_between
+        folder.mkdir(parents=True, exist_ok=True)
+        for column in COLUMNS:
+            path = self.path(symbol, time_between, column)
+            dtype = COLUMN_TYPES[column]
+            with open(path, "ab") as out_file:
+                # Also drops the tail of an earlier append that was cut short
+                out_file.truncate(count * dtype.itemsize)
+                out_file.write(np.ascontiguousarray(bars[column], dtype).tobytes())
+        return len(bars)
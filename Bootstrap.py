@@ -0,0 +1,145 @@
+import concurrent.futures
+
+import numpy as np
+
+from TradingAlgorithms import TradingAlgorithms
+
+# Static vars
+WORKERS = 1  # Processes the windows are spread over (1 runs them in this process)
+BOOTSTRAP_CHUNK = 2**22  # Most window bars evaluated in one piece of work
+PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+
+class Bootstrap:
+    """
+    Purpose: Stress tests a strategy's settings by running it over many random
+        windows of one price history. The bands are built once over the whole
+        history and every window is scored from them in bulk.
+    """
+
+    @staticmethod
+    def run(
+        strategy,
+        prices,
+        count=100000,
+        min_range=1,
+        seed=0,
+        workers=WORKERS,
+        days=5,
+        percent_diff=5,
+        short=False,
+    ):
+        """
+        Purpose: Runs a strategy over `count` random windows of the prices and
+            describes how the results are spread
+        Inputs:
+            - strategy: BollingerBands, SimpleMovingAverage or MeanReversion
+            - prices: a list or NumPy array of prices to pick the windows from
+            - count: How many windows to run
+            - min_range: The fewest prices in a window
+            - seed: Seeds the windows so a run can be repeated
+            - workers: How many processes to spread the windows over
+            - days, percent_diff, short: The settings passed to the strategy
+                (SimpleMovingAverage ignores percent_diff)
+        Returns: A dictionary with the number of windows and the summarize output
+            for the profit and return percentage of every window
+        """
+        starts, ends = TradingAlgorithms.random_day_ranges(
+            len(prices), count, min_range, seed
+        )
+        profit, return_percentage = Bootstrap.evaluate(
+            strategy, prices, starts, ends, days, percent_diff, short, workers
+        )
+        return {
+            "windows": count,
+            "profit": Bootstrap.summarize(profit),
+            "return_percentage": Bootstrap.summarize(return_percentage),
+        }
+
+    @staticmethod
+    def evaluate(
+        strategy,
+        prices,
+        starts,
+        ends,
+        days=5,
+        percent_diff=5,
+        short=False,
+        workers=WORKERS,
+    ):
+        """
+        Purpose: Finds what a strategy's simulate would return on each
+            prices[start:end] without slicing the prices
+        Inputs:
+            - strategy: BollingerBands, SimpleMovingAverage or MeanReversion
+            - prices: a list or NumPy array of prices
+            - starts, ends: Arrays with the start and end of each window
+            - days, percent_diff, short: The settings passed to the strategy
+            - workers: How many processes to spread the windows over
+        Returns: float64 arrays of the profit and return percentage of each window
+        """
+        prices, classes = strategy.__signals__(prices, days, percent_diff)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        # Split the windows into pieces of about BOOTSTRAP_CHUNK bars each
+        bars = np.cumsum(np.maximum(ends - starts, 0))
+        total = bars[-1] if len(bars) else 0
+        pieces = max(int(total // BOOTSTRAP_CHUNK) + 1, workers)
+        cuts = np.searchsorted(bars, np.linspace(0, total, pieces + 1)[1:-1])
+        cuts = np.unique(np.concatenate(([0], cuts, [len(starts)])))
+        jobs = [
+            (prices, classes, starts[a:b], ends[a:b], days, short)
+            for a, b in zip(cuts[:-1], cuts[1:])
+        ]
+
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                results = list(pool.map(Bootstrap.__evaluate_piece__, *zip(*jobs)))
+        else:
+            results = [Bootstrap.__evaluate_piece__(*job) for job in jobs]
+
+        if not results:
+            return np.zeros(0), np.zeros(0)
+        profit, return_percentage = zip(*results)
+        return np.concatenate(profit), np.concatenate(return_percentage)
+
+    @staticmethod
+    def __evaluate_piece__(prices, classes, starts, ends, days, short):
+        """
+        Purpose: Scores one piece of the windows (in a worker process if there are
+            several) from the bar classes of the whole price history
+        """
+        # A window's first `days` bars only fill its moving average
+        segments = np.column_stack((starts + days, ends))
+        profit, first_buy, _, _, _ = TradingAlgorithms.__run_signal_grid__(
+            prices, classes[None], short, segments=segments
+        )
+        profit, first_buy = profit[0], first_buy[0]
+
+        bought = ~np.isnan(first_buy) & (first_buy != 0)
+        return_percentage = np.zeros(len(profit))
+        np.divide(100 * profit, first_buy, out=return_percentage, where=bought)
+        return profit, return_percentage
+
+    @staticmethod
+    def summarize(values):
+        """
+        Purpose: Describes the spread of a set of results
+        Returns: A dictionary of the mean, standard deviation, min, max, the
+            PERCENTILES and the share of results that lost money
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return {}
+
+        summary = {
+            "mean": float(values.mean()),
+            "std": float(values.std()),
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "loss_rate": float((values < 0).mean()),
+        }
+        for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            summary[f"p{percentile}"] = float(value)
+        return summary
@@ -0,0 +1,187 @@
+import datetime
+import itertools
+import random
+import threading
+import time
+import types
+
+from BarCache import BAR_SECONDS
+
+
+class FakeBars:
+    """
+    Purpose: Stands in for the Bars entry of a barset (only _raw is used)
+    """
+
+    def __init__(self, raw):
+        self._raw = raw
+
+
+class FakeREST:
+    """
+    Purpose: A local stand in for tradeapi.REST so the data and trading code can
+        be run offline. Prices are seeded random walks, one per symbol, and every
+        call is recorded in `calls` so callers can check what hit the "network".
+        Orders fill at once at the symbol's quote (set with `quote`, otherwise the
+        latest close) when they are marketable and rest otherwise.
+    """
+
+    def __init__(
+        self,
+        seed=0,
+        history=10000,
+        now=1_600_000_000,
+        equity=100000.0,
+        latency=0,
+        positions=None,
+    ):
+        """
+        Inputs:
+            - seed: Seeds the random walk of every symbol
+            - history: How many bars each symbol has before `now`
+            - now: The epoch time of the latest bar
+            - equity: The starting equity of the fake account
+            - latency: Seconds every call sleeps for, like a network round trip
+            - positions: A dictionary of symbol -> shares already held
+        """
+        self.seed = seed
+        self.history = history
+        self.now = now
+        self.latency = latency
+        self.calls = []
+        self.positions = dict(positions or {})
+        self.quotes = {}
+        self.orders = []
+        self.order_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.account = types.SimpleNamespace(
+            trading_blocked=False, equity=equity, buying_power=equity, cash=equity
+        )
+
+    def __call__(self, *call):
+        """
+        Purpose: Records a call and waits out the fake round trip
+        """
+        self.calls.append(call)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def advance(self, seconds):
+        """
+        Purpose: Moves the fake market clock forward so newer bars appear
+        """
+        self.now += seconds
+
+    def quote(self, symbol, price):
+        """
+        Purpose: Sets the price orders for a symbol fill at, like a market replay
+        """
+        self.quotes[symbol] = price
+
+    def bars(self, symbol, time_between="day"):
+        """
+        Purpose: Returns every raw bar of a symbol up to the fake clock
+        """
+        step = BAR_SECONDS.get(time_between, 60)
+        rng = random.Random(f"{self.seed}-{symbol}-{time_between}")
+        count = self.history + (self.now - 1_600_000_000) // step
+        price = rng.uniform(10, 500)
+
+        raw = []
+        for i in range(count):
+            open_price = price
+            price = max(0.01, price * (1 + rng.gauss(0, 0.02)))
+            raw.append(
+                {
+                    "t": self.now - (count - 1 - i) * step,
+                    "o": round(open_price, 2),
+                    "h": round(max(open_price, price) * 1.005, 2),
+                    "l": round(min(open_price, price) * 0.995, 2),
+                    "c": round(price, 2),
+                    "v": rng.randint(1000, 100000),
+                }
+            )
+        return raw
+
+    def get_barset(
+        self, symbols, timeframe, limit=None, after=None, until=None, **kwargs
+    ):
+        self("get_barset", symbols, timeframe, limit, after)
+        if isinstance(symbols, str):
+            symbols = symbols.split(",")
+
+        barset = {}
+        for symbol in symbols:
+            raw = self.bars(symbol, timeframe)
+            if after is not None:
+                after_t = datetime.datetime.fromisoformat(after).timestamp()
+                raw = [bar for bar in raw if bar["t"] > after_t]
+            if until is not None:
+                until_t = datetime.datetime.fromisoformat(until).timestamp()
+                raw = [bar for bar in raw if bar["t"] < until_t]
+            barset[symbol] = FakeBars(raw[-limit:] if limit else raw)
+        return barset
+
+    def get_account(self):
+        self("get_account")
+        return self.account
+
+    def get_position(self, symbol):
+        self("get_position", symbol)
+        with self.lock:
+            if not self.positions.get(symbol):
+                raise LookupError(f"position does not exist: {symbol}")
+            return types.SimpleNamespace(symbol=symbol, qty=self.positions[symbol])
+
+    def list_positions(self):
+        self("list_positions")
+        with self.lock:
+            return [
+                types.SimpleNamespace(symbol=symbol, qty=qty)
+                for symbol, qty in self.positions.items()
+                if qty
+            ]
+
+    def list_orders(self, status="open", **kwargs):
+        self("list_orders", status)
+        with self.lock:
+            if status == "all":
+                return list(self.orders)
+            closed = status == "closed"
+            return [
+                order for order in self.orders if (order.status == "filled") == closed
+            ]
+
+    def submit_order(
+        self, symbol, qty, side, type, time_in_force, limit_price=None, **kwargs
+    ):
+        self("submit_order", symbol, qty, side, type, time_in_force, limit_price)
+        price = self.quotes.get(symbol)
+        if price is None:
+            price = self.bars(symbol)[-1]["c"]
+        buy = side == "buy"
+        marketable = type == "market" or (
+            limit_price >= price if buy else limit_price <= price
+        )
+
+        with self.lock:
+            order = types.SimpleNamespace(
+                id=str(next(self.order_ids)),
+                symbol=symbol,
+                qty=qty,
+                side=side,
+                type=type,
+                time_in_force=time_in_force,
+                limit_price=limit_price,
+                status="filled" if marketable else "new",
+                filled_qty=qty if marketable else 0,
+                filled_avg_price=price if marketable else None,
+            )
+            self.orders.append(order)
+            if marketable:
+                # Trading at the market price moves cash but leaves equity alone
+                signed = qty if buy else -qty
+                self.positions[symbol] = self.positions.get(symbol, 0) + signed
+                self.account.cash -= signed * price
+                self.account.buying_power = self.account.cash
+        return order
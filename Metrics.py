@@ -0,0 +1,244 @@
+import bisect
+import contextlib
+import json
+import threading
+import time
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = [
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    float("inf"),
+]
+NULL_TIMER = contextlib.nullcontext()
+# The totals every timer keeps besides its histogram
+TIMER_FIELDS = ("count", "errors", "seconds", "min", "max", "items")
+
+
+class Metrics:
+    """
+    Purpose: Collects timers, counters and per key stage timings for the hot
+        paths. Every timer keeps a latency histogram over BUCKETS and the number
+        of items it handled, for throughput. While disabled every hook returns
+        straight away, so leaving them in place costs nothing measurable.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        """
+        Purpose: Forgets everything recorded so far
+        """
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.stages = {}
+
+    def timer(self, name, key=None, items=0):
+        """
+        Purpose: Times a with block under `name`
+        Inputs:
+            - name: The timer to add the time to
+            - key: (optional) Also records the time as stage `name` of this key,
+                like a ticker
+            - items: How many items (bars, orders) the block handled
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, key, items)
+
+    def timed(self, name):
+        """
+        Purpose: Decorator that times every call of a function under `name`
+        """
+
+        def decorator(function):
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Timer(self, name):
+                    return function(*args, **kwargs)
+
+            wrapper.__name__ = function.__name__
+            wrapper.__doc__ = function.__doc__
+            return wrapper
+
+        return decorator
+
+    def record(self, name, seconds, key=None, items=0, error=False):
+        """
+        Purpose: Adds one timing to a timer (and to a key's stages if given)
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "seconds": 0.0,
+                    "min": seconds,
+                    "max": seconds,
+                    "items": 0,
+                    "buckets": [0] * len(BUCKETS),
+                }
+            timer["count"] += 1
+            timer["errors"] += error
+            timer["seconds"] += seconds
+            timer["min"] = min(timer["min"], seconds)
+            timer["max"] = max(timer["max"], seconds)
+            timer["items"] += items
+            timer["buckets"][bisect.bisect_left(BUCKETS, seconds)] += 1
+            if key is not None:
+                stages = self.stages.setdefault(str(key), {})
+                stages[name] = stages.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        """
+        Purpose: Adds to a counter
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """
+        Purpose: Returns everything recorded as plain dictionaries, with the mean
+            and items per second of every timer and its histogram keyed by bucket
+        """
+        with self.lock:
+            timers = {}
+            for name, timer in sorted(self.timers.items()):
+                timers[name] = dict(timer)
+                timers[name]["mean"] = timer["seconds"] / timer["count"]
+                timers[name]["items_per_second"] = (
+                    timer["items"] / timer["seconds"] if timer["seconds"] else 0
+                )
+                timers[name]["buckets"] = {
+                    f"le_{bound}": count
+                    for bound, count in zip(BUCKETS, timer["buckets"])
+                    if count
+                }
+            return {
+                "timers": timers,
+                "counters": dict(sorted(self.counters.items())),
+                "stages": {key: dict(stages) for key, stages in self.stages.items()},
+            }
+
+    def merge(self, snapshot):
+        """
+        Purpose: Adds a snapshot taken in another process (a pool worker) to this
+            one
+        """
+        with self.lock:
+            for name, other in snapshot["timers"].items():
+                buckets = [
+                    other["buckets"].get(f"le_{bound}", 0) for bound in BUCKETS
+                ]
+                timer = self.timers.get(name)
+                if timer is None:
+                    timer = self.timers[name] = {
+                        key: other[key] for key in TIMER_FIELDS
+                    }
+                    timer["buckets"] = buckets
+                    continue
+                for key in ("count", "errors", "seconds", "items"):
+                    timer[key] += other[key]
+                timer["min"] = min(timer["min"], other["min"])
+                timer["max"] = max(timer["max"], other["max"])
+                timer["buckets"] = [a + b for a, b in zip(timer["buckets"], buckets)]
+            for name, amount in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for key, other in snapshot["stages"].items():
+                stages = self.stages.setdefault(key, {})
+                for name, seconds in other.items():
+                    stages[name] = stages.get(name, 0.0) + seconds
+
+    def export(self, file_name="metrics.json"):
+        """
+        Purpose: Writes the snapshot to a json file
+        """
+        with open(file_name, "w") as out_file:
+            json.dump(self.snapshot(), out_file, indent=2)
+
+    def instrument(self, target, prefix):
+        """
+        Purpose: Wraps an object, like the REST client, so every method call is
+            timed under "{prefix}.{method}" while metrics are enabled
+        """
+        return Instrumented(target, prefix, self)
+
+
+class Timer:
+    """
+    Purpose: The context manager Metrics.timer returns while enabled
+    """
+
+    def __init__(self, metrics, name, key=None, items=0):
+        self.metrics = metrics
+        self.name = name
+        self.key = key
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        seconds = time.perf_counter() - self.start
+        self.metrics.record(
+            self.name, seconds, self.key, self.items, error_type is not None
+        )
+        return False
+
+
+class Instrumented:
+    """
+    Purpose: Passes every attribute through to the wrapped object, timing method
+        calls while metrics are enabled
+    """
+
+    def __init__(self, target, prefix, metrics):
+        self.__dict__.update(_target=target, _prefix=prefix, _metrics=metrics)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not self._metrics.enabled or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with Timer(self._metrics, f"{self._prefix}.{name}"):
+                return attribute(*args, **kwargs)
+
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __bool__(self):
+        return bool(self._target)
+
+
+METRICS = Metrics()
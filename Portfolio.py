@@ -0,0 +1,142 @@
+import numpy as np
+
+from TradingAlgorithms import (
+    ACTIONS,
+    BUY,
+    COVER,
+    FLAT,
+    HOLD,
+    NEXT_STATE,
+    NO_ACTION,
+    SELL,
+    SELL_SIDE,
+    SHORT_SELL,
+)
+
+
+class Portfolio:
+    """
+    Purpose: Backtests a strategy over a whole universe of tickers that share one
+        pot of capital. The bands of every ticker are worked out in a single array
+        computation over the (tickers x bars) price matrix, and the positions of
+        every ticker then step through time together so each bar's entries can
+        be limited to the cash that is actually free.
+    """
+
+    @staticmethod
+    def backtest(
+        strategy,
+        prices,
+        capital=100000.0,
+        position_size=None,
+        days=5,
+        percent_diff=5,
+        short=False,
+    ):
+        """
+        Purpose: Runs a strategy on every row of a price matrix with shared capital
+        Inputs:
+            - strategy: BollingerBands, SimpleMovingAverage or MeanReversion
+            - prices: A (tickers, bars) array of aligned prices with no gaps
+            - capital: The cash the portfolio starts with
+            - position_size: The cash put into each position (default an equal
+                share of the capital per ticker). Shorts set the same amount
+                aside. An entry that there is not enough free cash for is skipped,
+                tickers earlier in the matrix going first on the same bar.
+            - days, percent_diff, short: The settings passed to the strategy
+                (SimpleMovingAverage ignores percent_diff)
+        Returns: A dictionary with
+            - asset_pnl: The profit of each ticker's closed trades
+            - open_pnl: The profit of each ticker's open position at the last bar
+            - trades: The number of closed trades of each ticker
+            - skipped: How many entries of each ticker were skipped for cash
+            - equity: The value of the portfolio after every bar
+            - pnl: The total profit of the portfolio
+            - return_percentage: The total profit as a percentage of the capital
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        assert prices.ndim == 2 and np.isfinite(prices).all() and days > 0
+        tickers, bars = prices.shape
+        if position_size is None:
+            position_size = capital / max(tickers, 1)
+
+        # Every ticker's bands at once, with the rows laid end to end. A row's first
+        # `days` bars would average over the row before it so they only warm up.
+        trade_prices, classes = strategy.__signals__(
+            prices.ravel(), days, percent_diff
+        )
+        trade_prices = trade_prices.reshape(tickers, bars)
+        classes = classes.reshape(tickers, bars)
+        classes[:, :days] = HOLD
+
+        next_state, actions = NEXT_STATE, ACTIONS
+        if not short:
+            next_state, actions = next_state.copy(), actions.copy()
+            next_state[SELL_SIDE, FLAT] = FLAT
+            actions[SELL_SIDE, FLAT] = NO_ACTION
+
+        # Time major so each bar's column is contiguous
+        columns = np.ascontiguousarray(trade_prices.T)
+        bar_classes = np.ascontiguousarray(classes.T)
+
+        state = np.full(tickers, FLAT, dtype=np.int8)
+        shares = np.zeros(tickers)
+        entry = np.zeros(tickers)
+        asset_pnl = np.zeros(tickers)
+        trades = np.zeros(tickers, dtype=np.int64)
+        skipped = np.zeros(tickers, dtype=np.int64)
+        equity = np.zeros(bars)
+        cash = float(capital)
+        # The positions are worth exposure @ price + reserved, with exposure the
+        # signed shares and reserved the cash set aside for shorts plus their
+        # entry value (a short is worth 2 * entry - price per share)
+        exposure = np.zeros(tickers)
+        reserved = 0.0
+
+        # Like simulate, the final bar is only advice and is never traded
+        for bar in range(bars - 1):
+            price = columns[bar]
+            action = actions[bar_classes[bar], state]
+            acting = np.flatnonzero(action)
+            if len(acting):
+                acts = action[acting]
+
+                # Closes free their cash before the bar's entries are paid for
+                closed = acting[(acts == SELL) | (acts == COVER)]
+                profit = exposure[closed] * (price[closed] - entry[closed])
+                asset_pnl[closed] += profit
+                cash += (shares[closed] * entry[closed] + profit).sum()
+                reserved -= 2 * position_size * (exposure[closed] < 0).sum()
+                trades[closed] += 1
+                shares[closed] = exposure[closed] = 0
+
+                entering = acting[(acts == BUY) | (acts == SHORT_SELL)]
+                affordable = min(len(entering), int(cash // position_size))
+                blocked = entering[affordable:]
+                entering = entering[:affordable]
+                shares[entering] = position_size / price[entering]
+                entry[entering] = price[entering]
+                sides = np.where(action[entering] == BUY, 1, -1)
+                exposure[entering] = sides * shares[entering]
+                reserved += 2 * position_size * (sides < 0).sum()
+                cash -= position_size * len(entering)
+                skipped[blocked] += 1
+
+                state = next_state[bar_classes[bar], state]
+                state[blocked] = FLAT
+            equity[bar] = cash + reserved + exposure @ price
+        if bars:
+            equity[-1] = cash + reserved + exposure @ columns[-1]
+
+        last = columns[-1] if bars else np.zeros(tickers)
+        open_pnl = exposure * (last - entry)
+        pnl = equity[-1] - capital if bars else 0.0
+        return {
+            "asset_pnl": asset_pnl,
+            "open_pnl": open_pnl,
+            "trades": trades,
+            "skipped": skipped,
+            "equity": equity,
+            "pnl": pnl,
+            "return_percentage": 100 * pnl / capital if capital else 0,
+        }
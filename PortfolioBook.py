@@ -0,0 +1,185 @@
+import itertools
+import threading
+from time import monotonic
+
+RECONCILE_SECONDS = 60  # How long the book is trusted before it is reloaded
+
+
+class PortfolioBook:
+    """
+    Purpose: Keeps the account's positions, cash, equity and buying power in
+        memory so pre-trade checks do not need the network. Checks hold the cash
+        or shares an order needs until it fills or is released, submitted orders
+        and their fills update the book, and it is reconciled with the broker
+        every RECONCILE_SECONDS.
+    """
+
+    def __init__(self, reconcile_seconds=RECONCILE_SECONDS):
+        """
+        Inputs:
+            - reconcile_seconds: How long the book is trusted before the next
+                reconcile reloads it from the broker
+        """
+        self.reconcile_seconds = reconcile_seconds
+        self.positions = {}
+        self.cash = 0.0
+        self.equity = 0.0
+        self.buying_power = 0.0
+        self.trading_blocked = False
+        self.loaded_time = None
+
+        # Hold id -> [symbol, shares, price, buy, order id once submitted]
+        self.holds = {}
+        self.held_cash = 0.0
+        self.held_shares = {}
+        self.hold_ids = itertools.count(1)
+
+        self.lock = threading.Lock()
+        self.reconcile_lock = threading.Lock()
+
+    def due(self):
+        """
+        Purpose: Whether the book has never been loaded or is older than
+            reconcile_seconds
+        """
+        return (
+            self.loaded_time is None
+            or monotonic() - self.loaded_time >= self.reconcile_seconds
+        )
+
+    def ensure(self, api):
+        """
+        Purpose: Reconciles the book if it is due, with only one thread going to
+            the broker when many ask at once
+        """
+        if self.due():
+            with self.reconcile_lock:
+                if self.due():
+                    self.reconcile(api)
+        return self
+
+    def reconcile(self, api):
+        """
+        Purpose: Replaces the book with the broker's account and positions. The
+            broker's buying power already counts its open buys, but a position's
+            qty still includes the shares its open sells are offering, so the
+            holds of submitted sells are rebuilt from the broker's open orders.
+            Holds of orders that have not been submitted yet are kept.
+        """
+        account = api.get_account()
+        positions = {
+            position.symbol: float(position.qty) for position in api.list_positions()
+        }
+        open_sells = [
+            order for order in api.list_orders(status="open") if order.side == "sell"
+        ]
+
+        with self.lock:
+            self.positions = positions
+            self.cash = float(account.cash)
+            self.equity = float(account.equity)
+            self.buying_power = float(account.buying_power)
+            self.trading_blocked = bool(account.trading_blocked)
+            for hold_id, hold in list(self.holds.items()):
+                if hold[4] is not None:
+                    self.__drop__(hold_id)
+            for order in open_sells:
+                shares = float(order.qty) - float(order.filled_qty or 0)
+                price = float(order.limit_price or 0)
+                hold_id = next(self.hold_ids)
+                self.holds[hold_id] = [order.symbol, shares, price, False, order.id]
+                held = self.held_shares.get(order.symbol, 0)
+                self.held_shares[order.symbol] = held + shares
+            self.loaded_time = monotonic()
+
+    def available_cash(self):
+        """
+        Purpose: The buying power left over after every held buy
+        """
+        return self.buying_power - self.held_cash
+
+    def available_shares(self, symbol):
+        """
+        Purpose: The shares of a symbol left over after every held sell
+        """
+        return self.positions.get(symbol, 0) - self.held_shares.get(symbol, 0)
+
+    def hold(self, symbol, shares, price, buy=True):
+        """
+        Purpose: Sets aside the cash a buy needs or the shares a sell needs if
+            enough is available
+        Returns: A hold id or None if there was not enough
+        """
+        with self.lock:
+            if buy:
+                if self.available_cash() < shares * price:
+                    return None
+                self.held_cash += shares * price
+            else:
+                if self.available_shares(symbol) < shares:
+                    return None
+                self.held_shares[symbol] = self.held_shares.get(symbol, 0) + shares
+
+            hold_id = next(self.hold_ids)
+            self.holds[hold_id] = [symbol, shares, price, buy, None]
+            return hold_id
+
+    def release(self, hold_id):
+        """
+        Purpose: Gives back a hold whose order was not submitted or was cancelled
+        """
+        with self.lock:
+            self.__drop__(hold_id)
+
+    def submitted(self, hold_id, order):
+        """
+        Purpose: Records what the broker returned for a held order, applying it
+            at once if it already filled
+        """
+        with self.lock:
+            if hold_id in self.holds:
+                self.holds[hold_id][4] = order.id
+        filled = float(getattr(order, "filled_qty", 0) or 0)
+        if filled:
+            self.fill(order.id, filled, float(order.filled_avg_price))
+
+    def fill(self, order_id, shares, price):
+        """
+        Purpose: Applies a fill of a submitted order to the positions and cash
+            and releases the part of its hold that the fill used
+        """
+        with self.lock:
+            hold_id = next(
+                (key for key, hold in self.holds.items() if hold[4] == order_id), None
+            )
+            if hold_id is None:
+                return
+            symbol, held, held_price, buy, _ = self.holds[hold_id]
+            shares = min(shares, held)
+
+            signed = shares if buy else -shares
+            self.positions[symbol] = self.positions.get(symbol, 0) + signed
+            self.cash -= signed * price
+            self.buying_power -= signed * price
+
+            if buy:
+                self.held_cash -= shares * held_price
+            else:
+                self.held_shares[symbol] -= shares
+            if shares < held:
+                self.holds[hold_id][1] = held - shares
+            else:
+                del self.holds[hold_id]
+
+    def __drop__(self, hold_id):
+        """
+        Purpose: Removes a hold and what it set aside (the lock must be held)
+        """
+        hold = self.holds.pop(hold_id, None)
+        if hold is None:
+            return
+        symbol, shares, price, buy, _ = hold
+        if buy:
+            self.held_cash -= shares * price
+        else:
+            self.held_shares[symbol] -= shares
@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import time
+
+import numpy as np
+
+from AlpacaTrade import AlpacaTrade
+from FakeAlpaca import FakeREST
+from PortfolioBook import PortfolioBook
+from TradingAlgorithms import BUY, COVER, SELL, SHORT_SELL, MeanReversionEngine
+
+# Static vars
+LATENCY_PERCENTILES = [50, 90, 99]
+# Engine action -> whether the order it becomes is a buy
+ORDER_SIDES = {BUY: True, COVER: True, SELL: False, SHORT_SELL: False}
+
+
+class Replay:
+    """
+    Purpose: Plays stored bars back through a strategy engine per symbol and sends
+        the trades they signal down the live AlpacaTrade order path to a stand-in
+        broker, so the whole path can be load tested offline. Every order's time
+        from its bar reaching the engine to its confirmation is measured.
+    """
+
+    def __init__(
+        self,
+        store,
+        symbols,
+        engine=MeanReversionEngine,
+        time_between="day",
+        shares=1,
+        speed=None,
+        batch=False,
+        rate=float("inf"),
+        broker=None,
+        start=None,
+        end=None,
+    ):
+        """
+        Inputs:
+            - store: The BarStore the bars are read from
+            - symbols: The symbols to replay
+            - engine: Builds the strategy engine of each symbol, a StrategyEngine
+                class or any function that returns one (default MeanReversionEngine)
+            - time_between: The time frame of the bars (default "day")
+            - shares: How many shares every order trades
+            - speed: How many times faster than real time the bars are played (1 is
+                real time), None plays them as fast as possible
+            - batch: Whether the orders signalled at the same bar time are sent
+                together through submit_orders instead of one trade_limit each
+            - rate: The most orders submit_orders sends a second when batching
+                (default unthrottled)
+            - broker: The stand-in for tradeapi.REST (default a FakeREST)
+            - start, end: Only replay bars with start <= t < end (epoch seconds)
+        """
+        self.store = store
+        self.symbols = list(symbols)
+        self.engine = engine
+        self.time_between = time_between
+        self.shares = shares
+        self.speed = speed
+        self.batch = batch
+        self.rate = rate
+        self.broker = FakeREST() if broker is None else broker
+        self.start = start
+        self.end = end
+
+    def stream(self):
+        """
+        Purpose: Merges the bars of every symbol into one time ordered stream
+        Returns: A generator of (t, [(symbol, close), ...]) for each bar time
+        """
+        series = [
+            self.store.read(symbol, self.time_between, self.start, self.end)
+            for symbol in self.symbols
+        ]
+        if not series:
+            return
+        times = np.concatenate([bars.t for bars in series])
+        owners = np.repeat(np.arange(len(series)), [len(bars) for bars in series])
+        closes = np.concatenate([bars.c for bars in series])
+        order = np.argsort(times, kind="stable")
+
+        times, owners = times[order].tolist(), owners[order].tolist()
+        bars = zip(times, owners, closes[order].tolist())
+        for t, group in itertools.groupby(bars, key=lambda bar: bar[0]):
+            yield t, [(self.symbols[owner], close) for _, owner, close in group]
+
+    def run(self):
+        """
+        Purpose: Replays every bar, placing the orders the engines signal
+        Returns: A dictionary with
+            bars - the number of bars played
+            orders - the number of orders the engines signalled
+            submitted - how many of them reached the broker
+            rejected - how many failed their pre-trade check or were refused
+            seconds - how long the replay took
+            bars_per_second, orders_per_second - the throughput
+            max_lag - the most seconds the replay fell behind its schedule (0 when
+                played as fast as possible)
+            latency - the mean, max and LATENCY_PERCENTILES of the seconds from
+                each order's bar reaching its engine to the order's confirmation
+        """
+        saved = AlpacaTrade.api, AlpacaTrade.book
+        AlpacaTrade.api, AlpacaTrade.book = self.broker, PortfolioBook()
+        AlpacaTrade.invalidate_account()
+
+        engines = {symbol: self.engine() for symbol in self.symbols}
+        latencies = []
+        bars = submitted = rejected = 0
+        max_lag = 0
+        first = None
+        began = time.perf_counter()
+        try:
+            for t, group in self.stream():
+                if self.speed:
+                    first = t if first is None else first
+                    lag = time.perf_counter() - began - (t - first) / self.speed
+                    if lag < 0:
+                        time.sleep(-lag)
+                    max_lag = max(max_lag, lag)
+
+                orders = []
+                for symbol, price in group:
+                    signalled = time.perf_counter()
+                    self.broker.quote(symbol, price)
+                    action = engines[symbol].update(price)
+                    bars += 1
+                    if action in ORDER_SIDES:
+                        order = {
+                            "symbol": symbol,
+                            "shares": self.shares,
+                            "price": price,
+                            "buy": ORDER_SIDES[action],
+                        }
+                        orders.append((signalled, order))
+
+                for signalled, placed, confirmed in self.__place__(orders):
+                    latencies.append(confirmed - signalled)
+                    submitted += placed
+                    rejected += not placed
+        finally:
+            AlpacaTrade.api, AlpacaTrade.book = saved
+            AlpacaTrade.invalidate_account()
+
+        seconds = time.perf_counter() - began
+        return {
+            "bars": bars,
+            "orders": len(latencies),
+            "submitted": submitted,
+            "rejected": rejected,
+            "seconds": seconds,
+            "bars_per_second": bars / seconds if seconds else 0,
+            "orders_per_second": len(latencies) / seconds if seconds else 0,
+            "max_lag": max_lag,
+            "latency": Replay.summarize(latencies),
+        }
+
+    def __place__(self, orders):
+        """
+        Purpose: Places one bar time's orders
+        Returns: A list of (signal time, whether it was submitted, confirmation
+            time) for every order
+        """
+        if not self.batch:
+            placed = []
+            for signalled, order in orders:
+                submitted = AlpacaTrade.trade_limit(**order)
+                placed.append((signalled, submitted, time.perf_counter()))
+            return placed
+        if not orders:
+            return []
+
+        signal_times = {id(order): signalled for signalled, order in orders}
+
+        async def collect():
+            return [
+                (
+                    signal_times[id(confirmation["order"])],
+                    confirmation["submitted"],
+                    time.perf_counter(),
+                )
+                async for confirmation in AlpacaTrade.submit_orders(
+                    [order for _, order in orders], self.rate
+                )
+            ]
+
+        return asyncio.run(collect())
+
+    @staticmethod
+    def summarize(latencies):
+        """
+        Purpose: Describes a list of latencies in seconds
+        Returns: A dictionary of the mean, max and LATENCY_PERCENTILES (empty if
+            there are none)
+        """
+        latencies = np.asarray(latencies, dtype=np.float64)
+        if len(latencies) == 0:
+            return {}
+
+        summary = {"mean": float(latencies.mean()), "max": float(latencies.max())}
+        for percentile, value in zip(
+            LATENCY_PERCENTILES, np.percentile(latencies, LATENCY_PERCENTILES)
+        ):
+            summary[f"p{percentile}"] = float(value)
+        return summary
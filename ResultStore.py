@@ -0,0 +1,163 @@
+import hashlib
+import inspect
+import os
+import pathlib
+import pickle
+
+import numpy as np
+
+from Metrics import METRICS
+from TradingAlgorithms import ENGINES, StrategyPipeline
+
+# Static vars
+# A hash of the strategy code, part of every key so entries written before the
+# kernels or engines changed are never read back
+RESULT_VERSION = hashlib.sha256(
+    pathlib.Path(inspect.getfile(StrategyPipeline)).read_bytes()
+).hexdigest()
+
+
+class ResultStore:
+    """
+    Purpose: Keeps the strategy engine of every finished run on disk under a hash
+        of its strategy, settings and prices, so a run over prices that have not
+        changed is read back instead of simulated. Each history, like a ticker's
+        daily bars, also points at its latest entry, and when new prices only add
+        bars to the end of that entry's prices its engine is fed just the new bars.
+    """
+
+    def __init__(self, directory="results"):
+        """
+        Inputs:
+            - directory: Where the entries are kept
+        """
+        self.directory = pathlib.Path(directory)
+
+    def path(self, key):
+        return self.directory / key[:2] / f"{key}.pkl"
+
+    @staticmethod
+    def digest(settings, prices=None):
+        """
+        Purpose: Hashes a run's settings and (optionally) the prices it ran over,
+            along with the RESULT_VERSION of the code that ran it
+        """
+        hasher = hashlib.sha256(RESULT_VERSION.encode())
+        hasher.update(repr(settings).encode())
+        if prices is not None:
+            hasher.update(np.ascontiguousarray(prices, dtype="<f8").tobytes())
+        return hasher.hexdigest()
+
+    def load(self, key):
+        """
+        Purpose: Reads an entry
+        Returns: What was saved under the key, or None if nothing (or a broken
+            file) is there
+        """
+        try:
+            with open(self.path(key), "rb") as in_file:
+                return pickle.load(in_file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, key, value):
+        """
+        Purpose: Writes an entry, replacing the file whole so readers never see
+            half of one
+        """
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_path, "wb") as out_file:
+            pickle.dump(value, out_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    def remove(self, key):
+        self.path(key).unlink(missing_ok=True)
+
+    def run(self, history, prices, pipeline):
+        """
+        Purpose: StrategyPipeline.run(prices, ledger=True) that only simulates what
+            the store does not already have
+        Inputs:
+            - history: Names where the prices come from, like "AAPL/day", so later
+                prices that extend them can carry on from this run
+            - prices: a list or NumPy array of prices to run the strategies on
+            - pipeline: The StrategyPipeline of runs, every one with an engine in
+                ENGINES
+        Returns: The same dictionary as StrategyPipeline.run. Extended runs add
+            the new trades' profits one at a time, so their totals can differ
+            from a fresh run's in the last few bits.
+        """
+        prices = np.ascontiguousarray(prices, dtype=np.float64)
+        engines = {}
+        changed = []
+        missing = StrategyPipeline()
+        for run in pipeline.runs:
+            name, spec, days, percent_diff, short = run
+            settings = (ENGINES[spec].__name__, days, percent_diff, short)
+            key = ResultStore.digest(settings, prices)
+            engine = self.load(key)
+            if engine is not None:
+                METRICS.count("ResultStore.hits")
+                engines[name] = engine
+                continue
+
+            engine = self.__extend__(history, settings, prices)
+            if engine is not None:
+                METRICS.count("ResultStore.extended")
+                engines[name] = engine
+            else:
+                METRICS.count("ResultStore.misses")
+                missing.runs.append(run)
+            changed.append((name, settings, key))
+
+        results = missing.run(prices, ledger=True) if missing.runs else {}
+        for name, spec, days, percent_diff, short in missing.runs:
+            total_profit, first_buy, _, trades = results[name]
+            engine = ResultStore.__engine__(spec, days, percent_diff, short)
+            engines[name] = engine.resume(prices, total_profit, first_buy, trades)
+
+        for name, settings, key in changed:
+            self.save(key, engines[name])
+            head_key = ResultStore.digest((history,) + settings)
+            head = self.load(head_key)
+            self.save(head_key, {"bars": len(prices), "key": key})
+            # Only the latest entry of a history is kept
+            if head is not None and head["key"] != key:
+                self.remove(head["key"])
+
+        return {
+            name: results[name] if name in results else engines[name].outputs()
+            for name, _, _, _, _ in pipeline.runs
+        }
+
+    def __extend__(self, history, settings, prices):
+        """
+        Purpose: Finds the latest entry of a history and feeds it the new prices,
+            if the prices it ran over are the start of these ones
+        Returns: The engine, or None if there is nothing to carry on from
+        """
+        head = self.load(ResultStore.digest((history,) + settings))
+        if head is None or not 0 < head["bars"] < len(prices):
+            return None
+        if ResultStore.digest(settings, prices[: head["bars"]]) != head["key"]:
+            return None
+        engine = self.load(head["key"])
+        if engine is None:
+            return None
+
+        for price in prices[head["bars"] :].tolist():
+            engine.update(price)
+        return engine
+
+    @staticmethod
+    def __engine__(spec, days, percent_diff, short):
+        """
+        Purpose: Builds the ledger keeping engine of a pipeline run
+        """
+        engine = ENGINES[spec]
+        # Strategies with a fixed percent_diff don't take one
+        if spec.percent_diff is not None:
+            return engine(days, short=short, ledger=True)
+        return engine(days, percent_diff, short, ledger=True)
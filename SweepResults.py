@@ -0,0 +1,133 @@
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+# Most memory a SweepResults keeps before writing its rows to disk
+SWEEP_RESULT_BYTES = 256 * 1024 * 1024
+
+
+class SweepResults:
+    """
+    Purpose: An append only table of typed records, like the scores of a
+        parameter sweep. Rows are kept in memory until they pass max_bytes and
+        are then written to disk as one .npy file per spill, which is
+        memory-mapped back a file at a time. Top-k queries and filters stream
+        through the rows so the whole table never has to be loaded at once.
+    """
+
+    def __init__(self, dtype, max_bytes=SWEEP_RESULT_BYTES, directory=None):
+        """
+        Inputs:
+            - dtype: The NumPy structured type of the rows
+            - max_bytes: The most memory the rows may use before they are spilled
+            - directory: Where spilled rows go (default a temporary directory that
+                is removed with the table)
+        """
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.buffered = []
+        self.buffered_bytes = 0
+        self.files = []
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, records):
+        """
+        Purpose: Adds a copy of rows to the end of the table, spilling if it grew
+            too big
+        """
+        records = np.array(records, dtype=self.dtype)
+        if len(records) == 0:
+            return
+        self.buffered.append(records)
+        self.buffered_bytes += records.nbytes
+        self.length += len(records)
+        if self.buffered_bytes > self.max_bytes:
+            self.spill()
+
+    def spill(self):
+        """
+        Purpose: Writes the rows held in memory to a new file
+        """
+        if not self.buffered:
+            return
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="sweep_")
+            weakref.finalize(self, shutil.rmtree, self.directory, True)
+        path = f"{self.directory}/{len(self.files)}.npy"
+        np.save(path, np.concatenate(self.buffered))
+        self.files.append(path)
+        self.buffered, self.buffered_bytes = [], 0
+
+    def chunks(self):
+        """
+        Purpose: Goes through the rows in order, a spilled file or the rows in
+            memory at a time
+        Returns: A generator of (position of the chunk's first row, rows)
+        """
+        start = 0
+        for path in self.files:
+            chunk = np.load(path, mmap_mode="r")
+            yield start, chunk
+            start += len(chunk)
+        if self.buffered:
+            if len(self.buffered) > 1:
+                self.buffered = [np.concatenate(self.buffered)]
+            yield start, self.buffered[0]
+
+    def to_array(self):
+        """
+        Purpose: Loads every row into one array
+        """
+        arrays = [np.asarray(chunk) for _, chunk in self.chunks()]
+        return np.concatenate(arrays) if arrays else np.zeros(0, self.dtype)
+
+    def top(self, count, key, tiebreak=None):
+        """
+        Purpose: Finds the rows with the largest values of a field
+        Inputs:
+            - count: How many rows to return
+            - key: The field to rank the rows by
+            - tiebreak: (optional) A field that orders rows with equal keys,
+                smallest first. Defaults to the order they were appended in.
+        Returns: An array of at most count rows, largest key first
+        """
+        best = np.zeros(0, self.dtype)
+        best_order = np.zeros(0, np.int64)
+        if count <= 0:
+            return best
+
+        for start, chunk in self.chunks():
+            values = chunk[key]
+            order = np.arange(start, start + len(chunk))
+            if tiebreak is not None:
+                order = chunk[tiebreak]
+            if len(chunk) > count:
+                # Every row tied with the count-th largest stays a candidate
+                kth = np.partition(values, len(values) - count)[len(values) - count]
+                keep = np.flatnonzero(values >= kth)
+                chunk, values, order = chunk[keep], values[keep], order[keep]
+
+            merged = np.concatenate([best, chunk])
+            merged_order = np.concatenate([best_order, order])
+            ranked = np.lexsort((merged_order, -merged[key]))[:count]
+            best, best_order = merged[ranked], merged_order[ranked]
+        return best
+
+    def filter(self, where):
+        """
+        Purpose: Picks out the rows that match a condition
+        Inputs:
+            - where: A function that takes an array of rows and returns a boolean
+                mask of the ones to keep
+        Returns: A new SweepResults of the matching rows with the same budget
+        """
+        matches = SweepResults(self.dtype, self.max_bytes)
+        for _, chunk in self.chunks():
+            matches.append(chunk[where(chunk)])
+        return matches
@@ -1,8 +1,192 @@
-import copy
+import collections
+import concurrent.futures
+import hashlib
+import heapq
+import itertools
+import math
 import random
+import threading
+
+import numpy as np
+
+from Metrics import METRICS
+from SweepResults import SWEEP_RESULT_BYTES, SweepResults
+
+# Position states, bar classes and actions used by the array kernels
+FLAT, LONG, SHORT = 0, 1, 2
+HOLD, BUY_SIDE, SELL_SIDE, BOTH_SIDES = 0, 1, 2, 3
+NO_ACTION, BUY, SELL, SHORT_SELL, COVER = 0, 1, 2, 3, 4
+
+# Indexed by [bar class, current state]
+NEXT_STATE = np.array(
+    [
+        [FLAT, LONG, SHORT],
+        [LONG, LONG, FLAT],
+        [SHORT, FLAT, SHORT],
+        [LONG, FLAT, FLAT],
+    ],
+    dtype=np.int8,
+)
+ACTIONS = np.array(
+    [
+        [NO_ACTION, NO_ACTION, NO_ACTION],
+        [BUY, NO_ACTION, COVER],
+        [SHORT_SELL, SELL, NO_ACTION],
+        [BUY, SELL, COVER],
+    ],
+    dtype=np.int8,
+)
+# A map of the three states to their next states packed into one number
+# (next of FLAT + 3 * next of LONG + 9 * next of SHORT). COMPOSE[27 * g + f] is
+# the packed map of applying f and then g, so chaining bars is a table lookup.
+STATE_MAPS = np.array([[m % 3, m // 3 % 3, m // 9] for m in range(27)])
+COMPOSE = (STATE_MAPS[:, STATE_MAPS] * [1, 3, 9]).sum(axis=2).ravel().astype(np.uint16)
+
+# One row per (days, diff) combination of MeanReversion.sweep
+SWEEP_DTYPE = np.dtype(
+    [
+        ("mvg_avg_days", np.int64),
+        ("percent_diff", np.float64),
+        ("total_profit", np.float64),
+        ("percent_gain", np.float64),
+        ("starting_price", np.float64),
+        ("trades", np.int64),
+    ]
+)
+SWEEP_CHUNK = 2**24  # Most (diffs x bars) cells a sweep works on at once
+# One row per setting get_best_settings scores. row orders the rows the way the
+# results were listed before ranking: label * settings + the setting's index.
+BEST_DTYPE = np.dtype(
+    [
+        ("row", np.int64),
+        ("mvg_avg_days", np.int64),
+        ("percent_diff", np.float64),
+        ("total_profit", np.float64),
+        ("percent_gain", np.float64),
+        ("starting_price", np.float64),
+        ("data_points", np.int64),
+    ]
+)
+HALVING_ETA = 3  # Each round of a halving search keeps 1 / HALVING_ETA of the settings
+HALVING_MIN_BARS = 64  # Fewest bars the first round of a halving search scores on
+
+# One row per position taken by a simulation. side is 1 for long and -1 for
+# short. Positions still open at the end have an exit_index of -1 and nan exits.
+TRADE_DTYPE = np.dtype(
+    [
+        ("run", np.int64),
+        ("side", np.int8),
+        ("entry_index", np.int64),
+        ("entry_price", np.float64),
+        ("exit_index", np.int64),
+        ("exit_price", np.float64),
+        ("profit", np.float64),
+    ]
+)
+
+# Most memory the shared indicator cache keeps before dropping old series
+INDICATOR_CACHE_BYTES = 256 * 1024 * 1024
+
+ADVICE = {
+    BUY: "You should buy this stock today",
+    COVER: "You should buy this stock today",
+    SELL: "You should sell this stock today",
+    SHORT_SELL: "You should short sell this stock today",
+}
+
+
+class IndicatorCache:
+    """
+    Purpose: Remembers indicator series (prefix sums, moving averages and moving
+        standard deviations) by a fingerprint of the prices they were built from
+        plus their settings, so repeat runs over the same prices skip the work.
+        The least recently used series are dropped once max_bytes is reached.
+        Cached arrays are read only since every caller shares them.
+    """
+
+    def __init__(self, max_bytes=INDICATOR_CACHE_BYTES):
+        """
+        Inputs:
+            - max_bytes: The most memory the cached series may use (0 disables it)
+        """
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(prices):
+        """
+        Purpose: Returns a key that only matches arrays with the same contents
+        """
+        prices = np.ascontiguousarray(prices)
+        data = memoryview(prices).cast("B")
+        digest = hashlib.sha256(data).digest()
+        return prices.dtype.str, prices.shape, digest
+
+    def get(self, key, compute):
+        """
+        Purpose: Returns the series stored under key, building it with compute()
+            and storing it if it is not there
+        Inputs:
+            - key: A hashable key starting with the fingerprint of the prices
+            - compute: Builds the series, an array or a tuple of arrays
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+
+        value = compute()
+        arrays = value if isinstance(value, tuple) else (value,)
+        for array in arrays:
+            array.flags.writeable = False
+        size = sum(array.nbytes for array in arrays)
+
+        with self.lock:
+            if size <= self.max_bytes and key not in self.entries:
+                self.entries[key] = (value, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, (_, old_size) = self.entries.popitem(last=False)
+                    self.bytes -= old_size
+        return value
+
+    def clear(self):
+        """
+        Purpose: Drops every cached series and resets the counts
+        """
+        with self.lock:
+            self.entries.clear()
+            self.bytes = self.hits = self.misses = 0
+
+    def stats(self):
+        """
+        Purpose: Returns the hit and miss counts and the size of the cache
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Shared by every strategy in the process
+INDICATORS = IndicatorCache()
 
 
 class TradingAlgorithms:
+    # Every strategy sets its StrategySpec and the __log_trades__ labels of its
+    # output, and inherits report, __kernel__ and __signals__ built from them
+    SPEC = None
+    LABELS = None
 
     # Get the average value of a list
     @staticmethod
@@ -26,8 +210,521 @@ class TradingAlgorithms:
         end = random.randint(start + min_range, len(prices) - 1)
         return prices[start:end]
 
+    @staticmethod
+    def random_day_ranges(length, count, min_range=1, seed=0):
+        """
+        Purpose: Picks many random ranges of days at once, each one drawn the same
+            way as random_day_range, without copying any prices
+        Inputs:
+            - length: The number of prices to choose from
+            - count: How many ranges to pick
+            - min_range: The smallest amount of data in a range
+            - seed: Seeds the picks so the same ranges come back every run
+        Returns: starts and ends, int64 arrays so range k is prices[starts[k]:ends[k]]
+        """
+        assert min_range < length
+
+        rng = np.random.default_rng(seed)
+        starts = rng.integers(0, length - min_range, count)
+        ends = rng.integers(starts + min_range, length)
+        return starts, ends
+
+    @staticmethod
+    def __round_prices__(prices):
+        """
+        Purpose: Rounds an array of prices to 2 decimals exactly like the builtin
+            round does (np.round can differ on values close to a half cent)
+        """
+        rounded = np.round(prices, 2)
+        scaled = prices * 100
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        if near_half.any():
+            rounded[near_half] = [round(float(p), 2) for p in prices[near_half]]
+        return rounded
+
+    @staticmethod
+    def __prefix_sums__(prices, fingerprint=None):
+        """
+        Purpose: Returns the running sums of a price array with a leading 0 so that
+            window sums can be read off in constant time. The second row holds the
+            rounding error of every addition so long histories do not drift.
+            Cached in INDICATORS.
+        Inputs:
+            - prices: a float64 array of prices
+            - fingerprint: The IndicatorCache.fingerprint of the prices if known
+        """
+        if fingerprint is None:
+            fingerprint = IndicatorCache.fingerprint(prices)
+        return INDICATORS.get(
+            (fingerprint, "sums"), lambda: TradingAlgorithms.__running_sums__(prices)
+        )
+
+    @staticmethod
+    def __running_sums__(prices):
+        """
+        Purpose: Builds the uncached __prefix_sums__ of any float64 array
+        """
+        sums = np.zeros((2, len(prices) + 1))
+        np.cumsum(prices, out=sums[0, 1:])
+
+        # Exact error of each running addition (two-sum), accumulated separately
+        before, after = sums[0, :-1], sums[0, 1:]
+        added = after - before
+        np.cumsum((before - (after - added)) + (prices - added), out=sums[1, 1:])
+        return sums
+
+    @staticmethod
+    def __window_sums__(sums, starts, ends):
+        """
+        Purpose: Returns sum(prices[start:end]) for arrays of starts and ends using
+            the output of __prefix_sums__
+        """
+        return (sums[0, ends] - sums[0, starts]) + (sums[1, ends] - sums[1, starts])
+
+    @staticmethod
+    def __moving_average__(prices, days, percent_diff, lag=0, sums=None):
+        """
+        Purpose: Finds sum(prices[i - days : i - lag]) / days for every i from days
+            to the end of the prices
+        Inputs:
+            - prices: a float64 array of prices
+            - days: The number of days used to calculate the average
+            - percent_diff: The band width (or a list of widths) that will be
+                compared against. Averages that put a price within rounding error
+                of a band edge are redone with the builtin sum so ties break
+                exactly like the python loops.
+            - lag: How many of the most recent days are left out of the window
+            - sums: Precomputed __prefix_sums__ of the prices (optional)
+        Returns: A read only float64 array with one average per bar starting at
+            bar `days`, cached in INDICATORS
+        """
+        i = np.arange(days, len(prices))
+        if days == 0:
+            return np.zeros(len(i))
+        fingerprint = IndicatorCache.fingerprint(prices)
+        percent_diffs = np.atleast_1d(percent_diff).astype(np.float64)
+
+        def exact_averages():
+            window_sums = sums
+            if window_sums is None:
+                window_sums = TradingAlgorithms.__prefix_sums__(prices, fingerprint)
+            totals = TradingAlgorithms.__window_sums__(window_sums, i - days, i - lag)
+            averages = totals / days
+
+            near_edge = np.zeros(len(i), dtype=bool)
+            for diff in percent_diffs * 0.01:
+                for edge in (averages * (1 - diff), averages * (1 + diff)):
+                    near_edge |= np.abs(prices[days:] - edge) <= 1e-9 * np.abs(edge)
+            for j in np.flatnonzero(near_edge):
+                averages[j] = sum(prices[j : j + days - lag].tolist()) / days
+            return averages
+
+        # The exact fix ups depend on the bands so they are cached per set of them
+        key = (fingerprint, "mean", days, lag, percent_diffs.tobytes())
+        return INDICATORS.get(key, exact_averages)
+
+    @staticmethod
+    def __moving_std__(prices, days, lag=0):
+        """
+        Purpose: Finds the population standard deviation of the same windows as
+            __moving_average__, prices[i - days : i - lag], for bands sized by
+            volatility. Cached in INDICATORS.
+        Inputs:
+            - prices: a float64 array of prices
+            - days: The number of days in each window
+            - lag: How many of the most recent days are left out of the window
+        Returns: A float64 array with one deviation per bar starting at bar `days`
+        """
+        i = np.arange(days, len(prices))
+        # The window is prices[i - days : i - lag]
+        count = days - lag
+        if count <= 0:
+            return np.zeros(len(i))
+        fingerprint = IndicatorCache.fingerprint(prices)
+
+        def deviations():
+            sums = TradingAlgorithms.__prefix_sums__(prices, fingerprint)
+            squares = INDICATORS.get(
+                (fingerprint, "square_sums"),
+                lambda: TradingAlgorithms.__running_sums__(prices * prices),
+            )
+            starts, ends = i - days, i - lag
+            mean = TradingAlgorithms.__window_sums__(sums, starts, ends) / count
+            squared = TradingAlgorithms.__window_sums__(squares, starts, ends) / count
+            return np.sqrt(np.maximum(squared - mean * mean, 0))
+
+        return INDICATORS.get((fingerprint, "std", days, lag), deviations)
+
+    @staticmethod
+    def __run_signals__(prices, classes, short=False, ledger=False):
+        """
+        Purpose: Runs the shared buy/sell/short state machine over classified bars
+            without a per-bar python loop
+        Inputs:
+            - prices: a float64 array of the prices to trade at
+            - classes: an int8 array with the class of every bar
+            - short: Whether the simulation is allowed to sell short
+            - ledger: Whether to also build the TRADE_DTYPE record of every trade
+        Returns:
+            - total_profit: The total profit made over the closed trades
+            - first_buy: The first price bought (or bought back) at, None if never
+            - last_class: The class of the final bar
+            - last_action: The action the final bar would take (it is never traded)
+            - trades: The TRADE_DTYPE array of trades in order, None unless asked for
+        """
+        results = TradingAlgorithms.__run_signal_grid__(
+            prices, classes[None], short, ledger
+        )
+        total_profit, first_buy, trades, last_class, last_action = results[:5]
+
+        total_profit = float(total_profit[0]) if trades[0] else 0
+        first_buy = None if np.isnan(first_buy[0]) else float(first_buy[0])
+        trades = results[5] if ledger else None
+        return total_profit, first_buy, last_class[0], last_action[0], trades
+
+    @staticmethod
+    def __log_trades__(trades, labels):
+        """
+        Purpose: Prints a TRADE_DTYPE ledger the way the simulations log their buys
+            and sells, one line per entry or exit in bar order
+        Inputs:
+            - trades: The TRADE_DTYPE array of a single run
+            - labels: The prefix of each kind of line, keyed by "buy", "sell",
+                "short", "profit" and optionally "first_buy"
+        """
+        # (bar, lines to print, price bought at if the bar is a buy)
+        events = []
+        for _, side, entry_index, entry, exit_index, exit, profit in trades.tolist():
+            closed = exit_index >= 0
+            if side > 0:
+                events.append((entry_index, [(labels["buy"], entry)], entry))
+                if closed:
+                    lines = [(labels["sell"], exit), (labels["profit"], profit)]
+                    events.append((exit_index, lines, None))
+            else:
+                events.append((entry_index, [(labels["short"], entry)], None))
+                if closed:
+                    lines = [(labels["buy"], exit), (labels["profit"], profit)]
+                    events.append((exit_index, lines, exit))
+
+        first_buy = None
+        for _, lines, bought in sorted(events, key=lambda event: event[0]):
+            for label, value in lines:
+                print(f"{label}{round(value, 2)}")
+            if "first_buy" in labels and first_buy is None and bought is not None:
+                first_buy = bought
+                print(f"{labels['first_buy']}{round(first_buy, 2)}")
+
+    @staticmethod
+    def __run_signal_grid__(prices, classes, short=False, ledger=False, segments=None):
+        """
+        Purpose: Runs the shared buy/sell/short state machine for many parameter
+            sets over the same prices at once. The state after every bar is found
+            with a prefix scan over the packed per-bar state maps.
+        Inputs:
+            - prices: a float64 array of the prices to trade at
+            - classes: an int8 array of shape (runs, bars) with the class of every
+                bar, one row per parameter set
+            - short: Whether the simulation is allowed to sell short
+            - ledger: Whether to also return every trade as a TRADE_DTYPE array
+            - segments: (optional) A list of (start, stop) bar ranges. Every row is
+                then run separately over each range, exactly as if the prices and
+                classes had been sliced to [start:stop], and every result gets a
+                second axis with one column per segment.
+        Returns (one entry per row, or per row and segment):
+            - total_profit: The total profit made over the closed trades
+            - first_buy: The first price bought (or bought back) at, nan if never
+            - trades: The number of closed trades
+            - last_class: The class of the final bar
+            - last_action: The action the final bar would take (it is never traded)
+            - ledger: (only if asked for) the trades of every row in order. With
+                segments the run field is row * len(segments) + segment.
+        """
+        rows, bars = classes.shape
+        if segments is None:
+            starts, stops = np.zeros(1, dtype=np.int64), np.full(1, bars)
+        else:
+            starts, stops = np.asarray(segments, dtype=np.int64).reshape(-1, 2).T
+            stops = np.maximum(stops, starts)
+        runs = rows * len(starts)
+
+        next_state, actions = NEXT_STATE, ACTIONS
+        if not short:
+            next_state, actions = next_state.copy(), actions.copy()
+            next_state[SELL_SIDE, FLAT] = FLAT
+            actions[SELL_SIDE, FLAT] = NO_ACTION
+
+        # HOLD bars never change the state so only the other bars are scanned, with
+        # every run laid back to back in one flat array
+        if segments is None:
+            event_rows, events = np.nonzero(classes[:, :-1] != HOLD)
+            event_runs = event_rows
+        else:
+            # Find each segment's events (all but its last bar) in the row major
+            # event keys and gather them run after run
+            event_rows, events = np.nonzero(classes != HOLD)
+            keys = event_rows * bars + events
+            offsets = (np.arange(rows) * bars)[:, None]
+            first = np.searchsorted(keys, (offsets + starts).ravel())
+            lengths = np.searchsorted(keys, (offsets + stops - 1).ravel()) - first
+            lengths = np.maximum(lengths, 0)
+            picked = np.repeat(first - (np.cumsum(lengths) - lengths), lengths)
+            picked += np.arange(len(picked))
+            event_rows, events = event_rows[picked], events[picked]
+            event_runs = np.repeat(np.arange(runs), lengths)
+        event_classes = classes[event_rows, events]
+        first_events = np.ones(len(events), dtype=bool)
+        first_events[1:] = event_runs[1:] != event_runs[:-1]
+
+        # maps[e] is the packed state map from the start of its run through event e.
+        # The first event of a run always starts FLAT which also keeps runs apart,
+        # so the scan is done once it reaches back over the longest run.
+        maps = (next_state * [1, 3, 9]).sum(axis=1).astype(np.uint16)[event_classes]
+        maps[first_events] = 13 * next_state[event_classes[first_events], FLAT]
+        counts = np.bincount(event_runs, minlength=runs)
+        longest, step = counts.max(initial=0), 1
+        while step < longest:
+            maps[step:] = COMPOSE.take(maps[step:] * 27 + maps[:-step])
+            step *= 2
+
+        before = np.full(len(events), FLAT, dtype=np.int8)
+        before[1:] = maps[:-1] % 3
+        before[first_events] = FLAT
+        event_actions = actions[event_classes, before]
+
+        # Positions never overlap so the k-th close of a run closes its k-th open
+        is_open = (event_actions == BUY) | (event_actions == SHORT_SELL)
+        is_close = (event_actions == SELL) | (event_actions == COVER)
+        open_counts = np.bincount(event_runs[is_open], minlength=runs)
+        trades = np.bincount(event_runs[is_close], minlength=runs)
+        close_runs, closes = event_runs[is_close], events[is_close]
+        rank = np.arange(len(closes)) - (np.cumsum(trades) - trades)[close_runs]
+        closed = (np.cumsum(open_counts) - open_counts)[close_runs] + rank
+        opened = np.flatnonzero(is_open)[closed]
+        opens = events[opened]
+        trade_profit = np.where(
+            event_actions[opened] == BUY,
+            prices[closes] - prices[opens],
+            prices[opens] - prices[closes],
+        )
+
+        # Lay the trades out one row per run so cumsum adds them in order, matching
+        # the running total of the loop
+        padded = np.zeros((runs, trades.max(initial=0) + 1))
+        padded[close_runs, rank] = trade_profit
+        total_profit = np.cumsum(padded, axis=1)[:, -1]
+
+        is_buy = (event_actions == BUY) | (event_actions == COVER)
+        buy_runs, first_buys = np.unique(event_runs[is_buy], return_index=True)
+        first_buy = np.full(runs, np.nan)
+        first_buy[buy_runs] = prices[events[is_buy][first_buys]]
+
+        # State going into the final bar is the state after the last event
+        last_state = np.full(runs, FLAT, dtype=np.int8)
+        last_state[counts > 0] = maps[np.cumsum(counts)[counts > 0] - 1] % 3
+        last_class = np.full((rows, len(starts)), HOLD, dtype=np.int8)
+        ends = np.flatnonzero(stops > starts)
+        last_class[:, ends] = classes[:, stops[ends] - 1]
+        last_class = last_class.ravel()
+        last_action = actions[last_class, last_state]
+
+        results = (total_profit, first_buy, trades, last_class, last_action)
+        shape = (rows,) if segments is None else (rows, len(starts))
+        results = tuple(result.reshape(shape) for result in results)
+        if not ledger:
+            return results
+
+        # One record per position, the last one of a run may still be open
+        entries = events[is_open]
+        trade_ledger = np.zeros(len(entries), dtype=TRADE_DTYPE)
+        trade_ledger["run"] = event_runs[is_open]
+        trade_ledger["side"] = np.where(event_actions[is_open] == BUY, 1, -1)
+        trade_ledger["entry_index"] = entries
+        trade_ledger["entry_price"] = prices[entries]
+        trade_ledger["exit_index"] = -1
+        trade_ledger["exit_price"] = np.nan
+        trade_ledger["profit"] = np.nan
+        trade_ledger["exit_index"][closed] = closes
+        trade_ledger["exit_price"][closed] = prices[closes]
+        trade_ledger["profit"][closed] = trade_profit
+        return results + (trade_ledger,)
+
+    @classmethod
+    def report(
+        cls,
+        total_profit,
+        first_buy,
+        advice,
+        trades=None,
+        log_buy_sell=False,
+        log_res=True,
+        ledger=False,
+    ):
+        """
+        Purpose: Prints the results of a run the way simulate does and returns the
+            same values, for results from __kernel__ or a StrategyPipeline
+        """
+        if log_buy_sell:
+            cls.__log_trades__(trades, cls.LABELS)
+        # Like the rest of the output, the advice is only printed when logging
+        if advice and (log_res or log_buy_sell):
+            print(advice)
+
+        results = cls.__results__(total_profit, first_buy)
+
+        if log_res:
+            if log_buy_sell:
+                print("---------------------------")
+            if first_buy:
+                print(f"First Buy: ${round(first_buy, 2)}")
+            else:
+                print("First Buy: N/A")
+            cls.__print_results__(*results)
+
+        if ledger:
+            return results + (trades,)
+        return results
+
+    @staticmethod
+    def __results__(total_profit, first_buy):
+        """
+        Purpose: Returns the (total_profit, final_percentage, final_percentage)
+            tuple simulate returns for a run's totals
+        """
+        final_percentage = (total_profit / first_buy) * 100 if first_buy else 0
+        return total_profit, final_percentage, final_percentage
+
+    @staticmethod
+    def __print_results__(total_profit, final_percentage, _):
+        print(f"Total Profit: ${round(total_profit, 2)}")
+        print(f"Final Percentage: {round(final_percentage, 2)}%")
+
+    @classmethod
+    def __kernel__(cls, prices, days=5, percent_diff=5, short=False, ledger=False):
+        """
+        Purpose: The array backed run of a strategy's SPEC behind simulate
+        Returns: total_profit, first_buy, the advice for the final bar (or None)
+            and the trade ledger (None unless asked for)
+        """
+        prices, classes = cls.__signals__(prices, days, percent_diff)
+        total_profit, first_buy, last_class, last_action, trades = (
+            cls.__run_signals__(prices, classes, short, ledger)
+        )
+        advice = cls.SPEC.advice(last_class, last_action)
+        return total_profit, first_buy, advice, trades
+
+    @classmethod
+    def __signals__(cls, prices, days=5, percent_diff=5):
+        """
+        Purpose: Returns the prices to trade at and the class of every bar.
+            Strategies with a fixed percent_diff ignore the one given, so every
+            strategy can be called the same way.
+        """
+        spec = cls.SPEC
+        if spec.percent_diff is not None:
+            percent_diff = spec.percent_diff
+        prices = spec.prices(prices)
+        return prices, spec.classes(prices, days, percent_diff)[0]
+
+
+class StrategySpec:
+    """
+    Purpose: Describes a strategy as threshold rules on a moving average of its
+        prices, so any strategy built from them can be classified (and run side
+        by side with others) the same way
+    """
+
+    def __init__(
+        self,
+        rules,
+        lag=0,
+        rounded=False,
+        exclusive=False,
+        percent_diff=None,
+        buy_advice=False,
+    ):
+        """
+        Inputs:
+            - rules: A list of (bar class, above, sign) checked in order. A bar gets
+                the class when its price is above (or below if above is False)
+                average * (1 + sign * percent_diff / 100)
+            - lag: How many of the most recent days are left out of the average
+            - rounded: Whether prices are rounded to 2 decimals before anything else
+            - exclusive: Whether a bar only gets the first class it matches instead
+                of every one
+            - percent_diff: A band width to always use in place of the settings
+            - buy_advice: Whether a final bar below the band always advises buying
+        """
+        self.rules = rules
+        self.lag = lag
+        self.rounded = rounded
+        self.exclusive = exclusive
+        self.percent_diff = percent_diff
+        self.buy_advice = buy_advice
+
+    def prices(self, prices):
+        """
+        Purpose: Returns the prices the strategy trades at as a float64 array
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        if self.rounded:
+            return TradingAlgorithms.__round_prices__(prices)
+        return prices
+
+    def classes(self, prices, days, percent_diffs, averages=None, sums=None):
+        """
+        Purpose: Classifies every bar against the strategy's bands
+        Inputs:
+            - prices: The output of self.prices
+            - days: The number of days used to calculate the average
+            - percent_diffs: A list of percent differences, one row is made for each
+            - averages: The __moving_average__ of the prices for these days, lag
+                and percent differences, if it was already worked out
+            - sums: Precomputed __prefix_sums__ of the prices (optional)
+        Returns: An int8 array of bar classes with shape (diffs, bars)
+        """
+        # An average that leaves days out has to be over at least one day
+        assert days > 0 or not self.lag
+        percent_diffs = np.atleast_1d(percent_diffs)
+        classes = np.zeros((len(percent_diffs), len(prices)), dtype=np.int8)
+        if len(prices) <= days:
+            return classes
+
+        if averages is None:
+            averages = TradingAlgorithms.__moving_average__(
+                prices, days, percent_diffs, lag=self.lag, sums=sums
+            )
+        diff = percent_diffs[:, None] * 0.01
+        matched = np.zeros(classes[:, days:].shape, dtype=bool)
+        for bar_class, above, sign in self.rules:
+            edge = averages * (1 + sign * diff)
+            hits = prices[days:] > edge if above else prices[days:] < edge
+            if self.exclusive:
+                hits &= ~matched
+                matched |= hits
+            classes[:, days:] += hits * np.int8(bar_class)
+        return classes
+
+    def advice(self, last_class, last_action):
+        """
+        Purpose: Returns the advice for the final bar of a run (or None)
+        """
+        if self.buy_advice and last_class == BUY_SIDE:
+            return ADVICE[BUY]
+        return ADVICE.get(int(last_action))
+
 
 class BollingerBands(TradingAlgorithms):
+    # Buy above the lower band and sell below the upper one, with the average
+    # leaving out the latest day: sum(prices[i - days : i - 1]) / days
+    SPEC = StrategySpec([(BUY_SIDE, True, -1), (SELL_SIDE, False, 1)], lag=1)
+    LABELS = {
+        "buy": "Buying at:        $",
+        "sell": "Selling at:       $",
+        "short": "Short Selling at: $",
+        "profit": "Trade Profit:     $",
+    }
+
     @staticmethod
     def simulate(
         prices,
@@ -36,6 +733,7 @@ class BollingerBands(TradingAlgorithms):
         short=False,
         log_buy_sell=False,
         log_res=True,
+        ledger=False,
     ):
         """
         Purpose:
@@ -52,80 +750,32 @@ class BollingerBands(TradingAlgorithms):
                 default=False
             - log_res: whether to print all buys and sells to the console
                 default=True
+            - ledger: Whether to also return every trade as a TRADE_DTYPE array
+                default=False
         Returns:
             - total_profit: The total profit made using this strategy
             - final_percentage: The percentage gain or loss using this strategy
+            - trades: (only if ledger) The entries, exits, sides, prices and
+                profit of every trade, the last one may still be open
         """
 
-        i = 0
-        sell, buy = None, None
-        total_profit = 0
-        first_buy = None
-        diff = percent_diff * 0.01
-        for price in prices:
-            if i >= days:
-                moving_average = sum(prices[i - days : i - 1]) / days
-                # bollinger bands logic
-                # If we haven't bought whether or not we shorted we should buy
-                if price > moving_average * (1 - diff) and not buy:
-                    # buy
-                    if i == len(prices) - 1:
-                        print(f"You should buy this stock today")
-                    else:
-                        if log_buy_sell:
-                            print(f"Buying at:        ${round(price, 2)}")
-
-                        # If we shorted the stock then add to price but don't set buy
-                        if sell:
-                            total_profit += sell - price
-                            if log_buy_sell:
-                                print(f"Trade Profit:     ${round(sell - price, 2)}")
-                            sell = None
-                        else:
-                            buy = price
-
-                        if not first_buy:
-                            first_buy = price
-                elif price < moving_average * (1 + diff):
-                    if buy:
-                        # sell
-                        if i == len(prices) - 1:
-                            print(f"You should sell this stock today")
-                        else:
-                            if log_buy_sell:
-                                print(f"Selling at:       ${round(price, 2)}")
-                                print(f"Trade Profit:     ${round(price - buy, 2)}")
-                            total_profit += price - buy
-                            buy = None
-                    elif short and not sell:
-                        # short
-                        if i == len(prices) - 1:
-                            print(f"You should short sell this stock today")
-                        else:
-                            if log_buy_sell:
-                                print(f"Short Selling at: ${round(price, 2)}")
-                            sell = price
-                    else:
-                        # Do nothing if no buy nor short selling
-                        pass
-            i += 1
-
-        final_percentage = (total_profit / first_buy) * 100 if first_buy else 0
-
-        if log_res:
-            if log_buy_sell:
-                print("---------------------------")
-            if first_buy:
-                print(f"First Buy: ${round(first_buy, 2)}")
-            else:
-                print("First Buy: N/A")
-            print(f"Total Profit: ${round(total_profit, 2)}")
-            print(f"Final Percentage: {round(final_percentage, 2)}%")
-
-        return total_profit, final_percentage, final_percentage
+        with METRICS.timer("BollingerBands.simulate", items=len(prices)):
+            results = BollingerBands.__kernel__(
+                prices, days, percent_diff, short, ledger=log_buy_sell or ledger
+            )
+        return BollingerBands.report(*results, log_buy_sell, log_res, ledger)
 
 
 class SimpleMovingAverage(TradingAlgorithms):
+    # A zero width band is exactly the plain moving average comparison
+    SPEC = StrategySpec(BollingerBands.SPEC.rules, lag=1, percent_diff=0)
+    LABELS = {
+        "buy": "Buying at:       $",
+        "sell": "Selling at:      $",
+        "short": "Short Selling at $",
+        "profit": "Trade Profit:    $",
+    }
+
     @staticmethod
     def simulate(
         prices,
@@ -133,6 +783,7 @@ class SimpleMovingAverage(TradingAlgorithms):
         short=False,
         log_buy_sell=False,
         log_res=True,
+        ledger=False,
     ):
         """
         Purpose:
@@ -147,82 +798,42 @@ class SimpleMovingAverage(TradingAlgorithms):
                 default=False
             - log_res: whether to print all buys and sells to the console
                 default=True
+            - ledger: Whether to also return every trade as a TRADE_DTYPE array
+                default=False
         Returns:
             - total_profit: The total profit made using this strategy
             - final_percentage: The percentage gain or loss using this strategy
+            - trades: (only if ledger) The entries, exits, sides, prices and
+                profit of every trade, the last one may still be open
         """
 
-        i = 0
-        sell, buy = None, None
-        total_profit = 0
-        first_buy = None
-        for price in prices:
-            if i >= days:
-                moving_average = sum(prices[i - days : i - 1]) / days
-                # Simple moving average logic
-                # If we haven't bought whether or not we shorted we should buy
-                if price > moving_average and not buy:
-                    # buy
-                    if i == len(prices) - 1:
-                        print(f"You should buy this stock today")
-                    else:
-                        if log_buy_sell:
-                            print(f"Buying at:       ${round(price, 2)}")
-
-                        # If we shorted the stock then add to price but don't set buy
-                        if sell:
-                            total_profit += sell - price
-                            if log_buy_sell:
-                                print(f"Trade Profit:    ${round(sell - price, 2)}")
-                            sell = None
-                        else:
-                            buy = price
-
-                        if not first_buy:
-                            first_buy = price
-                elif price < moving_average:
-                    if buy:
-                        # sell
-                        if i == len(prices) - 1:
-                            print(f"You should sell this stock today")
-                        else:
-                            if log_buy_sell:
-                                print(f"Selling at:      ${round(price, 2)}")
-                                print(f"Trade Profit:    ${round(price - buy, 2)}")
-                            total_profit += price - buy
-                            buy = None
-                    elif short and not sell:
-                        # short
-                        if i == len(prices) - 1:
-                            print(f"You should short sell this stock today")
-                        else:
-                            if log_buy_sell:
-                                print(f"Short Selling at ${round(price, 2)}")
-                            sell = price
-                    else:
-                        # Do nothing if no buy nor short selling
-                        pass
-            i += 1
-
-        final_percentage = (total_profit / first_buy) * 100 if first_buy else 0
-
-        if log_res:
-            if log_buy_sell:
-                print("---------------------------")
-            if first_buy:
-                print(f"First Buy: ${round(first_buy, 2)}")
-            else:
-                print("First Buy: N/A")
-            print(f"Total Profit: ${round(total_profit, 2)}")
-            print(f"Final Percentage: {round(final_percentage, 2)}%")
-
-        return total_profit, final_percentage, final_percentage
+        with METRICS.timer("SimpleMovingAverage.simulate", items=len(prices)):
+            results = SimpleMovingAverage.__kernel__(
+                prices, days, short=short, ledger=log_buy_sell or ledger
+            )
+        return SimpleMovingAverage.report(*results, log_buy_sell, log_res, ledger)
 
 
 class MeanReversion(TradingAlgorithms):
+    # Sell above the upper band, otherwise buy below the lower one, comparing
+    # rounded prices to the average of the previous `days` of them
+    SPEC = StrategySpec(
+        [(SELL_SIDE, True, 1), (BUY_SIDE, False, -1)],
+        rounded=True,
+        exclusive=True,
+        buy_advice=True,
+    )
+    LABELS = dict(BollingerBands.LABELS, first_buy="First Buy:        $")
+
     @staticmethod
     def simulate(
-        prices, days=5, percent_diff=5, short=False, log_buy_sell=False, log_res=False
+        prices,
+        days=5,
+        percent_diff=5,
+        short=False,
+        log_buy_sell=False,
+        log_res=False,
+        ledger=False,
     ):
         """
         Purpose:
@@ -239,100 +850,133 @@ class MeanReversion(TradingAlgorithms):
               default=False
             - log_res: whether to print all buys and sells to the console
               default=False
+            - ledger: Whether to also return every trade as a TRADE_DTYPE array
+              default=False
         Returns:
             - profit: The total profit made using this strategy
             - return_percentage: The percentage gain or loss using this strategy
             - first_buy: The first stock price the algorithm bought in at
+            - trades: (only if ledger) The entries, exits, sides, prices and
+              profit of every trade, the last one may still be open
         """
 
-        # Initialize values before the loop
-        working_list = []
-        prev_avg = 0
-        profit = 0
-        sell, buy = None, None
-        first_buy = None
-        diff = percent_diff * 0.01  # we want it in a decimal percent
-
-        # Loop through each line in the file
-        i = 0
-        for price in prices:
-            curr_price = round(price, 2)  # to round the price to 2 decimals
-            prev_avg = MeanReversion.__list_avg__(working_list)
-
-            # Only check if we should buy if we have at 5 elements
-            if len(working_list) == days:
-                # If the price is +/- percent_diff from the moving average do something
-                if curr_price > prev_avg * (1 + diff):
-                    # Sell
-                    if buy:
-                        if i == len(prices) - 1:
-                            print(f"You should sell this stock today")
-                        else:
-                            profit += curr_price - buy
-                            if log_buy_sell:
-                                print(f"Selling at:       ${round(curr_price, 2)}")
-                                print(
-                                    f"Trade Profit:     ${round(curr_price - buy, 2)}"
-                                )
-                            buy = None
-                    # Sell short
-                    elif short and not sell:
-                        if i == len(prices) - 1:
-                            print(f"You should short sell this stock today")
-                        else:
-                            sell = curr_price
-                            if log_buy_sell:
-                                print(f"Short Selling at: ${round(curr_price, 2)}")
-
-                elif curr_price < prev_avg * (1 - diff):
-                    # Buy the short back
-                    if i == len(prices) - 1:
-                        print(f"You should buy this stock today")
-                    else:
-                        if short and sell:
-                            profit += sell - curr_price
-                            if log_buy_sell:
-                                print(f"Buying at:        ${round(curr_price, 2)}")
-                                print(
-                                    f"Trade Profit:     ${round(sell - curr_price, 2)}"
-                                )
-                            if not first_buy:
-                                first_buy = curr_price
-                                if log_buy_sell:
-                                    print(f"First Buy:        ${round(curr_price, 2)}")
-                            sell = None
-
-                        elif not buy:
-                            buy = curr_price
-                            if log_buy_sell:
-                                print(f"Buying at:        ${round(curr_price, 2)}")
-
-                            if not first_buy:
-                                first_buy = curr_price
-                                if log_buy_sell:
-                                    print(f"First Buy:        ${round(curr_price, 2)}")
-
-            # Add the curr_price to the working average list
-            working_list.append(curr_price)
-            if len(working_list) > days:
-                working_list.pop(0)
-
-            i += 1
+        with METRICS.timer("MeanReversion.simulate", items=len(prices)):
+            results = MeanReversion.__kernel__(
+                prices, days, percent_diff, short, ledger=log_buy_sell or ledger
+            )
+        return MeanReversion.report(*results, log_buy_sell, log_res, ledger)
 
+    @staticmethod
+    def __results__(profit, first_buy):
+        """
+        Purpose: Returns the (profit, return_percentage, first_buy) tuple simulate
+            returns for a run's totals
+        """
         return_percentage = 100 * profit / first_buy if first_buy else 0
+        return profit, return_percentage, first_buy
 
-        # Print out the results
-        if log_res:
-            if log_buy_sell:
-                print("---------------------------")
-            if first_buy:
-                print(f"First Buy: ${round(first_buy, 2)}")
-            else:
-                print("First Buy: N/A")
-            print(f"Total Profit:       {round(profit, 2)}")
-            print(f"Percentage Returns: {round(return_percentage, 2)}%")
+    @staticmethod
+    def __print_results__(profit, return_percentage, _):
+        print(f"Total Profit:       {round(profit, 2)}")
+        print(f"Percentage Returns: {round(return_percentage, 2)}%")
 
-        return profit, return_percentage, first_buy
+    @staticmethod
+    def sweep(
+        prices,
+        day_range=range(1, 10),
+        diff_range=range(-10, 10),
+        short=False,
+        segments=None,
+    ):
+        """
+        Purpose: Runs the mean reversion algorithm for every combination of days
+            and percent differences at once. The rounded prices and their prefix
+            sums are built once, each moving average once per day count, and all
+            of the percent differences are compared against it together.
+        Inputs:
+            - prices: a list or NumPy array of prices to run the method on
+            - day_range: A range of integers greater than 0 to test the best amount
+                of days to perform the average over
+            - diff_range: A range of percentages to try for the mean reversion; a diff
+                of +/- 5% would be represented by diff=5
+            - short: Whether the simulation is allowed to sell short
+            - segments: (optional) A list of (start, stop) ranges of the prices to
+                score separately, as if each had been run on prices[start:stop].
+                The bands are still only worked out once over the whole series.
+        Returns: A SWEEP_DTYPE record array with one row per (days, diff) pair, in
+            the same order as looping over day_range and then diff_range, and one
+            column per segment if segments were given. starting_price is nan when
+            the algorithm never bought.
+        """
+        day_list, diffs = list(day_range), list(diff_range)
+        shape = (len(day_list) * len(diffs),)
+        if segments is not None:
+            shape += (len(segments),)
+        chunks = list(
+            MeanReversion.__sweep_chunks__(prices, day_list, diffs, short, segments)
+        )
+        return np.concatenate(chunks) if chunks else np.zeros(shape, SWEEP_DTYPE)
+
+    @staticmethod
+    def __sweep_chunks__(prices, day_range, diff_range, short=False, segments=None):
+        """
+        Purpose: Does the work of sweep a bounded block of rows at a time
+        Returns: A generator of SWEEP_DTYPE tables whose rows, one after the
+            other, are the rows of sweep
+        """
+        prices = MeanReversion.SPEC.prices(prices)
+        sums = MeanReversion.__prefix_sums__(prices)
+        diffs = np.asarray(list(diff_range), dtype=np.float64)
+        if segments is not None:
+            segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2)
+
+        # Keep the (diffs x bars) work arrays to a bounded size
+        chunk = max(1, SWEEP_CHUNK // max(len(prices), 1))
+        for days in day_range:
+            for start in range(0, len(diffs), chunk):
+                classes = MeanReversion.SPEC.classes(
+                    prices, days, diffs[start : start + chunk], sums=sums
+                )
+                # A segment's first `days` bars only fill its window, so its
+                # trading starts that much later
+                warmed = None if segments is None else segments + [days, 0]
+                profit, first_buy, trades, _, _ = MeanReversion.__run_signal_grid__(
+                    prices, classes, short, segments=warmed
+                )
+
+                table = np.zeros(profit.shape, dtype=SWEEP_DTYPE)
+                # Broadcasts a value per row across the segment columns
+                per_row = (-1,) + (1,) * (table.ndim - 1)
+                table["mvg_avg_days"] = days
+                table["percent_diff"] = diffs[start : start + chunk].reshape(per_row)
+                table["total_profit"] = profit
+                table["starting_price"] = first_buy
+                table["trades"] = trades
+
+                bought = ~np.isnan(first_buy) & (first_buy != 0)
+                np.divide(
+                    100 * table["total_profit"],
+                    table["starting_price"],
+                    out=table["percent_gain"],
+                    where=bought,
+                )
+                yield table
+
+    @staticmethod
+    def __split_segments__(length, data_splits):
+        """
+        Purpose: Finds the (start, stop) ranges get_best_settings splits a price
+            list of `length` into for a number of data splits
+        """
+        size = length // (data_splits + 1)
+        splits = [slice(0, size - 1)]
+        for i in range(1, data_splits):
+            stop = None if i + 1 == data_splits else (i + 1) * size - 1
+            splits.append(slice(i * size, stop))
+
+        # Resolve negative and open ends the way slicing the prices would
+        bars = range(length)
+        return [(bars[split].start, bars[split].stop) for split in splits]
 
     @staticmethod
     def get_best_settings(
@@ -343,6 +987,8 @@ class MeanReversion(TradingAlgorithms):
         data_splits=0,
         combine_results=True,
         extra_label="",
+        search="exhaustive",
+        workers=1,
     ):
         """
         Purpose: Find the best settings for the mean reversion
@@ -354,118 +1000,610 @@ class MeanReversion(TradingAlgorithms):
             - diff_range: A range of percentages to try for the mean reversion; a diff
                 of +/- 10% would be represented by diff=10
             - data_splits: How many times the data should be split and then have the
-                profits averaged. Defaults to testing as one data set
+                profits averaged. Defaults to testing as one data set. A list or
+                range of split counts checks each of them and averages the results.
+                Every segment of every split count is scored in the same sweep.
             - extra_label: Extra label to add to the end of the dictionary key
+            - search: "exhaustive" scores every setting on all of the data and
+                "halving" runs halving_search instead, which only works on one
+                data set (data_splits=0) with combined results and a num_best
+            - workers: How many processes a halving search is spread over
         Returns:
             - best_days: A list containing the best days each in order in dictionary form
         """
+        if search == "halving":
+            assert data_splits == 0 and combine_results and num_best > 0
+            return MeanReversion.halving_search(
+                prices, num_best, day_range, diff_range, workers=workers
+            )
+        assert search == "exhaustive"
 
-        def get_best_for_range(
-            prices=prices, day_range=day_range, diff_range=diff_range, extra_label=""
-        ):
-            """
-            Purpose: Run the mean reversion algorithm on a range of days and difference
-                percentages to see what the best input values are for a stock
-            Inputs:
-                - prices: The price list to run the mean reversion algorithm on
-                - day_range: A range of integers greater than 0 to test the best amount
-                    of days to perform the average over
-                - diff_range: A range of percentages to try for the mean reversion; a diff
-                    of +/- 5% would be represented by diff=5
-                - extra_label: The extra label to add to the dictionary key
-            Returns:
-                - best_days: A list containing the best days each in order in dictionary form
-            """
-            best_days_dict = {}
-            for days in day_range:
-                for diff in diff_range:
-                    (
-                        total_profit,
-                        final_percentage,
-                        starting_price,
-                    ) = MeanReversion.simulate(prices, days=days, percent_diff=diff)
+        results, labels = MeanReversion.sweep_results(
+            prices, day_range, diff_range, data_splits, combine_results, extra_label
+        )
+        day_list, diff_list = list(day_range), list(diff_range)
+        combinations = len(day_list) * len(diff_list)
+
+        # If num_best is -1 then return a full dictionary instead of a list
+        if num_best == -1:
+            rows = results.to_array()
+            rows = rows[np.argsort(rows["row"], kind="stable")]
+        else:
+            rows = results.top(num_best, "total_profit", tiebreak="row")
 
-                    best_days_dict[f"{days}_days_{diff}_diff{extra_label}"] = {
+        # Only the rows asked for become dictionaries
+        best_days = []
+        for row in rows.tolist():
+            label, combination = divmod(row[0], combinations)
+            days = day_list[combination // len(diff_list)]
+            diff = diff_list[combination % len(diff_list)]
+            total_profit, percent_gain, starting_price, data_points = row[3:]
+            key = f"{days}_days_{diff}_diff{labels[label]}"
+            best_days.append(
+                (
+                    key,
+                    {
                         "total_profit": total_profit,
-                        "percent_gain": final_percentage,
+                        "percent_gain": percent_gain,
                         "mvg_avg_days": days,
                         "percent_diff": diff,
-                        "starting_price": starting_price,
-                        "data_points": 1,
-                    }
-
-            return best_days_dict
-
-        def _combine_results(best_days1, best_days2):
-            """
-            Purpose: Combines two dictionaries of type best_days into one
-            Inputs:
-                - best_days 1 and 2: dictionaries of type best_days
-            Returns: Returns a copy of the combined best_days dictionary
-            """
-            best_days = copy.deepcopy(best_days1)
-            for day in best_days:
-                best_days[day]["total_profit"] += best_days2[day]["total_profit"]
-                best_days[day]["data_points"] += best_days2[day]["data_points"]
-                best_days[day]["percent_gain"] += best_days2[day]["percent_gain"]
-            return best_days
-
-        if type(data_splits) == range or type(data_splits) == list:
-            for num in data_splits:
-                ex_label = (
-                    extra_label + str(num) if not combine_results else extra_label
+                        "starting_price": (
+                            None if np.isnan(starting_price) else starting_price
+                        ),
+                        "data_points": data_points,
+                    },
                 )
-                bd = MeanReversion.get_best_settings(
-                    prices=prices,
-                    num_best=-1,
-                    day_range=day_range,
-                    diff_range=diff_range,
-                    data_splits=num,
-                    extra_label=ex_label,
-                    combine_results=combine_results,
-                )
-                if data_splits[0] == num:
-                    best_days = bd
-                elif not combine_results:
-                    best_days.update(bd)
-                else:
-                    best_days = _combine_results(best_days, bd)
+            )
+        if num_best == -1:
+            return dict(best_days)
+        return [settings for _, settings in best_days]
 
-            # Average all data because it was multiple runs of same data
-            for day in best_days:
-                best_days[day]["total_profit"] /= len(data_splits)
-                best_days[day]["percent_gain"] /= len(data_splits)
+    @staticmethod
+    def sweep_results(
+        prices,
+        day_range=range(1, 10),
+        diff_range=range(-10, 10),
+        data_splits=0,
+        combine_results=True,
+        extra_label="",
+        max_bytes=SWEEP_RESULT_BYTES,
+    ):
+        """
+        Purpose: Scores every setting the way get_best_settings does into a table
+            of BEST_DTYPE rows, which is spilled to disk once it passes max_bytes
+            so sweeps of any size can be ranked and filtered
+        Inputs:
+            - the first six are the same as get_best_settings
+            - max_bytes: The most memory the rows may use before they are spilled
+        Returns:
+            - results: A SweepResults of one row per setting, or per setting and
+                segment if the results are not combined
+            - labels: The extra label of each row's key, labels[row // settings]
+        """
+        # Every split scheme is scored in one sweep, each segment a column of it
+        many_splits = type(data_splits) in (range, list)
+        schemes = list(data_splits) if many_splits else [data_splits]
+        segments, columns = [], []
+        for num in schemes:
+            assert num >= 0
+            splits = MeanReversion.__split_segments__(len(prices), num)
+            columns.append(range(len(segments), len(segments) + len(splits)))
+            segments += splits
 
-        else:
-            assert data_splits >= 0
-            length = len(prices) // (data_splits + 1)
-            best_days = get_best_for_range(
-                prices[0 : length - 1], extra_label=extra_label
-            )
-            for i in range(1, data_splits):
-                ex_label = extra_label + str(i) if not combine_results else extra_label
+        # Running a scheme again from its first entry starts over, so only the
+        # schemes from the last restart count
+        first = max(i for i, num in enumerate(schemes) if num == schemes[0])
+        labels, label_columns = [extra_label], []
+        if not combine_results:
+            labels = []
+            for num, scheme_columns in zip(schemes[first:], columns[first:]):
+                label = extra_label + str(num) if many_splits else extra_label
+                for i, column in enumerate(scheme_columns):
+                    labels.append(label + str(i) if i else label)
+                    label_columns.append(column)
+
+        day_range, diff_range = list(day_range), list(diff_range)
+        combinations = len(day_range) * len(diff_range)
+        results = SweepResults(BEST_DTYPE, max_bytes)
+        start = 0
+        for table in MeanReversion.__sweep_chunks__(
+            prices, day_range, diff_range, segments=segments
+        ):
+            settings = np.arange(start, start + len(table))
+            start += len(table)
+            rows = np.zeros(len(table), dtype=BEST_DTYPE)
+            rows["mvg_avg_days"] = table["mvg_avg_days"][:, 0]
+            rows["percent_diff"] = table["percent_diff"][:, 0]
+
+            for label, column in enumerate(label_columns):
+                rows["row"] = label * combinations + settings
+                rows["total_profit"] = table["total_profit"][:, column]
+                rows["percent_gain"] = table["percent_gain"][:, column]
+                rows["starting_price"] = table["starting_price"][:, column]
+                rows["data_points"] = 1
+                MeanReversion.__average_splits__(rows, len(schemes), many_splits)
+                results.append(rows)
+            if not combine_results:
+                continue
 
-                if i + 1 == data_splits:
-                    bd = get_best_for_range(prices[i * length :], extra_label=ex_label)
+            # Add up the segments of each scheme and then the schemes
+            profit = gain = None
+            for scheme_columns in columns[first:]:
+                scheme_profit = table["total_profit"][:, scheme_columns[0]].copy()
+                scheme_gain = table["percent_gain"][:, scheme_columns[0]].copy()
+                for column in scheme_columns[1:]:
+                    scheme_profit += table["total_profit"][:, column]
+                    scheme_gain += table["percent_gain"][:, column]
+                if profit is None:
+                    profit, gain = scheme_profit, scheme_gain
                 else:
-                    bd = get_best_for_range(
-                        prices[i * length : (i + 1) * length - 1], extra_label=ex_label
-                    )
+                    profit += scheme_profit
+                    gain += scheme_gain
+            rows["row"] = settings
+            rows["total_profit"] = profit
+            rows["percent_gain"] = gain
+            rows["starting_price"] = table["starting_price"][:, columns[first][0]]
+            rows["data_points"] = sum(len(c) for c in columns[first:])
+            MeanReversion.__average_splits__(rows, len(schemes), many_splits)
+            results.append(rows)
+        return results, labels
+
+    @staticmethod
+    def __average_splits__(rows, schemes, many_splits):
+        # Average all data because it was multiple runs of same data
+        if many_splits:
+            rows["total_profit"] /= schemes
+            rows["percent_gain"] /= schemes
+
+    @staticmethod
+    def halving_search(
+        prices,
+        num_best=5,
+        day_range=range(1, 10),
+        diff_range=range(-10, 10),
+        eta=HALVING_ETA,
+        workers=1,
+        short=False,
+    ):
+        """
+        Purpose: Finds the best settings by successive halving instead of scoring
+            every one on all of the data. Every setting is scored on the latest
+            few bars, the best 1 / eta of them on eta times as many and so on
+            until the last num_best are scored on the full history, keeping only
+            a heap of the leaders of each round.
+        Inputs:
+            - prices: The price list to run the mean reversion algorithm on
+            - num_best: The number of best settings to return
+            - day_range, diff_range: The settings to search, as in get_best_settings
+            - eta: How many times fewer settings each round keeps
+            - workers: How many processes the day counts of a round are spread over
+            - short: Whether the simulation is allowed to sell short
+        Returns: The same list of result dictionaries as get_best_settings with one
+            data split. Early rounds only see the latest bars, so the settings it
+            finds can differ from an exhaustive search when profits on part of the
+            history say little about profits on all of it.
+        """
+        # Score the same bars as get_best_settings does with no splits
+        _, stop = MeanReversion.__split_segments__(len(prices), 0)[0]
+        history = np.asarray(prices, dtype=np.float64)[:stop]
+        combinations = list(itertools.product(day_range, diff_range))
+        alive = list(range(len(combinations)))
+        if not alive or num_best <= 0:
+            return []
+
+        # Only as many rounds as there are slices shorter than the full history
+        shortest = min(stop, max(HALVING_MIN_BARS, 2 * max(day_range)))
+        rounds = 0
+        if len(alive) > num_best and stop > shortest:
+            rounds = int(math.log(len(alive) / num_best, eta))
+            rounds = min(rounds, int(math.log(stop / shortest, eta)))
+
+        pool = concurrent.futures.ProcessPoolExecutor(workers) if workers > 1 else None
+        try:
+            for level in range(rounds, -1, -1):
+                bars = max(shortest, stop // eta**level)
+                keep = num_best
+                if level:
+                    keep = max(num_best, math.ceil(len(alive) / eta))
 
-                if combine_results:
-                    best_days = _combine_results(best_days, bd)
+                # One sweep per day count over its surviving percent differences
+                by_days = collections.defaultdict(list)
+                for index in alive:
+                    by_days[combinations[index][0]].append(index)
+                jobs = [
+                    (
+                        history[len(history) - bars :],
+                        days,
+                        [combinations[index][1] for index in indexes],
+                        short,
+                    )
+                    for days, indexes in by_days.items()
+                ]
+                if pool:
+                    tables = pool.map(MeanReversion.__score_days__, *zip(*jobs))
                 else:
-                    best_days.update(bd)
+                    tables = (MeanReversion.__score_days__(*job) for job in jobs)
 
-        # If num_best is -1 then return a full dictionary instead of a list
-        if num_best == -1:
-            return best_days
+                # Ties go to the earlier setting, like the stable sort of
+                # get_best_settings
+                leaders, rows = [], {}
+                for indexes, table in zip(by_days.values(), tables):
+                    for index, row in zip(indexes, table):
+                        rows[index] = row
+                        entry = (float(row["total_profit"]), -index)
+                        if len(leaders) < keep:
+                            heapq.heappush(leaders, entry)
+                        else:
+                            heapq.heappushpop(leaders, entry)
+                leaders.sort(reverse=True)
+                alive = [-index for _, index in leaders]
+        finally:
+            if pool:
+                pool.shutdown()
+
+        best_days = []
+        for index in alive:
+            days, diff = combinations[index]
+            row = rows[index]
+            starting_price = float(row["starting_price"])
+            best_days.append(
+                {
+                    "total_profit": float(row["total_profit"]),
+                    "percent_gain": float(row["percent_gain"]),
+                    "mvg_avg_days": days,
+                    "percent_diff": diff,
+                    "starting_price": (
+                        None if np.isnan(starting_price) else starting_price
+                    ),
+                    "data_points": 1,
+                }
+            )
+        return best_days
+
+    @staticmethod
+    def __score_days__(prices, days, diffs, short):
+        """
+        Purpose: Scores one day count against a list of percent differences for a
+            round of halving_search (in a worker process if there are several)
+        """
+        return MeanReversion.sweep(prices, [days], diffs, short)
+
+
+class StrategyPipeline:
+    """
+    Purpose: Runs many strategies and settings over the same prices in a single
+        pass. Every moving average is found once and shared by all the runs that
+        compare against it, and all the runs that trade at the same prices go
+        through the signal grid together. A new strategy only needs a SPEC.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def add(self, name, strategy, days=5, percent_diff=5, short=False):
+        """
+        Purpose: Registers a strategy and its settings to be run
+        Inputs:
+            - name: The key the results are returned under
+            - strategy: A TradingAlgorithms class with a SPEC, like BollingerBands
+            - days: The number of days used to calculate the average
+            - percent_diff: The percent difference to compare to the mean average
+                (ignored by strategies with a fixed one)
+            - short: Whether the run is allowed to sell short
+        Returns: The pipeline, so adds can be chained
+        """
+        spec = strategy.SPEC
+        if spec.percent_diff is not None:
+            percent_diff = spec.percent_diff
+        self.runs.append((name, spec, days, percent_diff, short))
+        return self
+
+    def run(self, prices, ledger=False):
+        """
+        Purpose: Runs every registered strategy over the prices
+        Inputs:
+            - prices: a list or NumPy array of prices to run the strategies on
+            - ledger: Whether to also build the trade ledger of every run
+        Returns: A dictionary of name to the (total_profit, first_buy, advice,
+            trades) a strategy's __kernel__ returns, which its report can print
+        """
+        items = len(prices) * len(self.runs)
+        with METRICS.timer("StrategyPipeline.run", items=items):
+            return self.__run__(prices, ledger)
+
+    def __run__(self, prices, ledger):
+        # The prices each kind of strategy trades at, with their prefix sums
+        sources = {}
+        for _, spec, _, _, _ in self.runs:
+            if spec.rounded not in sources:
+                traded = spec.prices(prices)
+                sums = TradingAlgorithms.__prefix_sums__(traded)
+                sources[spec.rounded] = traded, sums
+
+        # One moving average per prices, days and lag, checked against every band
+        # that is compared to it
+        indicators = collections.defaultdict(list)
+        for _, spec, days, percent_diff, _ in self.runs:
+            indicators[spec.rounded, days, spec.lag].append(percent_diff)
+        averages = {}
+        for (rounded, days, lag), percent_diffs in indicators.items():
+            traded, sums = sources[rounded]
+            if len(traded) > days and (days > 0 or not lag):
+                averages[rounded, days, lag] = TradingAlgorithms.__moving_average__(
+                    traded, days, percent_diffs, lag=lag, sums=sums
+                )
+
+        # Runs that trade at the same prices with the same shorting rule share one
+        # pass of the signal grid
+        groups = collections.defaultdict(list)
+        for index, (_, spec, _, _, short) in enumerate(self.runs):
+            groups[spec.rounded, short].append(index)
+
+        results = {}
+        for (rounded, short), indices in groups.items():
+            traded = sources[rounded][0]
+            classes = np.zeros((len(indices), len(traded)), dtype=np.int8)
+            for row, index in enumerate(indices):
+                _, spec, days, percent_diff, _ = self.runs[index]
+                average = averages.get((rounded, days, spec.lag))
+                classes[row] = spec.classes(traded, days, percent_diff, average)[0]
+
+            outputs = TradingAlgorithms.__run_signal_grid__(
+                traded, classes, short, ledger
+            )
+            total_profit, first_buy, trades, last_class, last_action = outputs[:5]
+            for row, index in enumerate(indices):
+                name, spec = self.runs[index][:2]
+                run_trades = None
+                if ledger:
+                    run_trades = outputs[5][outputs[5]["run"] == row]
+                    run_trades["run"] = 0
+                results[name] = (
+                    float(total_profit[row]) if trades[row] else 0,
+                    None if np.isnan(first_buy[row]) else float(first_buy[row]),
+                    spec.advice(last_class[row], last_action[row]),
+                    run_trades,
+                )
+
+        # In the order the runs were added
+        return {name: results[name] for name, _, _, _, _ in self.runs}
+
+
+class StrategyEngine:
+    """
+    Purpose: Keeps the state of a strategy between bars so the signal for a new bar
+        takes constant time instead of re-running simulate over the whole history.
+        The latest bar is treated like the final bar of simulate: its action is
+        returned as advice and only carried out once the next bar arrives, so after
+        feeding a full history the results match simulate exactly.
+    """
+
+    def __init__(
+        self, days=5, percent_diff=0, short=False, window_size=None, ledger=False
+    ):
+        """
+        Inputs:
+            - days: The number of days used to calculate the average
+            - percent_diff: The percent difference to compare to the mean average
+            - short: Whether the strategy is allowed to sell short
+            - window_size: How many prices the rolling window holds (default days)
+            - ledger: Whether to keep every trade like simulate's ledger
+        """
+        self.days = days
+        self.percent_diff = percent_diff
+        self.diff = percent_diff * 0.01
+        self.short = short
+
+        next_state, actions = NEXT_STATE.copy(), ACTIONS.copy()
+        if not short:
+            next_state[SELL_SIDE, FLAT] = FLAT
+            actions[SELL_SIDE, FLAT] = NO_ACTION
+        self.next_state, self.actions = next_state.tolist(), actions.tolist()
+
+        # Ring buffer of the averaged prices with a compensated running sum
+        self.window = collections.deque()
+        self.window_size = days if window_size is None else window_size
+        self.window_sum, self.window_error = 0.0, 0.0
+        self.bars = 0
+
+        self.state = FLAT
+        self.entry = None  # The price the open position was entered at
+        self.total_profit = 0
+        self.first_buy = None
+        self.pending = None  # (price, bar class) of the latest bar
+        # [run, side, entry_index, entry_price, exit_index, exit_price, profit]
+        self.trades = [] if ledger else None
+
+    def __add_to_sum__(self, value):
+        # Neumaier summation keeps the running sum from drifting over long streams
+        total = self.window_sum + value
+        if abs(self.window_sum) >= abs(value):
+            self.window_error += (self.window_sum - total) + value
+        else:
+            self.window_error += (value - total) + self.window_sum
+        self.window_sum = total
+
+    def push(self, price):
+        """
+        Purpose: Adds a price to the rolling window, dropping the oldest one once
+            the window is full
+        """
+        self.window.append(price)
+        self.__add_to_sum__(price)
+        if len(self.window) > self.window_size:
+            self.__add_to_sum__(-self.window.popleft())
+
+    def average(self, price):
+        """
+        Purpose: Returns sum(window) / days. Averages that put the price within
+            rounding error of a band edge are redone with the builtin sum so ties
+            break exactly like simulate.
+        """
+        if self.days == 0:
+            return 0
+        average = (self.window_sum + self.window_error) / self.days
+        for edge in (average * (1 - self.diff), average * (1 + self.diff)):
+            if abs(price - edge) <= 1e-9 * abs(edge):
+                return sum(self.window) / self.days
+        return average
+
+    def classify(self, price):
+        """
+        Purpose: Updates the rolling window with a new price and returns the trade
+            price and bar class (HOLD, BUY_SIDE, SELL_SIDE or BOTH_SIDES) for it
+        """
+        raise NotImplementedError
+
+    def update(self, price):
+        """
+        Purpose: Feeds the next price into the strategy
+        Returns: The action (BUY, SELL, SHORT_SELL, COVER or NO_ACTION) the strategy
+            would take on this bar
+        """
+        if self.pending:
+            self.__apply__(*self.pending)
+        trade_price, bar_class = self.classify(price)
+        self.pending = (trade_price, bar_class)
+        self.bars += 1
+        return self.actions[bar_class][self.state]
+
+    def __apply__(self, price, bar_class):
+        action = self.actions[bar_class][self.state]
+        # The pending bar is the one before the latest
+        index = self.bars - 1
+        if action == BUY or action == SHORT_SELL:
+            self.entry = price
+            if self.trades is not None:
+                side = 1 if action == BUY else -1
+                self.trades.append([0, side, index, price, -1, np.nan, np.nan])
+        elif action == SELL or action == COVER:
+            profit = price - self.entry if action == SELL else self.entry - price
+            self.total_profit += profit
+            if self.trades is not None:
+                self.trades[-1][4:] = [index, price, profit]
+        if (action == BUY or action == COVER) and not self.first_buy:
+            self.first_buy = price
+        self.state = self.next_state[bar_class][self.state]
+
+    def advice(self):
+        """
+        Purpose: Returns what simulate would print for the latest bar (or None)
+        """
+        if not self.pending:
+            return None
+        return ADVICE.get(self.actions[self.pending[1]][self.state])
+
+    def results(self):
+        """
+        Purpose: Returns the same (total_profit, final_percentage, final_percentage)
+            tuple as simulate over every price fed in so far
+        """
+        first_buy = self.first_buy
+        final_percentage = (self.total_profit / first_buy) * 100 if first_buy else 0
+        return self.total_profit, final_percentage, final_percentage
+
+    def outputs(self):
+        """
+        Purpose: Returns the (total_profit, first_buy, advice, trades) a strategy's
+            __kernel__ returns over every price fed in so far, which its report can
+            print. trades is the TRADE_DTYPE ledger, None unless kept.
+        """
+        trades = None
+        if self.trades is not None:
+            trades = np.array([tuple(trade) for trade in self.trades], TRADE_DTYPE)
+        return self.total_profit, self.first_buy, self.advice(), trades
+
+    def resume(self, prices, total_profit, first_buy, trades):
+        """
+        Purpose: Puts a new engine in the state it would reach by being fed every
+            price, from what __kernel__ or a StrategyPipeline returned for them, so
+            a finished run can be carried on without replaying it bar by bar.
+            Only the last bars are fed, to fill the rolling window and classify
+            the latest bar.
+        Inputs:
+            - prices: The prices the run was over
+            - total_profit, first_buy, trades: What the run returned, trades being
+                its TRADE_DTYPE ledger
+        Returns: The engine
+        """
+        for price in np.asarray(prices)[-(self.days + 2) :].tolist():
+            self.update(price)
+
+        self.bars = len(prices)
+        self.total_profit = total_profit
+        self.first_buy = first_buy
+        self.state, self.entry = FLAT, None
+        if len(trades) and trades["exit_index"][-1] < 0:
+            self.state = LONG if trades["side"][-1] > 0 else SHORT
+            self.entry = float(trades["entry_price"][-1])
+        if self.trades is not None:
+            self.trades = [list(trade) for trade in trades.tolist()]
+        return self
+
+
+class BollingerBandsEngine(StrategyEngine):
+    def __init__(self, days=5, percent_diff=5, short=False, ledger=False):
+        assert days > 0
+        # The average leaves out the latest price: sum(prices[i - days : i - 1])
+        super().__init__(days, percent_diff, short, days - 1, ledger)
+        self.previous = None
+
+    def classify(self, price):
+        bar_class = HOLD
+        if self.bars >= self.days:
+            moving_average = self.average(price)
+            above = price > moving_average * (1 - self.diff)
+            below = price < moving_average * (1 + self.diff)
+            bar_class = above * BUY_SIDE + below * SELL_SIDE
+
+        if self.previous is not None and self.window_size > 0:
+            self.push(self.previous)
+        self.previous = price
+        return price, bar_class
+
+
+class SimpleMovingAverageEngine(BollingerBandsEngine):
+    def __init__(self, days=5, short=False, ledger=False):
+        # A zero width band is exactly the plain moving average comparison
+        super().__init__(days, 0, short, ledger)
+
+
+class MeanReversionEngine(StrategyEngine):
+    def __init__(self, days=5, percent_diff=5, short=False, ledger=False):
+        super().__init__(days, percent_diff, short, ledger=ledger)
+
+    def classify(self, price):
+        curr_price = round(price, 2)
+        bar_class = HOLD
+        if len(self.window) == self.days:
+            prev_avg = self.average(curr_price)
+            if curr_price > prev_avg * (1 + self.diff):
+                bar_class = SELL_SIDE
+            elif curr_price < prev_avg * (1 - self.diff):
+                bar_class = BUY_SIDE
+
+        if self.days > 0:
+            self.push(curr_price)
+        return curr_price, bar_class
+
+    def advice(self):
+        if self.pending and self.pending[1] == BUY_SIDE:
+            return ADVICE[BUY]
+        return super().advice()
+
+    def results(self):
+        """
+        Purpose: Returns the same (profit, return_percentage, first_buy) tuple as
+            simulate over every price fed in so far
+        """
+        first_buy = self.first_buy
+        return_percentage = 100 * self.total_profit / first_buy if first_buy else 0
+        return self.total_profit, return_percentage, first_buy
 
-        # TODO: optimize`
-        best_days_list = []
-        for day in best_days:
-            best_days_list.append(best_days[day])
 
-        return sorted(
-            best_days_list, reverse=True, key=lambda day: day["total_profit"]
-        )[:num_best]
+# The incremental engine of each strategy, by its SPEC
+ENGINES = {
+    BollingerBands.SPEC: BollingerBandsEngine,
+    SimpleMovingAverage.SPEC: SimpleMovingAverageEngine,
+    MeanReversion.SPEC: MeanReversionEngine,
+}
@@ -1,13 +1,46 @@
-import csv
+import argparse
+import concurrent.futures
+import contextlib
+import io
 import json
 import pathlib
-from AlpacaTrade import AlpacaTrade
-from TradingAlgorithms import BollingerBands, MeanReversion, SimpleMovingAverage
+import time
+from BarCache import MAX_SYMBOLS
+from BarStore import BarStore
+from Metrics import METRICS
+from ResultStore import ResultStore
+from TradingAlgorithms import (
+    BollingerBands,
+    MeanReversion,
+    SimpleMovingAverage,
+    StrategyPipeline,
+)
 
 # TODO: Implament short selling
 
 # Static vars
 YEAR_OF_STOCKS = 252  # How many days the stock market is open a year
+WORKERS = 1  # Tickers fetched and simulated at once (1 runs everything serially)
+PROFILE = False  # Whether to time every stage and save it to metrics.json
+TICKERS = [
+    "AAPL",
+    "ADBE",
+    "APHA",
+    "GOOG",
+    "IWM",
+    "JNJ",
+    "LNVGY",
+    "PG",
+    "SINT",
+    "SPY",
+    "VISL",
+]
+# Strategies run on every ticker: results key -> (strategy, output title)
+STRATEGIES = {
+    "simple_moving_average": (SimpleMovingAverage, "Moving Average"),
+    "mean_revursion": (MeanReversion, "Mean Reversion"),
+    "bollinger_bands": (BollingerBands, "Bollinger Bands"),
+}
 DP_MEANINGS = {
     "c": "Close",
     "h": "High",
@@ -20,20 +53,17 @@ DP_MEANINGS = {
 # Get the parent directories path so we don't have to hardcode
 path = pathlib.Path().cwd()
 
+# Every fetched bar is kept in data/{ticker}/day/ for later backtests
+DATA_STORE = BarStore(path / "data")
+# Strategy results by the hash of their inputs, so unchanged tickers aren't rerun
+RESULT_STORE = ResultStore(path / "results")
+
 # Save the results to a specified json file
 def save_results(to_json, file_name="results.json"):
     with open(path / file_name, "w") as out_file:
         json.dump(to_json, out_file)
 
 
-def save_prices(to_csv, csv_columns, file_name="data.csv"):
-    with open(path / file_name, "w") as out_file:
-        writer = csv.DictWriter(out_file, fieldnames=csv_columns)
-        writer.writeheader()
-        for data in to_csv:
-            writer.writerow(data)
-
-
 # Generates a range of floats
 def float_range(start=0, stop=1, step=1):
     while start < stop:
@@ -41,87 +71,327 @@ def float_range(start=0, stop=1, step=1):
         start = round(start + step, 3)
 
 
-# Setup the dictionary with tickers and price lists
-tickers = {
-    "AAPL": {},
-    "ADBE": {},
-    "APHA": {},
-    "GOOG": {},
-    "IWM": {},
-    "JNJ": {},
-    "LNVGY": {},
-    "PG": {},
-    "SINT": {},
-    "SPY": {},
-    "VISL": {},
-}
+def fetch_tickers(tickers):
+    """
+    Purpose: Obtains the last year of bars for a list of tickers with batched
+        requests and appends them to the ticker's files in DATA_STORE
+    Returns: A generator of (ticker, closing prices of every stored bar) pairs
+    """
+    # Imported here so the offline commands never load the broker code
+    from AlpacaTrade import AlpacaTrade
+
+    started = time.perf_counter()
+    for ticker, bars in AlpacaTrade.get_historical_data_many(
+        tickers, limit=YEAR_OF_STOCKS, as_series=True
+    ):
+        # The wait for each ticker's bars, not counting the caller's own work
+        seconds = time.perf_counter() - started
+        METRICS.record("analyze.fetch", seconds, ticker, len(bars))
+        with METRICS.timer("analyze.store", ticker, len(bars)):
+            DATA_STORE.append(ticker, "day", bars)
+            # The whole stored history only grows at the end, so RESULT_STORE can
+            # carry on from the last run instead of starting over
+            prices = DATA_STORE.read(ticker, "day").c
+
+        yield ticker, prices
+        started = time.perf_counter()
+
+
+def load_tickers(tickers):
+    """
+    Purpose: Reads the prices of every stored bar of a list of tickers from
+        DATA_STORE, without touching the network. Tickers with no stored bars are
+        skipped.
+    Returns: A generator of (ticker, closing prices) pairs
+    """
+    for ticker in tickers:
+        with METRICS.timer("analyze.load", ticker):
+            bars = DATA_STORE.read(ticker, "day")
+        if len(bars) == 0:
+            print(f"No stored bars for {ticker}, run fetch first")
+            continue
+        yield ticker, bars.c
+
+
+def simulate_ticker(ticker, prices):
+    """
+    Purpose: Runs every strategy on a ticker's prices in one pass, reading back
+        any results RESULT_STORE already has for them. When the prices only add
+        bars to the ones of the ticker's last run, just the new bars are fed to
+        the strategies.
+    Returns:
+        - results: The results dictionary for the ticker
+        - output: Everything the strategies printed, so parallel runs can be shown
+            one ticker at a time
+    """
+    with METRICS.timer("analyze.simulate", ticker, len(prices)):
+        pipeline = StrategyPipeline()
+        for key, (strategy, _) in STRATEGIES.items():
+            pipeline.add(key, strategy, short=True)
+        runs = RESULT_STORE.run(f"{ticker}/day", prices, pipeline)
+
+    results = {}
+    output = io.StringIO()
+    with METRICS.timer("analyze.report", ticker), contextlib.redirect_stdout(output):
+        for key, (strategy, title) in STRATEGIES.items():
+            if results:
+                print()
+            print(f"***{ticker} {title} Strategy Output***")
+            total_profit, final_percentage = strategy.report(
+                *runs[key], log_buy_sell=True, log_res=True
+            )[:2]
+
+            # Record the results to the dictionary
+            results[key] = {
+                "total_profit": total_profit,
+                "final_percentage": final_percentage,
+            }
+        print()
+
+    return results, output.getvalue()
+
+
+def simulate_profiled(ticker, prices):
+    """
+    Purpose: simulate_ticker for a process pool worker, which returns the metrics
+        it recorded along with the results so the parent can merge them
+    """
+    METRICS.reset()
+    METRICS.enable()
+    return simulate_ticker(ticker, prices), METRICS.snapshot()
+
+
+def run_serial(tickers, source=fetch_tickers):
+    """
+    Purpose: Fetches and simulates the tickers one at a time
+    Inputs:
+        - tickers: The dictionary of tickers to fill in with results
+        - source: Where the prices come from, fetch_tickers or load_tickers
+    """
+    for ticker, prices in source(list(tickers)):
+        results, output = simulate_ticker(ticker, prices)
+        print(output, end="")
+        tickers[ticker].update(results)
+
+
+def run_parallel(tickers, workers=WORKERS, source=fetch_tickers):
+    """
+    Purpose: Fetches batches of tickers on a thread pool so the network round trips
+        overlap and simulates them on a process pool as soon as their prices arrive
+    Inputs:
+        - tickers: The dictionary of tickers to fill in with results
+        - workers: How many threads and processes to use
+        - source: Where the prices come from, fetch_tickers or load_tickers
+    """
+    symbols = list(tickers)
+    batches = [
+        symbols[start : start + MAX_SYMBOLS]
+        for start in range(0, len(symbols), MAX_SYMBOLS)
+    ]
+    simulate = simulate_profiled if METRICS.enabled else simulate_ticker
+    with concurrent.futures.ThreadPoolExecutor(workers) as fetchers:
+        with concurrent.futures.ProcessPoolExecutor(workers) as simulators:
+            fetches = [
+                fetchers.submit(lambda batch: list(source(batch)), batch)
+                for batch in batches
+            ]
+            simulations = {}
+            for fetch in concurrent.futures.as_completed(fetches):
+                for ticker, prices in fetch.result():
+                    simulations[ticker] = simulators.submit(simulate, ticker, prices)
+
+            # Print and record in the original ticker order
+            for ticker in tickers:
+                if ticker not in simulations:
+                    continue
+                results, output = simulations[ticker].result()
+                if METRICS.enabled:
+                    (results, output), snapshot = results, output
+                    METRICS.merge(snapshot)
+                print(output, end="")
+                tickers[ticker].update(results)
+
+
+def find_best(tickers):
+    """
+    Purpose: Finds the ticker with the best final percentage for each strategy
+    """
+    best = {}
+
+    max_bb_ticker = max(
+        tickers, key=lambda t: float(tickers[t]["bollinger_bands"]["final_percentage"])
+    )
+    best["bollinger_bands"] = tickers[max_bb_ticker]["bollinger_bands"]
+    best["bollinger_bands"]["ticker"] = max_bb_ticker
+
+    max_mr_ticker = max(
+        tickers, key=lambda t: float(tickers[t]["mean_revursion"]["final_percentage"])
+    )
+    best["mean_revursion"] = tickers[max_mr_ticker]["mean_revursion"]
+    best["mean_revursion"]["ticker"] = max_mr_ticker
+
+    max_sma_ticker = max(
+        tickers,
+        key=lambda t: float(tickers[t]["simple_moving_average"]["final_percentage"]),
+    )
+    best["simple_moving_average"] = tickers[max_sma_ticker]["simple_moving_average"]
+    best["simple_moving_average"]["ticker"] = max_sma_ticker
 
-for ticker in tickers:
-    # Obtain prices
-    data_points = {"c", "h", "l", "o", "t", "v"}  # Must contain "c" for closing
-    data = AlpacaTrade.get_historical_data(
-        ticker, limit=YEAR_OF_STOCKS, to_return=data_points
+    return best
+
+
+def simulate_tickers(symbols, source, workers):
+    """
+    Purpose: Simulates every strategy on each ticker and saves them, with the best
+        ticker of each strategy, to results.json
+    """
+    tickers = {symbol: {} for symbol in symbols}
+    if workers > 1:
+        run_parallel(tickers, workers, source)
+    else:
+        run_serial(tickers, source)
+
+    # Tickers with no prices have no results
+    tickers = {ticker: results for ticker, results in tickers.items() if results}
+    if not tickers:
+        return
+
+    # Show best stock in results.json
+    tickers["best"] = find_best(tickers)
+
+    # Save the results to a json file
+    save_results(tickers, file_name="results.json")
+
+
+def fetch_command(args):
+    for ticker, prices in fetch_tickers(args.tickers):
+        print(f"{ticker}: {len(prices)} bars")
+
+
+def backtest_command(args):
+    simulate_tickers(args.tickers, load_tickers, args.workers)
+
+
+def run_command(args):
+    simulate_tickers(args.tickers, fetch_tickers, args.workers)
+
+
+def sweep_command(args):
+    prices = DATA_STORE.read(args.ticker, "day")[-args.bars :].c
+    if len(prices) == 0:
+        print(f"No stored bars for {args.ticker}, run fetch first")
+        return
+    best = MeanReversion.get_best_settings(
+        prices,
+        num_best=args.num_best,
+        day_range=range(1, args.max_days + 1),
+        diff_range=range(-args.max_diff, args.max_diff),
+        search=args.search,
+        workers=args.workers,
     )
-    # Log data to a csv
-    save_prices(data, data_points, f"data/{ticker}.csv")
+    for settings in best:
+        print(settings)
+
+
+def trade_command(args):
+    # Imported here so the offline commands never load the broker code
+    from AlpacaTrade import AlpacaTrade
+
+    if args.price is None:
+        placed = AlpacaTrade.market_order(args.symbol, args.shares, not args.sell)
+    else:
+        placed = AlpacaTrade.trade_limit(
+            args.symbol, args.shares, args.price, not args.sell
+        )
+    print("Order placed" if placed else "Order not placed")
 
-    # Sanitize data to only prices
-    prices = [price["c"] for price in data]  # "c" is closing price
 
-    # Perform the simple moving average functions
-    print(f"***{ticker} Moving Average Strategy Output***")
-    sma_total_profit, sma_final_percentage, _ = SimpleMovingAverage.simulate(
-        prices, short=True, log_buy_sell=True, log_res=True
+def command_options(workers=True, top_level=False):
+    """
+    Purpose: Builds a parent parser of the options a command takes, so they can be
+        given after the command as well as before it
+    Inputs:
+        - workers: Whether the command spreads its work over --workers
+        - top_level: Whether this is for the top level parser, which holds the
+            defaults. The commands leave out the options they weren't given so
+            they don't undo ones given before the command.
+    """
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument(
+        "--profile",
+        action="store_true",
+        default=PROFILE if top_level else argparse.SUPPRESS,
     )
-    # Perform the mean revursion
-    print(f"\n***{ticker} Mean Reversion Strategy Output***")
-    mr_total_profit, mr_final_percentage, _ = MeanReversion.simulate(
-        prices, short=True, log_buy_sell=True, log_res=True
+    if workers:
+        options.add_argument(
+            "--workers",
+            type=int,
+            default=WORKERS if top_level else argparse.SUPPRESS,
+        )
+    return options
+
+
+def main(argv=None):
+    """
+    Purpose: The command line entry point. Only fetch, run and trade import the
+        broker modules, so backtest and sweep work offline without credentials.
+    """
+    parser = argparse.ArgumentParser(
+        description="Backtest and trade strategies",
+        parents=[command_options(top_level=True)],
     )
-    # Perform the bollinger bands
-    print(f"\n***{ticker} Bollinger Bands Strategy Output***")
-    bb_total_profit, bb_final_percentage, _ = BollingerBands.simulate(
-        prices, short=True, log_buy_sell=True, log_res=True
+    parser.set_defaults(handler=run_command, tickers=TICKERS)
+    commands = parser.add_subparsers()
+    options = command_options()
+    profile_options = command_options(workers=False)
+
+    command = commands.add_parser(
+        "fetch", help="Store a year of bars per ticker", parents=[profile_options]
     )
-    print()
-
-    # Record the results to the dictionary
-    tickers[ticker]["simple_moving_average"] = {
-        "total_profit": sma_total_profit,
-        "final_percentage": sma_final_percentage,
-    }
-    tickers[ticker]["mean_revursion"] = {
-        "total_profit": mr_total_profit,
-        "final_percentage": mr_final_percentage,
-    }
-    tickers[ticker]["bollinger_bands"] = {
-        "total_profit": bb_total_profit,
-        "final_percentage": bb_final_percentage,
-    }
-
-# Show best stock in results.json
-best = {}
-
-max_bb_ticker = max(
-    tickers, key=lambda t: float(tickers[t]["bollinger_bands"]["final_percentage"])
-)
-best["bollinger_bands"] = tickers[max_bb_ticker]["bollinger_bands"]
-best["bollinger_bands"]["ticker"] = max_bb_ticker
+    command.add_argument("tickers", nargs="*", default=TICKERS)
+    command.set_defaults(handler=fetch_command)
 
-max_mr_ticker = max(
-    tickers, key=lambda t: float(tickers[t]["mean_revursion"]["final_percentage"])
-)
-best["mean_revursion"] = tickers[max_mr_ticker]["mean_revursion"]
-best["mean_revursion"]["ticker"] = max_mr_ticker
+    command = commands.add_parser(
+        "backtest", help="Simulate the stored bars", parents=[options]
+    )
+    command.add_argument("tickers", nargs="*", default=TICKERS)
+    command.set_defaults(handler=backtest_command)
 
-max_sma_ticker = max(
-    tickers,
-    key=lambda t: float(tickers[t]["simple_moving_average"]["final_percentage"]),
-)
-best["simple_moving_average"] = tickers[max_sma_ticker]["simple_moving_average"]
-best["simple_moving_average"]["ticker"] = max_sma_ticker
+    command = commands.add_parser(
+        "run", help="Fetch and simulate (the default)", parents=[options]
+    )
+    command.add_argument("tickers", nargs="*", default=TICKERS)
+    command.set_defaults(handler=run_command)
+
+    command = commands.add_parser(
+        "sweep", help="Search mean reversion settings", parents=[options]
+    )
+    command.add_argument("ticker")
+    command.add_argument("--bars", type=int, default=YEAR_OF_STOCKS)
+    command.add_argument("--num-best", type=int, default=5)
+    command.add_argument("--max-days", type=int, default=9)
+    command.add_argument("--max-diff", type=int, default=10)
+    command.add_argument(
+        "--search", choices=["exhaustive", "halving"], default="exhaustive"
+    )
+    command.set_defaults(handler=sweep_command)
+
+    command = commands.add_parser(
+        "trade", help="Place an order", parents=[profile_options]
+    )
+    command.add_argument("symbol")
+    command.add_argument("shares", type=int)
+    command.add_argument("--price", type=float, help="Limit price (default market)")
+    command.add_argument("--sell", action="store_true")
+    command.set_defaults(handler=trade_command)
+
+    args = parser.parse_args(argv)
+
+    METRICS.enable(args.profile)
+    args.handler(args)
+    if args.profile:
+        METRICS.export(path / "metrics.json")
 
-tickers["best"] = best
 
-# Save the results to a json file
-save_results(tickers, file_name="results.json")
+if __name__ == "__main__":
+    main()
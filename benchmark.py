@@ -0,0 +1,412 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import pathlib
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+from BarCache import BAR_SECONDS
+from BarSeries import BarSeries
+from BarStore import BarStore
+from Bootstrap import Bootstrap
+from Portfolio import Portfolio
+from FakeAlpaca import FakeREST
+from TradingAlgorithms import (
+    INDICATORS,
+    BollingerBands,
+    MeanReversion,
+    SimpleMovingAverage,
+    StrategyPipeline,
+)
+
+# Static vars
+SIZES = [252, 10_000, 100_000, 1_000_000]  # Bars per simulate benchmark
+SWEEP_SIZES = [252, 10_000]  # Bars per get_best_settings benchmark
+GRIDS = {
+    "small": (range(1, 10), range(-10, 10)),
+    "medium": (range(1, 30), range(-10, 10)),
+    "large": (range(1, 100), [d / 4 for d in range(-40, 40)]),
+}
+DATA_SPLITS = [0, 4, range(1, 5)]
+PIPELINE_TICKERS = [10, 100]
+BOOTSTRAP_WINDOWS = 100_000  # Random windows per bootstrap benchmark
+PORTFOLIO_TICKERS = [500, 3000]  # Tickers per portfolio benchmark (a year of bars)
+STORE_SIZES = [252 * 390, 10 * 252 * 390]  # Minute bars per data store benchmark
+ORDER_COUNTS = [50, 200]  # Orders per order submission benchmark
+ORDER_LATENCY = 0.01  # Seconds each fake broker call takes
+REPLAY_SIZES = [252, 2520]  # Bars per symbol per replay benchmark
+REPLAY_SYMBOLS = 20
+
+
+def synthetic_prices(size, seed=0, start=100.0, volatility=0.02):
+    """
+    Purpose: Generates a reproducible geometric random walk of closing prices
+    Inputs:
+        - size: The number of prices
+        - seed: Seeds the walk so every run benchmarks the same data
+        - start: The first price
+        - volatility: The standard deviation of each step's return
+    Returns: A float64 array of prices rounded to cents
+    """
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, volatility, size)
+    return np.round(start * np.exp(np.cumsum(steps)), 2)
+
+
+def best_time(function, repeat):
+    """
+    Purpose: Runs a function `repeat` times with its output silenced, starting
+        each run with an empty indicator cache
+    Returns: The fastest run in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        INDICATORS.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_strategies(sizes, repeat):
+    pipeline = StrategyPipeline()
+    for strategy in (SimpleMovingAverage, MeanReversion, BollingerBands):
+        pipeline.add(strategy.__name__, strategy, short=True)
+
+    for size in sizes:
+        prices = synthetic_prices(size).tolist()
+        cases = {
+            "SimpleMovingAverage.simulate": lambda: SimpleMovingAverage.simulate(
+                prices, short=True, log_res=False
+            ),
+            "BollingerBands.simulate": lambda: BollingerBands.simulate(
+                prices, short=True, log_res=False
+            ),
+            "MeanReversion.simulate": lambda: MeanReversion.simulate(
+                prices, short=True, log_res=False
+            ),
+            "StrategyPipeline.run": lambda: pipeline.run(prices),
+        }
+        for name, function in cases.items():
+            yield {"name": name, "bars": size, "seconds": best_time(function, repeat)}
+
+
+def bench_sweeps(sizes, repeat):
+    for size in sizes:
+        prices = synthetic_prices(size).tolist()
+        for grid, (day_range, diff_range) in GRIDS.items():
+            for data_splits in DATA_SPLITS:
+                seconds = best_time(
+                    lambda: MeanReversion.get_best_settings(
+                        prices,
+                        day_range=day_range,
+                        diff_range=diff_range,
+                        data_splits=data_splits,
+                    ),
+                    repeat,
+                )
+                yield {
+                    "name": "MeanReversion.get_best_settings",
+                    "bars": size,
+                    "grid": grid,
+                    "combinations": len(day_range) * len(diff_range),
+                    "data_splits": str(data_splits),
+                    "seconds": seconds,
+                }
+
+            seconds = best_time(
+                lambda: MeanReversion.get_best_settings(
+                    prices, day_range=day_range, diff_range=diff_range, search="halving"
+                ),
+                repeat,
+            )
+            yield {
+                "name": "MeanReversion.get_best_settings",
+                "bars": size,
+                "grid": grid,
+                "combinations": len(day_range) * len(diff_range),
+                "search": "halving",
+                "seconds": seconds,
+            }
+
+
+def bench_bootstrap(sizes, repeat):
+    for size in sizes:
+        prices = synthetic_prices(size)
+        for strategy in (BollingerBands, MeanReversion):
+            seconds = best_time(
+                lambda: Bootstrap.run(strategy, prices, BOOTSTRAP_WINDOWS, short=True),
+                repeat,
+            )
+            yield {
+                "name": f"Bootstrap.run {strategy.__name__}",
+                "bars": size,
+                "windows": BOOTSTRAP_WINDOWS,
+                "seconds": seconds,
+            }
+
+
+def install_fake_alpaca():
+    """
+    Purpose: Points the alpaca_trade_api and local_settings imports at FakeREST
+    """
+    fake_api = types.ModuleType("alpaca_trade_api")
+    fake_api.REST = lambda *args: FakeREST(history=2 * 252)
+    settings = types.ModuleType("local_settings")
+    settings.url = settings.public_key = settings.secret_key = ""
+    sys.modules["alpaca_trade_api"] = fake_api
+    sys.modules.setdefault("local_settings", settings)
+
+
+@contextlib.contextmanager
+def fake_clock(seconds):
+    """
+    Purpose: Shows BarCache a fixed wall clock. FakeREST's latest bar never moves,
+        so against the real clock every cached bar looks stale and is refetched
+    Inputs:
+        seconds: The unix time BarCache reads while the context is open
+    """
+    import BarCache
+
+    real = BarCache.time
+    BarCache.time = types.SimpleNamespace(time=lambda: seconds)
+    try:
+        yield
+    finally:
+        BarCache.time = real
+
+
+def bench_portfolio(ticker_counts, repeat):
+    for count in ticker_counts:
+        rng = np.random.default_rng(0)
+        steps = rng.normal(0, 0.02, (count, 252))
+        prices = np.round(100 * np.exp(np.cumsum(steps, axis=1)), 2)
+        for strategy in (BollingerBands, MeanReversion):
+            seconds = best_time(
+                lambda: Portfolio.backtest(strategy, prices, short=True), repeat
+            )
+            yield {
+                "name": f"Portfolio.backtest {strategy.__name__}",
+                "tickers": count,
+                "bars": 252,
+                "seconds": seconds,
+            }
+
+
+def bench_pipeline(ticker_counts, repeat):
+    """
+    Purpose: Times the analyze.py fetch, save and simulate flow against a fake
+        Alpaca client in a scratch directory
+    """
+    install_fake_alpaca()
+    # Half way through the bar after FakeREST's last daily bar, so the cold run's
+    # bars count as fresh and the warm run is served from the bar cache
+    clock = FakeREST().now + 1.5 * BAR_SECONDS["day"]
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            (pathlib.Path(scratch) / "data").mkdir()
+            import analyze
+
+            def run(symbols, cold):
+                if cold:
+                    for path in pathlib.Path("cache").glob("*.npz"):
+                        path.unlink()
+                    shutil.rmtree("results", ignore_errors=True)
+                analyze.run_serial({symbol: {} for symbol in symbols})
+
+            for count in ticker_counts:
+                symbols = [f"SYM{i}" for i in range(count)]
+                for cold in (True, False):
+                    with fake_clock(clock):
+                        seconds = best_time(lambda: run(symbols, cold), repeat)
+                    yield {
+                        "name": "analyze.run_serial",
+                        "tickers": count,
+                        "bars": analyze.YEAR_OF_STOCKS,
+                        "cache": "cold" if cold else "warm",
+                        "seconds": seconds,
+                    }
+        finally:
+            os.chdir(cwd)
+
+
+def bench_store(sizes, repeat):
+    """
+    Purpose: Times appending minute bars to a BarStore in a scratch directory and
+        reading them back into the closing prices' sum
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        store = BarStore(scratch)
+        for size in sizes:
+            prices = synthetic_prices(size)
+            times = np.arange(size) * 60
+            bars = BarSeries(times, *[prices] * 5)
+            symbol = f"SYM{size}"
+
+            def append():
+                for path in pathlib.Path(scratch).glob(f"{symbol}/*/*.bin"):
+                    path.unlink()
+                store.append(symbol, "minute", bars)
+
+            cases = {
+                "BarStore.append": append,
+                "BarStore.read": lambda: store.read(symbol, "minute").c.sum(),
+            }
+            for name, function in cases.items():
+                seconds = best_time(function, repeat)
+                yield {"name": name, "bars": size, "seconds": seconds}
+
+
+def bench_orders(order_counts, repeat):
+    """
+    Purpose: Times submitting limit orders one at a time against submitting them
+        as a batch, with every fake broker call taking ORDER_LATENCY seconds
+    """
+    install_fake_alpaca()
+    from AlpacaTrade import AlpacaTrade
+
+    from PortfolioBook import PortfolioBook
+
+    AlpacaTrade.api = FakeREST(history=252, latency=ORDER_LATENCY, equity=1e12)
+    AlpacaTrade.book = PortfolioBook()
+    try:
+        for count in order_counts:
+            orders = [
+                {"symbol": f"SYM{i}", "shares": 1, "price": 1000.0}
+                for i in range(count)
+            ]
+            cases = {
+                "AlpacaTrade.trade_limit": lambda: [
+                    AlpacaTrade.trade_limit(**order) for order in orders
+                ],
+                "AlpacaTrade.submit_batch": lambda: AlpacaTrade.submit_batch(
+                    orders, rate=float("inf")
+                ),
+            }
+            for name, function in cases.items():
+                yield {
+                    "name": name,
+                    "orders": count,
+                    "latency": ORDER_LATENCY,
+                    "seconds": best_time(function, repeat),
+                }
+    finally:
+        AlpacaTrade.api = None
+        AlpacaTrade.book = PortfolioBook()
+        AlpacaTrade.invalidate_account()
+
+
+def bench_replay(sizes, repeat):
+    """
+    Purpose: Times replaying stored bars of REPLAY_SYMBOLS symbols through the
+        strategy engines and the order path as fast as possible
+    """
+    install_fake_alpaca()
+    from Replay import Replay
+
+    with tempfile.TemporaryDirectory() as scratch:
+        store = BarStore(scratch)
+        for size in sizes:
+            symbols = [f"SYM{i}_{size}" for i in range(REPLAY_SYMBOLS)]
+            for seed, symbol in enumerate(symbols):
+                prices = synthetic_prices(size, seed)
+                times = np.arange(size) * 86400
+                store.append(symbol, "day", BarSeries(times, *[prices] * 5))
+
+            for batch in (False, True):
+                replay = Replay(
+                    store, symbols, batch=batch, broker=FakeREST(equity=1e12)
+                )
+                yield {
+                    "name": "Replay.run",
+                    "bars": size,
+                    "symbols": REPLAY_SYMBOLS,
+                    "batch": batch,
+                    "seconds": best_time(replay.run, repeat),
+                }
+
+
+def compare(results, baseline_file, threshold):
+    """
+    Purpose: Prints every benchmark that got more than `threshold` times slower
+        than in a previous results file
+    Returns: The number of regressions found
+    """
+    with open(baseline_file) as in_file:
+        baseline = json.load(in_file)
+
+    def key(result):
+        return tuple(sorted((k, v) for k, v in result.items() if k != "seconds"))
+
+    previous = {key(result): result["seconds"] for result in baseline["results"]}
+    regressions = 0
+    for result in results:
+        before = previous.get(key(result))
+        if before and result["seconds"] > before * threshold:
+            regressions += 1
+            print(
+                f"REGRESSION {result['name']} {key(result)}:",
+                f"{before:.4f}s -> {result['seconds']:.4f}s",
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--sweep-sizes", type=int, nargs="+", default=SWEEP_SIZES)
+    parser.add_argument(
+        "--portfolio-tickers", type=int, nargs="+", default=PORTFOLIO_TICKERS
+    )
+    parser.add_argument("--tickers", type=int, nargs="+", default=PIPELINE_TICKERS)
+    parser.add_argument("--store-sizes", type=int, nargs="+", default=STORE_SIZES)
+    parser.add_argument("--replay-sizes", type=int, nargs="+", default=REPLAY_SIZES)
+    parser.add_argument("--orders", type=int, nargs="+", default=ORDER_COUNTS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="A previous output file to check against")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = []
+    for suite in (
+        bench_strategies(args.sizes, args.repeat),
+        bench_sweeps(args.sweep_sizes, args.repeat),
+        bench_bootstrap(args.sweep_sizes, args.repeat),
+        bench_portfolio(args.portfolio_tickers, args.repeat),
+        bench_pipeline(args.tickers, args.repeat),
+        bench_store(args.store_sizes, args.repeat),
+        bench_orders(args.orders, args.repeat),
+        bench_replay(args.replay_sizes, args.repeat),
+    ):
+        for result in suite:
+            results.append(result)
+            print(json.dumps(result))
+
+    with open(args.output, "w") as out_file:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "timestamp": time.time(),
+                "results": results,
+            },
+            out_file,
+            indent=2,
+        )
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
@@ -0,0 +1,34 @@
+import pathlib
+import sys
+
+import pytest
+
+# The modules live at the top of the repo rather than in a package
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import AlpacaTrade as alpaca_trade  # noqa: E402
+from AlpacaTrade import AlpacaTrade  # noqa: E402
+from BarCache import BarCache  # noqa: E402
+from FakeAlpaca import FakeREST  # noqa: E402
+from PortfolioBook import PortfolioBook  # noqa: E402
+
+
+@pytest.fixture
+def broker(tmp_path, monkeypatch):
+    """
+    Purpose: Points AlpacaTrade at a FakeREST with a new book and an empty bar
+        cache, putting the shared client back afterwards. Call it with
+        FakeREST's arguments.
+    """
+    monkeypatch.setattr(alpaca_trade, "BAR_CACHE", BarCache(tmp_path / "cache"))
+    saved = AlpacaTrade.api, AlpacaTrade.book
+
+    def install(**kwargs):
+        AlpacaTrade.api = FakeREST(**kwargs)
+        AlpacaTrade.book = PortfolioBook()
+        AlpacaTrade.invalidate_account()
+        return AlpacaTrade.api
+
+    yield install
+    AlpacaTrade.api, AlpacaTrade.book = saved
+    AlpacaTrade.invalidate_account()
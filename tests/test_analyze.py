@@ -0,0 +1,94 @@
+import pytest
+
+import analyze
+from BarCache import BAR_SECONDS
+from BarStore import BarStore
+from Metrics import METRICS
+from ResultStore import ResultStore
+
+DAY = BAR_SECONDS["day"]
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """
+    Purpose: Runs analyze.main with every command's handler replaced by one that
+        records the arguments it was given
+    """
+    calls = []
+    for name in ["fetch", "backtest", "run", "sweep", "trade"]:
+        monkeypatch.setattr(analyze, f"{name}_command", calls.append)
+    monkeypatch.setattr(METRICS, "export", lambda file_name: None)
+
+    def parse(*argv):
+        analyze.main(list(argv))
+        METRICS.enable(False)
+        return calls.pop()
+
+    return parse
+
+
+@pytest.mark.parametrize("command", ["backtest", "run"])
+def test_options_are_taken_before_or_after_the_command(parsed, command):
+    args = parsed(command, "--workers", "4", "--profile", "AAPL")
+    assert (args.workers, args.profile, args.tickers) == (4, True, ["AAPL"])
+
+    args = parsed("--workers", "3", "--profile", command)
+    assert (args.workers, args.profile) == (3, True)
+
+    args = parsed(command)
+    assert (args.workers, args.profile) == (analyze.WORKERS, analyze.PROFILE)
+
+
+def test_option_after_the_command_wins(parsed):
+    args = parsed("--workers", "3", "sweep", "AAPL", "--workers", "5")
+    assert args.workers == 5 and not args.profile
+
+
+def test_commands_without_workers_take_profile(parsed, capsys):
+    assert parsed("fetch", "--profile", "SPY").profile
+    assert parsed("trade", "SPY", "1", "--profile").profile
+    with pytest.raises(SystemExit):
+        parsed("trade", "SPY", "1", "--workers", "2")
+    assert "unrecognized arguments: --workers" in capsys.readouterr().err
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    """
+    Purpose: Gives analyze an empty DATA_STORE and RESULT_STORE and counts the
+        store's hits, misses and extensions
+    """
+    monkeypatch.setattr(analyze, "DATA_STORE", BarStore(tmp_path / "data"))
+    monkeypatch.setattr(analyze, "RESULT_STORE", ResultStore(tmp_path / "results"))
+    METRICS.reset()
+    METRICS.enable()
+    yield lambda: {
+        name: count
+        for name, count in METRICS.snapshot()["counters"].items()
+        if name.startswith("ResultStore.")
+    }
+    METRICS.enable(False)
+    METRICS.reset()
+
+
+def test_new_bars_extend_the_last_run(broker, stores, capsys):
+    api = broker(history=400)
+    analyze.run_serial({"AAA": {}, "BBB": {}})
+    assert stores() == {"ResultStore.misses": 6}
+
+    # A day later the fetched year starts a bar later but the stored bars don't
+    api.advance(DAY)
+    METRICS.reset()
+    tickers = {"AAA": {}, "BBB": {}}
+    analyze.run_serial(tickers)
+    assert stores() == {"ResultStore.extended": 6}
+    assert len(analyze.DATA_STORE.read("AAA", "day")) == analyze.YEAR_OF_STOCKS + 1
+
+    # Extended runs give the same results as starting over
+    analyze.RESULT_STORE.directory = analyze.RESULT_STORE.directory.with_name("new")
+    fresh = {"AAA": {}, "BBB": {}}
+    analyze.run_serial(fresh, analyze.load_tickers)
+    for ticker, results in tickers.items():
+        for key, result in results.items():
+            assert result == pytest.approx(fresh[ticker][key])
@@ -0,0 +1,233 @@
+import concurrent.futures
+import datetime
+
+import numpy as np
+import pytest
+
+from AlpacaTrade import AlpacaTrade
+import BarCache as bar_cache
+from BarCache import BAR_SECONDS, BarCache
+from BarSeries import BarSeries
+from FakeAlpaca import FakeREST
+
+DAY = BAR_SECONDS["day"]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Purpose: Replaces the wall clock BarCache reads with one the test sets
+    """
+    now = [0.0]
+    monkeypatch.setattr(bar_cache.time, "time", lambda: now[0])
+    return now
+
+
+def barset_calls(api):
+    return [call for call in api.calls if call[0] == "get_barset"]
+
+
+def after_time(call):
+    return datetime.datetime.fromisoformat(call[4]).timestamp()
+
+
+def test_fresh_cache_makes_no_network_call(tmp_path, clock):
+    api = FakeREST(history=300)
+    cache = BarCache(tmp_path)
+    # Half way through the bar after the last one, which is still forming
+    clock[0] = api.now + 1.5 * DAY
+    bars = cache.refresh(api, "AAA", "day", 100)
+
+    cached = cache.fresh("AAA", "day", 100)
+    assert cached is not None
+    np.testing.assert_array_equal(cached.c, bars.c)
+    assert len(barset_calls(api)) == 1
+
+
+def test_bar_cached_while_forming_is_not_fresh(tmp_path, clock):
+    api = FakeREST(history=300)
+    cache = BarCache(tmp_path)
+    # A morning fetch sees today's bar before it closes
+    clock[0] = api.now + 0.4 * DAY
+    cache.refresh(api, "AAA", "day", 100)
+
+    # An evening run must not be served the morning's values
+    clock[0] = api.now + 0.9 * DAY
+    assert cache.fresh("AAA", "day", 100) is None
+
+
+def test_cache_goes_stale_once_a_newer_bar_can_have_closed(tmp_path, clock):
+    api = FakeREST(history=300)
+    cache = BarCache(tmp_path)
+    clock[0] = api.now + 1.5 * DAY
+    cache.refresh(api, "AAA", "day", 100)
+
+    clock[0] = api.now + 2 * DAY
+    assert cache.fresh("AAA", "day", 100) is None
+
+
+def test_incremental_fetch_starts_at_the_last_cached_bar(tmp_path, clock):
+    api = FakeREST(history=300)
+    cache = BarCache(tmp_path)
+    clock[0] = api.now + 1.5 * DAY
+    cache.refresh(api, "AAA", "day", 100)
+    last = api.now
+
+    api.advance(3 * DAY)
+    clock[0] = api.now + 1.5 * DAY
+    bars = cache.refresh(api, "AAA", "day", 100)
+
+    call = barset_calls(api)[-1]
+    assert call[3] == 100 and last - 1 <= after_time(call) < last
+    full = BarCache.fetch(FakeREST(history=300, now=api.now), ["AAA"], "day", 100)
+    expected = next(full)[1]
+    np.testing.assert_array_equal(bars.t, expected.t)
+    np.testing.assert_array_equal(bars.c, expected.c)
+
+
+def test_refetched_bar_replaces_the_one_cached_while_forming(tmp_path, clock):
+    api = FakeREST(history=300)
+    cache = BarCache(tmp_path)
+    clock[0] = api.now + 0.5 * DAY
+    bars = cache.refresh(api, "AAA", "day", 100)
+
+    # What the bar looked like mid session
+    forming = bars.columns()
+    forming["c"] = forming["c"].copy()
+    forming["c"][-1] += 1
+    cache.save("AAA", "day", type(bars)(*forming.values()))
+
+    clock[0] = api.now + 1.5 * DAY
+    refreshed = cache.refresh(api, "AAA", "day", 100)
+    np.testing.assert_array_equal(refreshed.t, bars.t)
+    np.testing.assert_array_equal(refreshed.c, bars.c)
+
+
+def test_merge_overwrites_bars_with_the_same_time():
+    api = FakeREST(history=10)
+    bars = next(BarCache.fetch(api, ["AAA"], "day", 10))[1]
+    new_bars = bars[-3:].columns()
+    new_bars["c"] = new_bars["c"] + 1
+    merged = BarCache.merge(bars, type(bars)(*new_bars.values()), 10)
+
+    np.testing.assert_array_equal(merged.t, bars.t)
+    np.testing.assert_array_equal(merged.c[:-3], bars.c[:-3])
+    np.testing.assert_array_equal(merged.c[-3:], bars.c[-3:] + 1)
+    assert BarCache.merge(bars, bars[:0], 10) is bars
+
+
+def test_refresh_many_splits_full_and_incremental_requests(tmp_path, clock):
+    api = FakeREST(history=300)
+    cache = BarCache(tmp_path)
+    clock[0] = api.now + 1.5 * DAY
+    list(cache.refresh_many(api, ["AAA", "BBB"], "day", 100))
+
+    api.advance(DAY)
+    clock[0] = api.now + 1.5 * DAY
+    fetched = dict(cache.refresh_many(api, ["AAA", "CCC", "BBB"], "day", 100))
+
+    full, incremental = barset_calls(api)[-2:]
+    assert full[1] == ["CCC"] and full[4] is None
+    assert incremental[1] == ["AAA", "BBB"] and incremental[4] is not None
+    assert all(len(bars) == 100 for bars in fetched.values())
+
+
+def test_eviction_removes_the_least_recently_used_files(tmp_path):
+    api = FakeREST(history=300)
+    cache = BarCache(tmp_path)
+    for symbol, bars in BarCache.fetch(api, ["AAA", "BBB", "CCC"], "day", 300):
+        cache.save(symbol, "day", bars)
+    size = cache.path("AAA", "day").stat().st_size
+
+    cache.max_bytes = 2.5 * size
+    cache.load("AAA", "day")
+    cache.save("DDD", "day", bars)
+
+    assert not cache.path("BBB", "day").exists()
+    assert not cache.path("CCC", "day").exists()
+    assert cache.path("AAA", "day").exists() and cache.path("DDD", "day").exists()
+    assert cache.total_bytes == sum(path.stat().st_size for path in tmp_path.iterdir())
+
+
+def test_saves_under_budget_do_not_scan_the_directory(tmp_path, monkeypatch):
+    api = FakeREST(history=50)
+    cache = BarCache(tmp_path)
+    scans = []
+    original = cache.__files__
+    monkeypatch.setattr(cache, "__files__", lambda: scans.append(1) or original())
+
+    for symbol, bars in BarCache.fetch(api, [f"S{i}" for i in range(20)], "day", 50):
+        cache.save(symbol, "day", bars)
+    assert len(scans) == 1
+
+
+def test_saves_from_several_threads_do_not_collide(tmp_path):
+    api = FakeREST(history=300)
+    cache = BarCache(tmp_path)
+    _, bars = next(BarCache.fetch(api, ["AAA"], "day", 300))
+
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        saves = [pool.submit(cache.save, "AAA", "day", bars) for _ in range(64)]
+        for save in saves:
+            save.result()
+
+    assert [path.name for path in tmp_path.iterdir()] == ["AAA_day.npz"]
+    assert cache.total_bytes == cache.path("AAA", "day").stat().st_size
+
+
+def stream(api, symbols, start, end, page_size):
+    """
+    Purpose: Joins the blocks fetch_range yields into one BarSeries per symbol
+    """
+    blocks = {symbol: [] for symbol in symbols}
+    for symbol, bars in BarCache.fetch_range(
+        api, symbols, "day", start, end, page_size
+    ):
+        assert len(bars) <= page_size
+        blocks[symbol].append(bars)
+    return {
+        symbol: BarSeries.concatenate(series) if series else BarSeries()
+        for symbol, series in blocks.items()
+    }
+
+
+@pytest.mark.parametrize("page_size", [2, 3, 7, 100])
+@pytest.mark.parametrize(
+    "start_offset, end_offset",
+    # In days from the 10th bar and from the last bar, on and between bar times
+    [(0, 0), (-0.5, -0.5), (0.5, 3), (-1, -12)],
+)
+def test_fetch_range_yields_every_bar_once(page_size, start_offset, end_offset):
+    api = FakeREST(history=60)
+    symbols = ["AAA", "BBB"]
+    times = np.array([bar["t"] for bar in api.bars("AAA", "day")])
+    start = int(times[9] + start_offset * DAY)
+    end = int(times[-1] + end_offset * DAY)
+
+    streamed = stream(api, symbols, start, end, page_size)
+    for symbol in symbols:
+        every = BarSeries.from_raw(api.bars(symbol, "day"))
+        expected = every[(every.t > start) & (every.t <= end)]
+        np.testing.assert_array_equal(streamed[symbol].t, expected.t)
+        np.testing.assert_array_equal(streamed[symbol].c, expected.c)
+    # Each window holds at most page_size - 1 bar steps
+    assert len(barset_calls(api)) == -(-(end - start) // ((page_size - 1) * DAY))
+
+
+def test_fetch_range_of_an_empty_span_asks_for_nothing():
+    api = FakeREST(history=10)
+    assert stream(api, ["AAA"], api.now, api.now, 5)["AAA"].t.tolist() == []
+    assert barset_calls(api) == []
+
+
+def test_stream_historical_data_pages_through_the_client(broker):
+    api = broker(history=40)
+    start, end = api.now - 30 * DAY, api.now
+    blocks = list(
+        AlpacaTrade.stream_historical_data("AAA", start, end, "day", page_size=4)
+    )
+
+    assert len(blocks) == 10
+    every = BarSeries.from_raw(api.bars("AAA", "day"))
+    streamed = BarSeries.concatenate(blocks)
+    np.testing.assert_array_equal(streamed.t, every.t[-30:])
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from BarSeries import COLUMNS, BarSeries
+from BarStore import COLUMN_TYPES, BarStore
+
+DAY = 24 * 60 * 60
+
+
+def daily_bars(closes, first_day=0):
+    times = (first_day + np.arange(len(closes))) * DAY
+    closes = np.asarray(closes, dtype=np.float64)
+    return BarSeries(times, closes, closes + 1, closes - 1, closes, closes * 10)
+
+
+def test_append_replaces_a_bar_stored_while_forming(tmp_path):
+    store = BarStore(tmp_path)
+    assert store.append("AAA", "day", daily_bars([1, 2.0])) == 2
+    assert store.append("AAA", "day", daily_bars([1, 2.5, 3])) == 3
+
+    bars = store.read("AAA", "day")
+    np.testing.assert_array_equal(bars.c, [1, 2.5, 3])
+    np.testing.assert_array_equal(bars.t, np.arange(3) * DAY)
+    np.testing.assert_array_equal(bars.h, [2, 3.5, 4])
+
+
+def test_append_keeps_the_bars_before_the_new_ones(tmp_path):
+    store = BarStore(tmp_path)
+    store.append("AAA", "day", daily_bars([1, 2, 3, 4]))
+    store.append("AAA", "day", daily_bars([3.5, 4.5, 5], first_day=2))
+
+    np.testing.assert_array_equal(store.read("AAA", "day").c, [1, 2, 3.5, 4.5, 5])
+
+
+def test_append_recovers_from_one_that_was_cut_short(tmp_path):
+    store = BarStore(tmp_path)
+    store.append("AAA", "day", daily_bars([1, 2, 3]))
+    # An append that stopped after writing only the first columns of a new bar
+    for column in COLUMNS[:2]:
+        with open(store.path("AAA", "day", column), "ab") as out_file:
+            out_file.write(np.zeros(1, COLUMN_TYPES[column]).tobytes())
+    assert store.length("AAA", "day") == 3
+
+    store.append("AAA", "day", daily_bars([3.5, 4], first_day=2))
+
+    bars = store.read("AAA", "day")
+    np.testing.assert_array_equal(bars.c, [1, 2, 3.5, 4])
+    np.testing.assert_array_equal(bars.o, [1, 2, 3.5, 4])
+    for column in COLUMNS:
+        size = store.path("AAA", "day", column).stat().st_size
+        assert size == 4 * COLUMN_TYPES[column].itemsize
+
+
+def test_read_maps_what_was_appended(tmp_path):
+    store = BarStore(tmp_path)
+    assert len(store.read("AAA", "day")) == 0
+    assert store.append("AAA", "day", daily_bars([])) == 0
+
+    bars = daily_bars([5, 6, 7, 8])
+    store.append("AAA", "day", bars)
+    store.append("BBB", "minute", bars)
+
+    stored = store.read("AAA", "day")
+    assert not stored.c.flags.writeable
+    for column in COLUMNS:
+        np.testing.assert_array_equal(stored[column], bars[column])
+    assert store.length("AAA", "day") == 4
+    assert store.symbols("day") == ["AAA"] and store.symbols("minute") == ["BBB"]
+
+
+def test_append_adds_newer_bars_to_the_end(tmp_path):
+    store = BarStore(tmp_path)
+    store.append("AAA", "day", daily_bars([1, 2]))
+    assert store.append("AAA", "day", daily_bars([3, 4], first_day=2)) == 2
+
+    bars = store.read("AAA", "day")
+    np.testing.assert_array_equal(bars.c, [1, 2, 3, 4])
+    np.testing.assert_array_equal(bars.t, np.arange(4) * DAY)
+
+
+@pytest.mark.parametrize(
+    "start, end, closes",
+    [
+        (None, None, [0, 1, 2, 3, 4, 5]),
+        (2 * DAY, None, [2, 3, 4, 5]),
+        (None, 2 * DAY, [0, 1]),
+        (DAY, 4 * DAY, [1, 2, 3]),
+        # Between bar times
+        (DAY + 1, 4 * DAY - 1, [2, 3]),
+        (-DAY, 10 * DAY, [0, 1, 2, 3, 4, 5]),
+        (3 * DAY, 3 * DAY, []),
+        (7 * DAY, None, []),
+    ],
+)
+def test_read_slices_by_start_and_end(tmp_path, start, end, closes):
+    store = BarStore(tmp_path)
+    store.append("AAA", "day", daily_bars(range(6)))
+
+    bars = store.read("AAA", "day", start=start, end=end)
+    np.testing.assert_array_equal(bars.c, closes)
+    np.testing.assert_array_equal(bars.t, np.asarray(closes, dtype=np.int64) * DAY)
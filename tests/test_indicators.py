@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from TradingAlgorithms import IndicatorCache, TradingAlgorithms
+
+
+def random_prices(count=200, seed=4):
+    steps = np.random.default_rng(seed).normal(0, 0.02, count)
+    return 100 * np.exp(np.cumsum(steps))
+
+
+@pytest.mark.parametrize("days", [1, 2, 5, 20])
+@pytest.mark.parametrize("lag", [0, 1])
+def test_moving_std_matches_numpy(days, lag):
+    prices = random_prices()
+    deviations = TradingAlgorithms.__moving_std__(prices, days, lag)
+
+    expected = [
+        np.std(prices[i - days : i - lag]) if days > lag else 0
+        for i in range(days, len(prices))
+    ]
+    np.testing.assert_allclose(deviations, expected, rtol=1e-7, atol=1e-9)
+
+
+def series(value, size=100):
+    """
+    Purpose: A compute function for IndicatorCache.get that notes when it runs
+    """
+    built = []
+
+    def compute():
+        built.append(value)
+        return np.full(size, value, dtype=np.float64)
+
+    return compute, built
+
+
+def test_cache_hits_return_the_stored_series():
+    cache = IndicatorCache()
+    compute, built = series(1.0)
+    first = cache.get("a", compute)
+    second = cache.get("a", compute)
+
+    assert second is first and built == [1.0]
+    assert not first.flags.writeable
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "entries": 1,
+        "bytes": 800,
+        "max_bytes": cache.max_bytes,
+    }
+
+
+def test_cache_drops_the_least_recently_used_series():
+    # Room for two series of 800 bytes
+    cache = IndicatorCache(max_bytes=1600)
+    cache.get("a", series(1.0)[0])
+    cache.get("b", series(2.0)[0])
+    cache.get("a", series(1.0)[0])
+    cache.get("c", series(3.0)[0])
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.stats()["bytes"] == 1600
+
+    compute, built = series(2.0)
+    cache.get("b", compute)
+    assert built == [2.0]
+    assert list(cache.entries) == ["c", "b"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 4
+
+
+def test_cache_never_goes_over_max_bytes():
+    cache = IndicatorCache(max_bytes=2000)
+    for i in range(20):
+        cache.get(i, series(float(i), size=10 + 10 * (i % 4))[0])
+        assert cache.bytes <= cache.max_bytes
+        assert cache.bytes == sum(size for _, size in cache.entries.values())
+
+    # A series bigger than the whole cache is returned but not kept
+    big = cache.get("big", series(0.0, size=1000)[0])
+    assert len(big) == 1000 and "big" not in cache.entries
+
+
+def test_cache_with_no_room_builds_every_time():
+    cache = IndicatorCache(max_bytes=0)
+    compute, built = series(1.0)
+    for _ in range(3):
+        np.testing.assert_array_equal(cache.get("a", compute), np.ones(100))
+
+    assert built == [1.0] * 3
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 3
+
+
+def test_clear_forgets_the_series_and_counts():
+    cache = IndicatorCache()
+    cache.get("a", series(1.0)[0])
+    cache.get("a", series(1.0)[0])
+    cache.clear()
+
+    stats = cache.stats()
+    counts = ["hits", "misses", "entries", "bytes"]
+    assert [stats[name] for name in counts] == [0, 0, 0, 0]
@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+from AlpacaTrade import AlpacaTrade
+
+
+def resting_buy(symbol, shares=1, price=50.0):
+    # Below the quote of 100 so the order rests and keeps its hold
+    return {"symbol": symbol, "shares": shares, "price": price}
+
+
+def quote(api, *symbols):
+    for symbol in symbols:
+        api.quote(symbol, 100.0)
+
+
+def record_submissions(api, delays=None, fail=()):
+    """
+    Purpose: Wraps the fake broker's submit_order to note when each order
+        arrives, take `delays[symbol]` seconds and raise for symbols in `fail`
+    """
+    arrivals = []
+    submit_order = api.submit_order
+
+    def wrapped(symbol, *args, **kwargs):
+        arrivals.append((symbol, time.perf_counter()))
+        time.sleep((delays or {}).get(symbol, 0))
+        if symbol in fail:
+            raise ConnectionError(f"broker refused {symbol}")
+        return submit_order(symbol, *args, **kwargs)
+
+    api.submit_order = wrapped
+    return arrivals
+
+
+def test_submissions_are_spaced_by_the_rate(broker):
+    api = broker(latency=0.001)
+    arrivals = record_submissions(api)
+    orders = [resting_buy(f"S{i}") for i in range(6)]
+    quote(api, *(order["symbol"] for order in orders))
+
+    confirmations = AlpacaTrade.submit_batch(orders, rate=20)
+    assert all(confirmation["submitted"] for confirmation in confirmations)
+    times = sorted(arrived for _, arrived in arrivals)
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    # Arrivals are timed in the executor's threads, which start a little late
+    assert min(gaps) >= 0.5 / 20
+    assert times[-1] - times[0] >= 0.9 * 5 / 20
+
+
+def test_confirmations_arrive_as_orders_finish(broker):
+    api = broker()
+    record_submissions(api, delays={"SLOW": 0.3})
+    quote(api, "SLOW", "FAST1", "FAST2")
+    orders = [resting_buy("SLOW"), resting_buy("FAST1"), resting_buy("FAST2")]
+
+    confirmations = AlpacaTrade.submit_batch(orders, rate=1000)
+    arrived = [confirmation["order"]["symbol"] for confirmation in confirmations]
+    assert arrived[-1] == "SLOW"
+    assert sorted(arrived) == ["FAST1", "FAST2", "SLOW"]
+    assert all(confirmation["submitted"] for confirmation in confirmations)
+
+
+def test_submit_orders_yields_before_the_batch_is_done(broker):
+    api = broker()
+    record_submissions(api, delays={"SLOW": 0.3})
+    quote(api, "SLOW", "FAST")
+
+    async def first():
+        orders = AlpacaTrade.submit_orders(
+            [resting_buy("SLOW"), resting_buy("FAST")], rate=1000
+        )
+        started = time.perf_counter()
+        confirmation = await orders.__anext__()
+        waited = time.perf_counter() - started
+        await orders.aclose()
+        return confirmation, waited
+
+    confirmation, waited = asyncio.run(first())
+    assert confirmation["order"]["symbol"] == "FAST" and waited < 0.3
+
+
+def test_orders_cancelled_while_submitting_keep_their_holds(broker):
+    api = broker(equity=1000.0)
+    record_submissions(api, delays={"SLOW": 0.2})
+    quote(api, "SLOW")
+    # Marketable, so the broker fills it as soon as it arrives
+    order = {"symbol": "SLOW", "shares": 2, "price": 150.0}
+
+    async def cancel_while_submitting():
+        orders = AlpacaTrade.submit_orders([order], rate=1000)
+        first = asyncio.ensure_future(orders.__anext__())
+        await asyncio.sleep(0.1)
+        first.cancel()
+        try:
+            await first
+        except asyncio.CancelledError:
+            pass
+        await orders.aclose()
+
+    asyncio.run(cancel_while_submitting())
+    # The submission carries on in its thread
+    time.sleep(0.3)
+
+    book = AlpacaTrade.book
+    assert [o.symbol for o in api.orders] == ["SLOW"]
+    assert book.positions["SLOW"] == 2
+    assert book.cash == 1000.0 - 200.0
+    assert not book.holds and book.held_cash == 0
+
+
+def test_failed_checks_leave_nothing_held(broker):
+    api = broker(equity=1000.0, positions={"OWNED": 5})
+    quote(api, "A", "B", "C", "OWNED")
+    orders = [
+        resting_buy("A", shares=10),  # 500 of the 1000
+        resting_buy("B", shares=12),  # 600 more than is left
+        {"symbol": "OWNED", "shares": 6, "price": 1e9, "buy": False},
+        resting_buy("C", shares=8),  # 400, fits
+    ]
+
+    confirmations = AlpacaTrade.submit_batch(orders, rate=1000)
+    submitted = {c["order"]["symbol"]: c["submitted"] for c in confirmations}
+    assert submitted == {"A": True, "B": False, "OWNED": False, "C": True}
+    for confirmation in confirmations:
+        if not confirmation["submitted"]:
+            assert confirmation["response"] is None and confirmation["error"]
+
+    book = AlpacaTrade.book
+    assert book.held_cash == 900.0
+    assert book.held_shares.get("OWNED", 0) == 0
+    assert sorted(hold[0] for hold in book.holds.values()) == ["A", "C"]
+
+
+def test_broker_errors_release_their_holds(broker):
+    api = broker(equity=1000.0)
+    record_submissions(api, fail={"BAD"})
+    quote(api, "BAD", "GOOD", "OTHER")
+    orders = [resting_buy("BAD", shares=10), resting_buy("GOOD", shares=10)]
+
+    confirmations = AlpacaTrade.submit_batch(orders, rate=1000)
+    by_symbol = {c["order"]["symbol"]: c for c in confirmations}
+    assert not by_symbol["BAD"]["submitted"]
+    assert "broker refused BAD" in by_symbol["BAD"]["error"]
+    assert by_symbol["GOOD"]["submitted"]
+
+    book = AlpacaTrade.book
+    assert book.held_cash == 500.0
+    assert [hold[0] for hold in book.holds.values()] == ["GOOD"]
+    # The released cash can be used again
+    assert AlpacaTrade.trade_limit("OTHER", 10, 50.0)
+
+
+def test_market_buys_are_checked_at_the_latest_close(broker):
+    api = broker(equity=1000.0)
+    price = api.bars("M", "minute")[-1]["c"]
+    api.quote("M", price)
+    shares = int(1000 // price)
+
+    confirmations = AlpacaTrade.submit_batch(
+        [{"symbol": "M", "shares": shares}, {"symbol": "M", "shares": shares + 1}],
+        rate=1000,
+    )
+    assert sorted(c["submitted"] for c in confirmations) == [False, True]
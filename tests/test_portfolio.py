@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from Portfolio import Portfolio
+from TradingAlgorithms import BollingerBands, MeanReversion, SimpleMovingAverage
+
+STRATEGIES = [BollingerBands, SimpleMovingAverage, MeanReversion]
+POSITION = 1000.0
+
+
+def price_matrix(tickers, bars=250, seed=9):
+    steps = np.random.default_rng(seed).normal(0, 0.02, (tickers, bars))
+    return 100 * np.exp(np.cumsum(steps, axis=1))
+
+
+def ledger_pnl(strategy, prices, short):
+    """
+    Purpose: What a ticker should make in the portfolio, from its own simulate
+        ledger with every position sized to POSITION
+    Returns: (closed trade profit, open position profit, closed trades)
+    """
+    settings = {"days": 4, "short": short, "log_res": False, "ledger": True}
+    # SimpleMovingAverage has no percent_diff to pass
+    if strategy is not SimpleMovingAverage:
+        settings["percent_diff"] = 1.5
+    trades = strategy.simulate(prices, **settings)[-1]
+    shares = POSITION / trades["entry_price"]
+    closed = trades["exit_index"] >= 0
+    open_pnl = 0.0
+    if len(trades) and not closed[-1]:
+        last = prices[-1]
+        if strategy is MeanReversion:
+            last = round(last, 2)
+        open_pnl = trades["side"][-1] * shares[-1] * (last - trades["entry_price"][-1])
+    return (shares[closed] * trades["profit"][closed]).sum(), open_pnl, closed.sum()
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("short", [False, True])
+def test_unlimited_capital_matches_each_tickers_simulate(strategy, short):
+    prices = price_matrix(6)
+    # More than every ticker holding a position at once needs
+    capital = 2 * len(prices) * POSITION
+    results = Portfolio.backtest(
+        strategy, prices, capital, POSITION, days=4, percent_diff=1.5, short=short
+    )
+
+    assert (results["skipped"] == 0).all()
+    for ticker, row in enumerate(prices):
+        asset_pnl, open_pnl, trades = ledger_pnl(strategy, row, short)
+        assert results["asset_pnl"][ticker] == pytest.approx(asset_pnl)
+        assert results["open_pnl"][ticker] == pytest.approx(open_pnl)
+        assert results["trades"][ticker] == trades
+    total = results["asset_pnl"].sum() + results["open_pnl"].sum()
+    assert results["pnl"] == pytest.approx(total)
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("short", [False, True])
+def test_tight_capital_equity_adds_up(strategy, short):
+    prices = price_matrix(12, seed=10)
+    capital = 3.5 * POSITION
+    results = Portfolio.backtest(
+        strategy, prices, capital, POSITION, days=4, percent_diff=1.5, short=short
+    )
+
+    assert results["skipped"].sum() > 0
+    total = results["asset_pnl"].sum() + results["open_pnl"].sum()
+    assert results["equity"][-1] - capital == pytest.approx(total)
+    assert results["pnl"] == pytest.approx(total)
+    assert results["return_percentage"] == pytest.approx(100 * total / capital)
+
+
+@pytest.mark.parametrize("short", [False, True])
+def test_entries_without_free_cash_are_skipped(short):
+    row = price_matrix(1, seed=11)[0]
+    # Room for one position, and the second ticker always comes second
+    results = Portfolio.backtest(
+        BollingerBands,
+        np.stack([row, row]),
+        POSITION,
+        POSITION,
+        days=4,
+        percent_diff=1.5,
+        short=short,
+    )
+
+    asset_pnl, open_pnl, trades = ledger_pnl(BollingerBands, row, short)
+    assert results["asset_pnl"][0] == pytest.approx(asset_pnl)
+    assert results["open_pnl"][0] == pytest.approx(open_pnl)
+    assert results["trades"].tolist() == [trades, 0]
+    assert results["asset_pnl"][1] == results["open_pnl"][1] == 0
+    assert results["skipped"][0] == 0 and results["skipped"][1] >= trades
+
+
+def test_flat_prices_keep_the_capital():
+    results = Portfolio.backtest(MeanReversion, np.full((3, 50), 20.0), 5000.0)
+    np.testing.assert_array_equal(results["equity"], np.full(50, 5000.0))
+    assert results["pnl"] == 0 and results["trades"].sum() == 0
@@ -0,0 +1,64 @@
+import types
+
+from AlpacaTrade import AlpacaTrade
+from PortfolioBook import PortfolioBook
+
+
+def test_sell_holds_block_overselling(broker):
+    broker(positions={"X": 10})
+    assert AlpacaTrade.trade_limit("X", 10, 1e9, buy=False)
+    assert not AlpacaTrade.trade_limit("X", 10, 1e9, buy=False)
+
+
+def test_reconcile_keeps_holds_of_open_sells(broker):
+    broker(positions={"X": 10})
+    assert AlpacaTrade.trade_limit("X", 10, 1e9, buy=False)
+
+    AlpacaTrade.reconcile()
+    assert AlpacaTrade.book.available_shares("X") == 0
+    assert not AlpacaTrade.trade_limit("X", 10, 1e9, buy=False)
+
+
+def test_reconcile_holds_open_sells_placed_elsewhere(broker):
+    api = broker(positions={"X": 10})
+    api.submit_order("X", 4, "sell", "limit", "day", limit_price=1e9)
+
+    AlpacaTrade.reconcile()
+    assert AlpacaTrade.book.available_shares("X") == 6
+    assert not AlpacaTrade.trade_limit("X", 7, 1e9, buy=False)
+    assert AlpacaTrade.trade_limit("X", 6, 1e9, buy=False)
+
+
+def test_reconcile_releases_filled_sells(broker):
+    api = broker(positions={"X": 10})
+    assert AlpacaTrade.trade_limit("X", 10, 0.01, buy=False)
+    assert api.positions["X"] == 0
+
+    AlpacaTrade.reconcile()
+    assert AlpacaTrade.book.held_shares.get("X", 0) == 0
+    assert AlpacaTrade.book.available_shares("X") == 0
+
+
+def test_reconcile_drops_submitted_buys_and_keeps_pending_ones(broker):
+    api = broker()
+    book = AlpacaTrade.book.ensure(api)
+    submitted = book.hold("X", 10, 100.0)
+    book.submitted(submitted, types.SimpleNamespace(id="1", filled_qty=0))
+    pending = book.hold("Y", 5, 100.0)
+
+    book.reconcile(api)
+    assert list(book.holds) == [pending]
+    assert book.held_cash == 500.0
+
+
+def test_fill_moves_a_hold_into_the_position(broker):
+    api = broker()
+    book = PortfolioBook().ensure(api)
+    hold_id = book.hold("X", 10, 50.0)
+    book.submitted(hold_id, types.SimpleNamespace(id="7", filled_qty=0))
+
+    book.fill("7", 4, 50.0)
+    assert book.positions["X"] == 4
+    assert book.held_cash == 300.0
+    book.fill("7", 6, 50.0)
+    assert book.holds == {} and book.held_cash == 0
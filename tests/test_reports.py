@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from TradingAlgorithms import (
+    TRADE_DTYPE,
+    BollingerBands,
+    MeanReversion,
+    SimpleMovingAverage,
+)
+
+STRATEGIES = [BollingerBands, SimpleMovingAverage, MeanReversion]
+TRADES = np.zeros(0, TRADE_DTYPE)
+
+
+@pytest.fixture
+def prices():
+    steps = np.random.default_rng(5).normal(0, 0.03, 300)
+    return np.round(100 * np.exp(np.cumsum(steps)), 2)
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_simulate_is_silent_without_logging(strategy, prices, capsys):
+    for end in range(250, 300):
+        strategy.simulate(prices[:end], log_buy_sell=False, log_res=False)
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize(
+    "log_buy_sell, log_res, printed",
+    [(False, False, False), (True, False, True), (False, True, True)],
+)
+def test_advice_is_printed_only_when_logging(
+    strategy, log_buy_sell, log_res, printed, capsys
+):
+    strategy.report(10.0, 100.0, "Buy Now", TRADES, log_buy_sell, log_res)
+    assert ("Buy Now" in capsys.readouterr().out) == printed
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import ResultStore as result_store
+from Metrics import METRICS
+from ResultStore import ResultStore
+from TradingAlgorithms import BollingerBands, MeanReversion, StrategyPipeline
+
+
+@pytest.fixture
+def counters():
+    """
+    Purpose: Turns the metrics on so the store's hits and misses are counted
+    """
+    METRICS.reset()
+    METRICS.enable()
+    yield lambda: METRICS.snapshot()["counters"]
+    METRICS.enable(False)
+    METRICS.reset()
+
+
+def pipeline():
+    return (
+        StrategyPipeline()
+        .add("bb", BollingerBands, 5, 2.5)
+        .add("mr", MeanReversion, 4, -1.5, short=True)
+    )
+
+
+def random_prices(count):
+    steps = np.random.default_rng(2).normal(0, 0.02, count)
+    return 100 * np.exp(np.cumsum(steps))
+
+
+def test_repeat_runs_are_read_back(tmp_path, counters):
+    store, prices = ResultStore(tmp_path), random_prices(300)
+    first = store.run("AAA/day", prices, pipeline())
+    second = store.run("AAA/day", prices, pipeline())
+
+    assert counters() == {"ResultStore.misses": 2, "ResultStore.hits": 2}
+    for name, (total_profit, first_buy, advice, _) in first.items():
+        assert second[name][:3] == (total_profit, first_buy, advice)
+
+
+def test_new_bars_extend_the_latest_entry(tmp_path, counters):
+    store, prices = ResultStore(tmp_path), random_prices(300)
+    store.run("AAA/day", prices[:250], pipeline())
+    extended = store.run("AAA/day", prices, pipeline())
+
+    assert counters()["ResultStore.extended"] == 2
+    expected = pipeline().run(prices)
+    for name, (total_profit, first_buy, advice, _) in expected.items():
+        assert extended[name][0] == pytest.approx(total_profit)
+        assert extended[name][1:3] == (first_buy, advice)
+
+
+def test_entries_of_older_code_are_not_read_back(tmp_path, counters, monkeypatch):
+    store, prices = ResultStore(tmp_path), random_prices(300)
+    store.run("AAA/day", prices[:250], pipeline())
+    store.run("AAA/day", prices, pipeline())
+    key = ResultStore.digest(("x",), prices)
+
+    monkeypatch.setattr(result_store, "RESULT_VERSION", "changed")
+    assert ResultStore.digest(("x",), prices) != key
+    METRICS.reset()
+    store.run("AAA/day", prices, pipeline())
+    store.run("AAA/day", prices[:250], pipeline())
+    assert counters() == {"ResultStore.misses": 4}
@@ -0,0 +1,424 @@
+import copy
+
+import numpy as np
+import pytest
+
+from Bootstrap import Bootstrap
+from TradingAlgorithms import (
+    ENGINES,
+    BollingerBands,
+    MeanReversion,
+    SimpleMovingAverage,
+    TradingAlgorithms,
+)
+
+DIFFS = [-10, -2.5, -0.5, 0, 0.25, 1.5, 5]
+SHORTS = [False, True]
+
+
+class Reference:
+    """
+    Purpose: The original per-bar loops of the strategies, with the logging taken
+        out and the advice returned instead of printed. The NumPy kernels, engines
+        and sweeps must give the same results.
+    """
+
+    @staticmethod
+    def bollinger_bands(prices, days=5, percent_diff=5, short=False):
+        i = 0
+        sell, buy = None, None
+        total_profit = 0
+        first_buy = None
+        advice = None
+        diff = percent_diff * 0.01
+        for price in prices:
+            if i >= days:
+                moving_average = sum(prices[i - days : i - 1]) / days
+                if price > moving_average * (1 - diff) and not buy:
+                    if i == len(prices) - 1:
+                        advice = "You should buy this stock today"
+                    else:
+                        if sell:
+                            total_profit += sell - price
+                            sell = None
+                        else:
+                            buy = price
+
+                        if not first_buy:
+                            first_buy = price
+                elif price < moving_average * (1 + diff):
+                    if buy:
+                        if i == len(prices) - 1:
+                            advice = "You should sell this stock today"
+                        else:
+                            total_profit += price - buy
+                            buy = None
+                    elif short and not sell:
+                        if i == len(prices) - 1:
+                            advice = "You should short sell this stock today"
+                        else:
+                            sell = price
+            i += 1
+
+        final_percentage = (total_profit / first_buy) * 100 if first_buy else 0
+        return (total_profit, final_percentage, final_percentage), advice
+
+    @staticmethod
+    def simple_moving_average(prices, days=5, short=False):
+        i = 0
+        sell, buy = None, None
+        total_profit = 0
+        first_buy = None
+        advice = None
+        for price in prices:
+            if i >= days:
+                moving_average = sum(prices[i - days : i - 1]) / days
+                if price > moving_average and not buy:
+                    if i == len(prices) - 1:
+                        advice = "You should buy this stock today"
+                    else:
+                        if sell:
+                            total_profit += sell - price
+                            sell = None
+                        else:
+                            buy = price
+
+                        if not first_buy:
+                            first_buy = price
+                elif price < moving_average:
+                    if buy:
+                        if i == len(prices) - 1:
+                            advice = "You should sell this stock today"
+                        else:
+                            total_profit += price - buy
+                            buy = None
+                    elif short and not sell:
+                        if i == len(prices) - 1:
+                            advice = "You should short sell this stock today"
+                        else:
+                            sell = price
+            i += 1
+
+        final_percentage = (total_profit / first_buy) * 100 if first_buy else 0
+        return (total_profit, final_percentage, final_percentage), advice
+
+    @staticmethod
+    def mean_reversion(prices, days=5, percent_diff=5, short=False):
+        working_list = []
+        prev_avg = 0
+        profit = 0
+        sell, buy = None, None
+        first_buy = None
+        advice = None
+        diff = percent_diff * 0.01
+
+        i = 0
+        for price in prices:
+            curr_price = round(price, 2)
+            prev_avg = TradingAlgorithms.__list_avg__(working_list)
+
+            if len(working_list) == days:
+                if curr_price > prev_avg * (1 + diff):
+                    if buy:
+                        if i == len(prices) - 1:
+                            advice = "You should sell this stock today"
+                        else:
+                            profit += curr_price - buy
+                            buy = None
+                    elif short and not sell:
+                        if i == len(prices) - 1:
+                            advice = "You should short sell this stock today"
+                        else:
+                            sell = curr_price
+
+                elif curr_price < prev_avg * (1 - diff):
+                    if i == len(prices) - 1:
+                        advice = "You should buy this stock today"
+                    else:
+                        if short and sell:
+                            profit += sell - curr_price
+                            if not first_buy:
+                                first_buy = curr_price
+                            sell = None
+
+                        elif not buy:
+                            buy = curr_price
+                            if not first_buy:
+                                first_buy = curr_price
+
+            working_list.append(curr_price)
+            if len(working_list) > days:
+                working_list.pop(0)
+
+            i += 1
+
+        return_percentage = 100 * profit / first_buy if first_buy else 0
+        return (profit, return_percentage, first_buy), advice
+
+    @staticmethod
+    def get_best_settings(
+        prices,
+        num_best=5,
+        day_range=range(1, 10),
+        diff_range=range(-10, 10),
+        data_splits=0,
+        combine_results=True,
+        extra_label="",
+    ):
+        def get_best_for_range(
+            prices=prices, day_range=day_range, diff_range=diff_range, extra_label=""
+        ):
+            best_days_dict = {}
+            for days in day_range:
+                for diff in diff_range:
+                    (
+                        total_profit,
+                        final_percentage,
+                        starting_price,
+                    ), _ = Reference.mean_reversion(
+                        prices, days=days, percent_diff=diff
+                    )
+
+                    best_days_dict[f"{days}_days_{diff}_diff{extra_label}"] = {
+                        "total_profit": total_profit,
+                        "percent_gain": final_percentage,
+                        "mvg_avg_days": days,
+                        "percent_diff": diff,
+                        "starting_price": starting_price,
+                        "data_points": 1,
+                    }
+
+            return best_days_dict
+
+        def _combine_results(best_days1, best_days2):
+            best_days = copy.deepcopy(best_days1)
+            for day in best_days:
+                best_days[day]["total_profit"] += best_days2[day]["total_profit"]
+                best_days[day]["data_points"] += best_days2[day]["data_points"]
+                best_days[day]["percent_gain"] += best_days2[day]["percent_gain"]
+            return best_days
+
+        if type(data_splits) == range or type(data_splits) == list:
+            for num in data_splits:
+                ex_label = (
+                    extra_label + str(num) if not combine_results else extra_label
+                )
+                bd = Reference.get_best_settings(
+                    prices=prices,
+                    num_best=-1,
+                    day_range=day_range,
+                    diff_range=diff_range,
+                    data_splits=num,
+                    extra_label=ex_label,
+                    combine_results=combine_results,
+                )
+                if data_splits[0] == num:
+                    best_days = bd
+                elif not combine_results:
+                    best_days.update(bd)
+                else:
+                    best_days = _combine_results(best_days, bd)
+
+            for day in best_days:
+                best_days[day]["total_profit"] /= len(data_splits)
+                best_days[day]["percent_gain"] /= len(data_splits)
+
+        else:
+            assert data_splits >= 0
+            length = len(prices) // (data_splits + 1)
+            best_days = get_best_for_range(
+                prices[0 : length - 1], extra_label=extra_label
+            )
+            for i in range(1, data_splits):
+                ex_label = extra_label + str(i) if not combine_results else extra_label
+
+                if i + 1 == data_splits:
+                    bd = get_best_for_range(prices[i * length :], extra_label=ex_label)
+                else:
+                    bd = get_best_for_range(
+                        prices[i * length : (i + 1) * length - 1], extra_label=ex_label
+                    )
+
+                if combine_results:
+                    best_days = _combine_results(best_days, bd)
+                else:
+                    best_days.update(bd)
+
+        if num_best == -1:
+            return best_days
+
+        best_days_list = []
+        for day in best_days:
+            best_days_list.append(best_days[day])
+
+        return sorted(
+            best_days_list, reverse=True, key=lambda day: day["total_profit"]
+        )[:num_best]
+
+
+# Each strategy with its reference and whether it takes a percent_diff
+STRATEGIES = [
+    (BollingerBands, Reference.bollinger_bands, True),
+    (SimpleMovingAverage, Reference.simple_moving_average, False),
+    (MeanReversion, Reference.mean_reversion, True),
+]
+
+
+def random_prices(seed, count=300):
+    steps = np.random.default_rng(seed).normal(0, 0.02, count)
+    return (100 * np.exp(np.cumsum(steps))).tolist()
+
+
+def settings(takes_diff, days, percent_diff, short):
+    if takes_diff:
+        return {"days": days, "percent_diff": percent_diff, "short": short}
+    return {"days": days, "short": short}
+
+
+def assert_results_equal(results, expected):
+    assert len(results) == len(expected)
+    for value, expected_value in zip(results, expected):
+        if expected_value is None:
+            assert value is None
+        else:
+            assert value == pytest.approx(expected_value, rel=1e-9, abs=1e-9)
+
+
+def assert_settings_equal(best, expected):
+    assert len(best) == len(expected)
+    for row, expected_row in zip(best, expected):
+        assert row.keys() == expected_row.keys()
+        for key, value in expected_row.items():
+            if value is None:
+                assert row[key] is None
+            else:
+                assert row[key] == pytest.approx(value, rel=1e-9, abs=1e-9), key
+
+
+@pytest.mark.parametrize("strategy, reference, takes_diff", STRATEGIES)
+@pytest.mark.parametrize("short", SHORTS)
+@pytest.mark.parametrize("seed", range(3))
+def test_kernels_match_the_loops(strategy, reference, takes_diff, short, seed):
+    prices = random_prices(seed)
+    for days in (1, 2, 5, 13):
+        for percent_diff in DIFFS if takes_diff else [0]:
+            kwargs = settings(takes_diff, days, percent_diff, short)
+            expected, advice = reference(prices, **kwargs)
+            results = strategy.simulate(prices, log_res=False, **kwargs)
+            assert_results_equal(results, expected)
+            assert strategy.__kernel__(prices, **kwargs)[2] == advice
+
+
+@pytest.mark.parametrize("strategy, reference, takes_diff", STRATEGIES)
+@pytest.mark.parametrize("short", SHORTS)
+def test_engines_match_simulate(strategy, reference, takes_diff, short):
+    prices = random_prices(7)
+    for days in (1, 3, 8):
+        for percent_diff in [-2.5, 0.5, 3] if takes_diff else [0]:
+            kwargs = settings(takes_diff, days, percent_diff, short)
+            engine = ENGINES[strategy.SPEC](**kwargs)
+            for end, price in enumerate(prices, 1):
+                engine.update(price)
+                # Check the whole run now and then, not on every bar
+                if end % 37 == 0 or end == len(prices):
+                    expected, advice = reference(prices[:end], **kwargs)
+                    assert_results_equal(engine.results(), expected)
+                    assert engine.advice() == advice
+            assert_results_equal(
+                engine.results(), strategy.simulate(prices, log_res=False, **kwargs)
+            )
+
+
+@pytest.mark.parametrize(
+    "data_splits", [0, 1, 3, [2, 4], [0, 1, 2], range(1, 4), range(2, 5, 2)]
+)
+@pytest.mark.parametrize("combine_results", [True, False])
+def test_get_best_settings_matches_the_loops(data_splits, combine_results):
+    prices = random_prices(11, 240)
+    kwargs = {
+        "day_range": range(1, 7),
+        "diff_range": [-3, -0.5, 0, 0.75, 2.5],
+        "data_splits": data_splits,
+        "combine_results": combine_results,
+        "extra_label": "_x",
+    }
+
+    expected = Reference.get_best_settings(prices, num_best=-1, **kwargs)
+    best = MeanReversion.get_best_settings(prices, num_best=-1, **kwargs)
+    assert list(best) == list(expected)
+    assert_settings_equal(list(best.values()), list(expected.values()))
+
+    expected = Reference.get_best_settings(prices, num_best=5, **kwargs)
+    best = MeanReversion.get_best_settings(prices, num_best=5, **kwargs)
+    assert_settings_equal(best, expected)
+
+
+@pytest.mark.parametrize("short", SHORTS)
+def test_sweep_matches_the_loops(short):
+    prices = random_prices(13)
+    day_range, diff_range = range(1, 8), [-4, -1.5, 0, 0.5, 3]
+    rows = MeanReversion.sweep(prices, day_range, diff_range, short)
+
+    row = 0
+    for days in day_range:
+        for diff in diff_range:
+            (profit, gain, first_buy), _ = Reference.mean_reversion(
+                prices, days, diff, short
+            )
+            assert rows["mvg_avg_days"][row] == days
+            assert rows["percent_diff"][row] == diff
+            assert rows["total_profit"][row] == pytest.approx(profit, abs=1e-9)
+            assert rows["percent_gain"][row] == pytest.approx(gain, abs=1e-9)
+            if first_buy is None:
+                assert np.isnan(rows["starting_price"][row])
+            else:
+                assert rows["starting_price"][row] == first_buy
+            row += 1
+
+
+@pytest.mark.parametrize("strategy, reference, takes_diff", STRATEGIES)
+@pytest.mark.parametrize("short", SHORTS)
+def test_bootstrap_windows_match_simulate_on_the_slice(
+    strategy, reference, takes_diff, short
+):
+    prices = random_prices(17, 400)
+    starts, ends = TradingAlgorithms.random_day_ranges(len(prices), 200, 2, seed=3)
+    for percent_diff in [-1.5, 0.5] if takes_diff else [0]:
+        profit, return_percentage = Bootstrap.evaluate(
+            strategy, prices, starts, ends, 4, percent_diff, short
+        )
+        kwargs = settings(takes_diff, 4, percent_diff, short)
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            (expected_profit, expected_return, _), _ = reference(
+                prices[start:end], **kwargs
+            )
+            assert profit[i] == pytest.approx(expected_profit, abs=1e-9)
+            assert return_percentage[i] == pytest.approx(expected_return, abs=1e-9)
+
+
+@pytest.mark.parametrize(
+    "count, num_best",
+    # Too few bars to halve, and too few settings to halve
+    [(60, 5), (400, 61)],
+)
+def test_halving_search_without_rounds_is_the_exhaustive_search(count, num_best):
+    prices = random_prices(19, count)
+    expected = MeanReversion.get_best_settings(prices, num_best)
+    assert_settings_equal(MeanReversion.halving_search(prices, num_best), expected)
+    assert_settings_equal(
+        MeanReversion.get_best_settings(prices, num_best, search="halving"), expected
+    )
+
+
+def test_halving_search_keeps_exhaustive_records_and_spreads_over_workers():
+    prices = random_prices(23, 3000)
+    settings = (range(1, 15), range(-10, 10))
+    best = MeanReversion.halving_search(prices, 5, *settings)
+    assert len(best) == 5
+    assert best == sorted(best, key=lambda row: -row["total_profit"])
+
+    every = MeanReversion.get_best_settings(prices, -1, *settings)
+    keys = [f"{r['mvg_avg_days']}_days_{r['percent_diff']}_diff" for r in best]
+    assert_settings_equal(best, [every[key] for key in keys])
+
+    assert MeanReversion.halving_search(prices, 5, *settings, workers=2) == best
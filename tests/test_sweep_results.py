@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from SweepResults import SweepResults
+from TradingAlgorithms import BEST_DTYPE, MeanReversion
+
+ROWS_PER_APPEND = 37
+
+
+def tied_rows(count, seed=8):
+    """
+    Purpose: BEST_DTYPE rows whose profits only take a few values, so most
+        rows tie with rows appended (and spilled) in other chunks, in no
+        particular row order
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.zeros(count, BEST_DTYPE)
+    rows["row"] = rng.permutation(count)
+    rows["total_profit"] = rng.integers(-3, 4, count) * 0.5
+    rows["percent_gain"] = rng.normal(size=count)
+    return rows
+
+
+def fill(table, rows):
+    for start in range(0, len(rows), ROWS_PER_APPEND):
+        table.append(rows[start : start + ROWS_PER_APPEND])
+    return table
+
+
+def expected_top(rows, count):
+    return rows[np.lexsort((rows["row"], -rows["total_profit"]))][:count]
+
+
+@pytest.mark.parametrize("count", [0, 1, 5, 36, 37, 38, 200, 1000])
+def test_spilled_tables_rank_like_in_memory_ones(tmp_path, count):
+    rows = tied_rows(500)
+    spilled = fill(SweepResults(BEST_DTYPE, max_bytes=1, directory=tmp_path), rows)
+    in_memory = fill(SweepResults(BEST_DTYPE), rows)
+
+    # Every append went straight to its own file
+    assert len(spilled.files) == -(-len(rows) // ROWS_PER_APPEND)
+    assert not in_memory.files
+    assert len(spilled) == len(in_memory) == len(rows)
+
+    top = spilled.top(count, "total_profit", "row")
+    np.testing.assert_array_equal(top, in_memory.top(count, "total_profit", "row"))
+    np.testing.assert_array_equal(top, expected_top(rows, count))
+    np.testing.assert_array_equal(spilled.to_array(), rows)
+    np.testing.assert_array_equal(in_memory.to_array(), rows)
+
+
+def test_ties_without_a_tiebreak_keep_the_append_order():
+    rows = tied_rows(300)
+    spilled = fill(SweepResults(BEST_DTYPE, max_bytes=1), rows)
+
+    order = np.lexsort((np.arange(len(rows)), -rows["total_profit"]))
+    np.testing.assert_array_equal(spilled.top(50, "total_profit"), rows[order][:50])
+
+
+def test_filter_streams_through_the_spills():
+    rows = tied_rows(300)
+    spilled = fill(SweepResults(BEST_DTYPE, max_bytes=1), rows)
+
+    matches = spilled.filter(lambda chunk: chunk["total_profit"] > 0)
+    np.testing.assert_array_equal(matches.to_array(), rows[rows["total_profit"] > 0])
+    assert matches.max_bytes == 1
+
+
+def test_appended_rows_are_copied():
+    table = SweepResults(BEST_DTYPE)
+    rows = tied_rows(10)
+    table.append(rows)
+    rows["total_profit"] = 100
+    assert (table.to_array()["total_profit"] < 100).all()
+
+
+@pytest.mark.parametrize("data_splits", [0, 2, [1, 3]])
+@pytest.mark.parametrize("combine_results", [True, False])
+def test_sweep_results_spill_without_changing_the_ranking(
+    data_splits, combine_results
+):
+    steps = np.random.default_rng(6).normal(0, 0.02, 300)
+    prices = 100 * np.exp(np.cumsum(steps))
+    settings = (range(1, 8), [-2, -0.5, 0, 0.5, 2], data_splits, combine_results)
+
+    spilled, labels = MeanReversion.sweep_results(prices, *settings, max_bytes=1)
+    in_memory, memory_labels = MeanReversion.sweep_results(prices, *settings)
+
+    assert spilled.files and not in_memory.files and labels == memory_labels
+    np.testing.assert_array_equal(spilled.to_array(), in_memory.to_array())
+    for count in (1, 10, len(in_memory)):
+        np.testing.assert_array_equal(
+            spilled.top(count, "total_profit", "row"),
+            in_memory.top(count, "total_profit", "row"),
+        )